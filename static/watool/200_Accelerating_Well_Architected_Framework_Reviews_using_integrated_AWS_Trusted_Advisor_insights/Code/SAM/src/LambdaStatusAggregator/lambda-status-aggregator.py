@@ -0,0 +1,215 @@
+import boto3
+import logging
+import os
+import time
+import threading
+import concurrent.futures
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from datetime import datetime, timezone
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# AWS clients are created on first use (see get_client)
+aws_clients = {}
+aws_clients_lock = threading.Lock()
+ddb_serializer = TypeSerializer()
+ddb_deserializer = TypeDeserializer()
+
+######################################
+# Uncomment below for running on AWS Lambda
+######################################
+# DDB table of the workload remediation status summaries
+STATUS_TABLE = os.environ['STATUS_TABLE']
+
+# Concurrent summary refreshes of a batch of stream records
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '8'))
+
+# Sort keys of the status table. Each open ticket has one member entry per summary it counts in, ordered by creationDate so the
+# oldest open ticket of a summary is the first member entry of its prefix.
+WORKLOAD_SUMMARY_KEY = 'summary'
+PILLAR_SUMMARY_KEY_PREFIX = 'summary#'
+WORKLOAD_MEMBER_KEY_PREFIX = 'open#'
+PILLAR_MEMBER_KEY_PREFIX = 'pillaropen#'
+
+# Maximum number of items per DDB BatchWriteItem call, and retries of unprocessed items
+DDB_BATCH_WRITE_SIZE = 25
+DDB_BATCH_MAX_RETRIES = int(os.environ.get('DDB_BATCH_MAX_RETRIES', '8'))
+
+######################################
+
+# Function to return the client of an AWS service, created on first use
+def get_client(service):
+    if service not in aws_clients:
+        with aws_clients_lock:
+            if service not in aws_clients:
+                aws_clients[service] = boto3.client(service)
+    return aws_clients[service]
+
+# Function to run a function for each arguments tuple in a bounded thread pool. Results keep the order of the arguments.
+def run_concurrently(function, arguments_list):
+    if MAX_WORKERS <= 1 or len(arguments_list) <= 1:
+        return [function(*arguments) for arguments in arguments_list]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(arguments_list))) as executor:
+        return list(executor.map(lambda arguments: function(*arguments), arguments_list))
+
+# Functions to convert an item between its python and its DDB low-level client representation
+def ddb_serialize(item):
+    return {key: ddb_serializer.serialize(value) for key, value in item.items()}
+
+def ddb_deserialize(item):
+    return {key: ddb_deserializer.deserialize(value) for key, value in item.items()}
+
+# Function to return the sort keys of the summary and of the member entries of a ticket for a pillar (or the whole workload if None)
+def get_summary_key(pillarId):
+    return WORKLOAD_SUMMARY_KEY if pillarId == None else PILLAR_SUMMARY_KEY_PREFIX + pillarId
+
+def get_member_key_prefix(pillarId):
+    return WORKLOAD_MEMBER_KEY_PREFIX if pillarId == None else PILLAR_MEMBER_KEY_PREFIX + pillarId + '#'
+
+# Function to return the date of the last change of a ticket in a stream record. Removed tickets (resolved) use the time of the
+# stream record, as the ticket entry only holds the dates of its creation and of its last update.
+def get_record_change_date(record, ticket):
+    if record['eventName'] == 'REMOVE':
+        return datetime.fromtimestamp(float(record['dynamodb']['ApproximateCreationDateTime']), timezone.utc).isoformat()
+    return max(ticket['creationDate'], ticket.get('updateDate') or '')
+
+# Function to write the member entries of a batch (items to put, or None to delete the entry) with BatchWriteItem, retrying
+# unprocessed items with backoff
+def ddb_write_members(member_writes):
+    requests = []
+    for (workloadId, summaryKey), item in member_writes.items():
+        if item == None:
+            requests.append({'DeleteRequest': {'Key': ddb_serialize({'workloadId': workloadId, 'summaryKey': summaryKey})}})
+        else:
+            requests.append({'PutRequest': {'Item': ddb_serialize(item)}})
+
+    for i in range(0, len(requests), DDB_BATCH_WRITE_SIZE):
+        request_items = {STATUS_TABLE: requests[i:i + DDB_BATCH_WRITE_SIZE]}
+        retries = 0
+        while request_items:
+            batch_write_item_response = get_client('dynamodb').batch_write_item(RequestItems=request_items)
+            request_items = batch_write_item_response.get('UnprocessedItems')
+            if request_items:
+                retries += 1
+                if retries > DDB_BATCH_MAX_RETRIES:
+                    raise Exception(f'Unable to write {len(request_items[STATUS_TABLE])} member entries after {DDB_BATCH_MAX_RETRIES} retries')
+                logger.info(f'Retrying {len(request_items[STATUS_TABLE])} unprocessed member entries')
+                time.sleep(min(0.05 * 2 ** retries, 5))
+
+# Function to count the open tickets of a summary and return it with the creationDate of the oldest one (None if there is none)
+def ddb_query_members(workloadId, pillarId):
+    query_kwargs = {
+        'TableName': STATUS_TABLE,
+        'KeyConditionExpression': 'workloadId = :w AND begins_with(summaryKey, :p)',
+        'ExpressionAttributeValues': ddb_serialize({':w': workloadId, ':p': get_member_key_prefix(pillarId)}),
+        'ProjectionExpression': 'creationDate'
+    }
+    oldest_response = get_client('dynamodb').query(Limit=1, **query_kwargs)
+    if not oldest_response['Items']:
+        return 0, None
+    oldestCreationDate = ddb_deserialize(oldest_response['Items'][0])['creationDate']
+
+    query_kwargs['Select'] = 'COUNT'
+    del query_kwargs['ProjectionExpression']
+    count = 0
+    while True:
+        query_response = get_client('dynamodb').query(**query_kwargs)
+        count += query_response['Count']
+        if 'LastEvaluatedKey' not in query_response:
+            return count, oldestCreationDate
+        query_kwargs['ExclusiveStartKey'] = query_response['LastEvaluatedKey']
+
+# Function to rebuild a summary from its member entries. The summary is recomputed rather than incremented so that stream records
+# delivered again after a failed batch do not skew it, and so that the oldest creationDate is known after the oldest ticket is resolved.
+def refresh_summary(workloadId, pillarId, summary):
+    openTickets, oldestCreationDate = ddb_query_members(workloadId, pillarId)
+    key = ddb_serialize({'workloadId': workloadId, 'summaryKey': get_summary_key(pillarId)})
+
+    update_expression = 'SET openTickets = :o, workloadName = :n'
+    expression_values = {':o': openTickets, ':n': summary['workloadName']}
+    if pillarId != None:
+        update_expression += ', pillarId = :p'
+        expression_values[':p'] = pillarId
+    if oldestCreationDate == None:
+        update_expression += ' REMOVE oldestCreationDate'
+    else:
+        update_expression += ', oldestCreationDate = :c'
+        expression_values[':c'] = oldestCreationDate
+    get_client('dynamodb').update_item(
+        TableName=STATUS_TABLE,
+        Key=key,
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=ddb_serialize(expression_values)
+    )
+
+    # Records of a batch retried after a failure may be older than the last update already recorded
+    try:
+        get_client('dynamodb').update_item(
+            TableName=STATUS_TABLE,
+            Key=key,
+            UpdateExpression='SET lastUpdateDate = :d',
+            ConditionExpression='attribute_not_exists(lastUpdateDate) OR lastUpdateDate < :d',
+            ExpressionAttributeValues=ddb_serialize({':d': summary['lastUpdateDate']})
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        pass
+    logger.info(f'Summary {get_summary_key(pillarId)} of workload {workloadId}: {openTickets} open tickets, oldest created {oldestCreationDate}')
+
+# Function to refresh a summary, logging errors instead of raising them. Returns whether it succeeded.
+def refresh_summary_logging_errors(workloadId, pillarId, summary):
+    try:
+        refresh_summary(workloadId, pillarId, summary)
+    except Exception as e:
+        logger.error(f'Failed to refresh summary {get_summary_key(pillarId)} of workload {workloadId}: {e}')
+        return False
+    return True
+
+def lambda_handler(event, context):
+    # Latest member entry write per key (a ticket created and resolved in the same batch ends deleted) and summaries to refresh
+    member_writes = {}
+    summaries = {}
+    for record in event['Records']:
+        image = record['dynamodb'].get('OldImage' if record['eventName'] == 'REMOVE' else 'NewImage')
+        if not image:
+            continue
+        ticket = ddb_deserialize(image)
+        # State entries (TA check state, open ticket counters, reconciliation checkpoint) are not tickets
+        if 'ticketType' not in ticket:
+            continue
+
+        workloadId = ticket['workloadId']
+        change_date = get_record_change_date(record, ticket)
+        for pillarId in [None, ticket['pillarId']]:
+            summaryKey = get_member_key_prefix(pillarId) + ticket['creationDate'] + '#' + ticket['ticketHeaderKey']
+            if record['eventName'] == 'REMOVE':
+                member_writes[(workloadId, summaryKey)] = None
+            else:
+                member_writes[(workloadId, summaryKey)] = {
+                    'workloadId': workloadId,
+                    'summaryKey': summaryKey,
+                    'creationDate': ticket['creationDate'],
+                    'ticketId': ticket['ticketId'],
+                    'ticketType': ticket['ticketType'],
+                    'bestPracticeId': ticket['bestPracticeId']
+                }
+
+            summary = summaries.setdefault((workloadId, pillarId), {
+                'workloadName': ticket['workloadName'],
+                'lastUpdateDate': change_date,
+                'sequenceNumber': record['dynamodb']['SequenceNumber']
+            })
+            summary['lastUpdateDate'] = max(summary['lastUpdateDate'], change_date)
+
+    logger.info(f'{len(event["Records"])} stream records: {len(member_writes)} member entries to write, {len(summaries)} summaries to refresh')
+    # A failed write fails the whole batch, the member entries are idempotent
+    ddb_write_members(member_writes)
+
+    summary_keys = list(summaries.keys())
+    results = run_concurrently(refresh_summary_logging_errors, [(workloadId, pillarId, summaries[(workloadId, pillarId)]) for workloadId, pillarId in summary_keys])
+
+    # The batch is retried from the first record of the failed summaries
+    failed_sequence_numbers = [summaries[summary_key]['sequenceNumber'] for summary_key, succeeded in zip(summary_keys, results) if not succeeded]
+    if failed_sequence_numbers:
+        return {'batchItemFailures': [{'itemIdentifier': min(failed_sequence_numbers, key=int)}]}
+    return {'batchItemFailures': []}
@@ -1,14 +1,23 @@
 import boto3
+import botocore.exceptions
 import logging
 import os
 import json
-from boto3.dynamodb.conditions import Key
+import time
+import random
+import threading
+import functools
+import concurrent.futures
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from botocore.config import Config
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-wa_client = boto3.client('wellarchitected')
-dynamodb_resource = boto3.resource('dynamodb')
-sns_client = boto3.client('sns')
+# AWS clients are created on first use (see get_client)
+aws_clients = {}
+aws_clients_lock = threading.Lock()
+ddb_serializer = TypeSerializer()
+ddb_deserializer = TypeDeserializer()
 
 ######################################
 # Uncomment below for running on AWS Lambda
@@ -18,7 +27,7 @@ OPS_CENTER_INTEGRATION = (os.environ['OPS_CENTER_INTEGRATION'] == 'True')
 JIRA_INTEGRATION = (os.environ['JIRA_INTEGRATION'] == 'True')
 
 # DDB
-DDB_TABLE = dynamodb_resource.Table(os.environ['DDB_TABLE'])
+DDB_TABLE = os.environ['DDB_TABLE']
 
 # Update BP in WA Tool and Create Milestone automatically on/off
 AUTO_BP_MILESTONE_UPDATER = (os.environ['AUTO_BP_MILESTONE_UPDATER'] == 'True')
@@ -26,28 +35,491 @@ AUTO_BP_MILESTONE_UPDATER = (os.environ['AUTO_BP_MILESTONE_UPDATER'] == 'True')
 # SNS
 TOPIC_WORKLOAD_BP_UPDATE = os.environ['TOPIC_WORKLOAD_BP_UPDATE']
 
+# Concurrent DDB lookups of the tickets resolved in a batch
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '8'))
+
+# Sort key of the DDB entries that record state instead of a ticket (e.g. open ticket counters)
+STATE_ENTRY_SORT_KEY = 'state'
+
+# DDB BatchGetItem size limit and retries of unprocessed keys
+DDB_BATCH_GET_SIZE = 100
+DDB_BATCH_MAX_RETRIES = int(os.environ.get('DDB_BATCH_MAX_RETRIES', '8'))
+
+# Maximum length of a WA Tool milestone name
+MILESTONE_NAME_MAX_LENGTH = 100
+
+# Prefix of the keys of the DDB entries recording the metadata of a question in a lens version (see the tracker)
+LENS_METADATA_KEY_PREFIX = 'lensmetadata#'
+
+# Key of the DDB entry recording the migration of the ticket entries recorded before the open ticket counters existed (see the tracker)
+TICKET_ENTRIES_MIGRATION_KEY = 'migration#ticketentries'
+
+# Client-side rate limits (calls per second) per service. The rate of a service is halved on each throttling error and recovers
+# on successful calls. Throttled calls, and calls failing with a transient error, are retried up to API_MAX_RETRIES times.
+# A rate of 0 does not limit the calls to the service.
+WELLARCHITECTED_API_RATE = float(os.environ.get('WELLARCHITECTED_API_RATE', '5'))
+SNS_API_RATE = float(os.environ.get('SNS_API_RATE', '10'))
+API_MAX_RETRIES = int(os.environ.get('API_MAX_RETRIES', '5'))
+
+# Error codes of the AWS APIs that mean the call was throttled
+THROTTLING_ERROR_CODES = ['Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException', 'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown']
+
+# botocore configuration of the clients of the rate limited services: botocore does not retry their calls, call_api does, so that
+# a throttled call is retried at most API_MAX_RETRIES times and every attempt goes through the rate limiter
+RATE_LIMITED_CLIENT_CONFIG = Config(retries={'max_attempts': 0, 'mode': 'standard'})
+
+# CloudWatch Embedded Metric Format (EMF) output of the stage durations, AWS API calls and cache hits of each invocation on/off.
+# When off, the stage functions are not wrapped and no metric is collected.
+EMBEDDED_METRICS = (os.environ.get('EMBEDDED_METRICS', 'True') == 'True')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'WALab')
+
 ######################################
 
+# Class of a client-side token bucket limiting the rate of the calls to a service.
+# The rate is halved on each throttling error (down to a tenth of the configured rate) and increases back on successful calls.
+# A throttling error also pauses every call to the service for the backoff delay of the retry.
+class RateLimiter:
+    __slots__ = ('maxRate', 'rate', 'tokens', 'updatedAt', 'pausedUntil', 'lock', 'calls', 'throttles', 'waitTime')
+
+    def __init__(self, rate):
+        self.maxRate = rate
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.updatedAt = time.monotonic()
+        self.pausedUntil = 0.0
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttles = 0
+        self.waitTime = 0.0
+
+    # Waits for a token. A rate of 0 or less does not limit the calls, only the pauses apply.
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.maxRate <= 0:
+                    self.tokens = 1.0
+                else:
+                    self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updatedAt) * self.rate)
+                self.updatedAt = now
+                if now >= self.pausedUntil and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    return
+                wait = self.pausedUntil - now if self.maxRate <= 0 else max(self.pausedUntil - now, (1 - self.tokens) / self.rate)
+                self.waitTime += wait
+            time.sleep(wait)
+
+    def throttled(self, delay):
+        with self.lock:
+            self.throttles += 1
+            self.rate = max(self.maxRate / 10, self.rate / 2)
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + delay)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.maxRate, self.rate + self.maxRate / 20)
+
+    # Returns the metrics since the previous call and resets them
+    def pop_metrics(self):
+        with self.lock:
+            metrics = {'calls': self.calls, 'throttles': self.throttles, 'waitTime': round(self.waitTime, 3), 'rate': round(self.rate, 2)}
+            self.calls = 0
+            self.throttles = 0
+            self.waitTime = 0.0
+        return metrics
+
+# Class collecting the metrics of an invocation from the threads resolving the BPs of a batch: calls and duration of each stage,
+# AWS API calls and botocore retries per service, hits and misses of each cache.
+class InvocationMetrics:
+    __slots__ = ('lock', 'stages', 'apiCalls', 'cacheLookups')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.apiCalls = {}
+        self.cacheLookups = {}
+
+    def add_stage_time(self, stage, seconds):
+        with self.lock:
+            stage_metrics = self.stages.setdefault(stage, [0, 0.0])
+            stage_metrics[0] += 1
+            stage_metrics[1] += seconds
+
+    def add_api_call(self, service, retries):
+        with self.lock:
+            api_metrics = self.apiCalls.setdefault(service, [0, 0])
+            api_metrics[0] += 1
+            api_metrics[1] += retries
+
+    def add_cache_lookups(self, cache, hits, misses):
+        with self.lock:
+            cache_metrics = self.cacheLookups.setdefault(cache, [0, 0])
+            cache_metrics[0] += hits
+            cache_metrics[1] += misses
+
+    # Returns the metrics since the previous call and resets them
+    def pop_metrics(self):
+        with self.lock:
+            metrics = (self.stages, self.apiCalls, self.cacheLookups)
+            self.stages = {}
+            self.apiCalls = {}
+            self.cacheLookups = {}
+        return metrics
+
+# Rate limiter per service, kept across warm invocations
+rate_limiters = {
+    'wellarchitected': RateLimiter(WELLARCHITECTED_API_RATE),
+    'sns': RateLimiter(SNS_API_RATE)
+}
+
+# Metrics of the current invocation (see log_invocation_metrics)
+invocation_metrics = InvocationMetrics()
+
+# Lens metadata entries indexed by (lensAlias, lensVersion, questionId), kept for the lifetime of the warm container
+lens_metadata_cache = {}
+
+# Whether the tracker completed the migration of the ticket entries, kept for the lifetime of the warm container once it did
+ticket_entries_migration = {'completed': False}
+
+# Function to return the client of an AWS service, created on first use
+def get_client(service):
+    if service not in aws_clients:
+        with aws_clients_lock:
+            if service not in aws_clients:
+                aws_clients[service] = instrument_client(boto3.client(service, config=RATE_LIMITED_CLIENT_CONFIG if service in rate_limiters else None))
+    return aws_clients[service]
+
+# Function to return whether an AWS API call was throttled
+def is_throttling_error(error):
+    error_response = getattr(error, 'response', None)
+    return isinstance(error_response, dict) and error_response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+# Function to return whether an AWS API call failed with a transient error (connection error, or server error) that botocore
+# would have retried
+def is_transient_error(error):
+    if isinstance(error, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return True
+    error_response = getattr(error, 'response', None)
+    return isinstance(error_response, dict) and error_response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+# Function to call an API within the rate limit of its service. Throttled calls slow down the service rate limiter and are retried
+# with exponential backoff and jitter. Calls failing with a transient error are retried with the same backoff, without slowing down
+# the rate limiter.
+def call_api(service, function, *args, **kwargs):
+    rate_limiter = rate_limiters[service]
+    for attempt in range(API_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            response = function(*args, **kwargs)
+        except Exception as e:
+            throttled = is_throttling_error(e)
+            if (not throttled and not is_transient_error(e)) or attempt == API_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(20, 0.5 * 2 ** attempt))
+            if throttled:
+                logger.info(f'{service} call throttled. Retrying in {delay:.2f} seconds')
+                rate_limiter.throttled(delay)
+            else:
+                logger.info(f'{service} call failed with a transient error. Retrying in {delay:.2f} seconds. Exception: {e}')
+                time.sleep(delay)
+            continue
+        rate_limiter.succeeded()
+        return response
+
+# Decorator timing each call of a pipeline stage function. The function is returned unchanged when EMBEDDED_METRICS is off.
+def timed_stage(function):
+    if not EMBEDDED_METRICS:
+        return function
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            invocation_metrics.add_stage_time(function.__name__, time.perf_counter() - start)
+    return timed_function
+
+# Function to record the hits and misses of a cache
+def record_cache_lookups(cache, hits, misses):
+    if EMBEDDED_METRICS:
+        invocation_metrics.add_cache_lookups(cache, hits, misses)
+
+# botocore 'after-call' event handler counting the calls of an AWS client and the retries botocore made for them
+def count_api_call(model, parsed, **kwargs):
+    invocation_metrics.add_api_call(model.service_model.service_name, parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+# Function to count the calls of a new AWS client in the invocation metrics
+def instrument_client(client):
+    if EMBEDDED_METRICS:
+        client.meta.events.register('after-call', count_api_call)
+    return client
+
+# Function to build an EMF document of metrics ({name: (value, unit)}) sharing the same dimensions
+def get_emf_document(dimensions, metrics):
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in metrics.items()]
+            }]
+        }
+    }
+    document.update(dimensions)
+    document.update({name: value for name, (value, unit) in metrics.items()})
+    return document
+
+# Function to log the metrics of the invocation and reset them. The calls, throttling errors and time spent waiting for each rate
+# limiter are always logged. With EMBEDDED_METRICS on, every metric is also printed as an EMF document per stage, AWS service and cache,
+# the rate limiter metrics being added to the documents of the rate limited services.
+def log_invocation_metrics():
+    rate_limiter_metrics = {service: rate_limiter.pop_metrics() for service, rate_limiter in rate_limiters.items()}
+    logger.info('Rate limiter metrics: ' + json.dumps(rate_limiter_metrics))
+    if not EMBEDDED_METRICS:
+        return
+
+    stages, api_calls, cache_lookups = invocation_metrics.pop_metrics()
+    function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+    documents = []
+    for stage, (calls, seconds) in stages.items():
+        documents.append(get_emf_document({'FunctionName': function_name, 'Stage': stage}, {
+            'StageCalls': (calls, 'Count'),
+            'StageDuration': (round(seconds * 1000, 3), 'Milliseconds')
+        }))
+
+    for service, (calls, retries) in sorted(api_calls.items()):
+        metrics = {'ApiCalls': (calls, 'Count'), 'ApiRetries': (retries, 'Count')}
+        if service in rate_limiter_metrics:
+            metrics['ApiThrottles'] = (rate_limiter_metrics[service]['throttles'], 'Count')
+            metrics['RateLimiterWaitTime'] = (rate_limiter_metrics[service]['waitTime'], 'Seconds')
+        documents.append(get_emf_document({'FunctionName': function_name, 'Service': service}, metrics))
+
+    for cache, (hits, misses) in cache_lookups.items():
+        metrics = {'CacheHits': (hits, 'Count'), 'CacheMisses': (misses, 'Count')}
+        if hits + misses:
+            metrics['CacheHitRate'] = (round(100.0 * hits / (hits + misses), 2), 'Percent')
+        documents.append(get_emf_document({'FunctionName': function_name, 'Cache': cache}, metrics))
+
+    # EMF documents must be log events of their own, not formatted by the logger
+    for document in documents:
+        print(json.dumps(document))
+
+# Function to run a function for each arguments tuple in a bounded thread pool. Results keep the order of the arguments.
+def run_concurrently(function, arguments_list):
+    if MAX_WORKERS <= 1 or len(arguments_list) <= 1:
+        return [function(*arguments) for arguments in arguments_list]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(arguments_list))) as executor:
+        return list(executor.map(lambda arguments: function(*arguments), arguments_list))
+
+# Functions to convert an item between its python and its DDB low-level client representation
+def ddb_serialize(item):
+    return {key: ddb_serializer.serialize(value) for key, value in item.items()}
+
+def ddb_deserialize(item):
+    return {key: ddb_deserializer.deserialize(value) for key, value in item.items()}
+
 # Function to query the dynamodb table based on global index 'ticketId-index' or 'bestPracticeId-index'
+@timed_stage
 def ddb_query_entries(indexName, queryKey):
-    response = DDB_TABLE.query(
+    response = get_client('dynamodb').query(
+        TableName=DDB_TABLE,
         IndexName=indexName,
-        KeyConditionExpression=Key(indexName.split('-')[0]).eq(queryKey)
+        KeyConditionExpression='#k = :k',
+        ExpressionAttributeNames={'#k': indexName.split('-')[0]},
+        ExpressionAttributeValues={':k': {'S': queryKey}}
     )
-    return response['Items']
-
-# Function to delete an entry in the dynamodb table
-def delete_entry(ticketHeaderKey, creationDate):
-    response = DDB_TABLE.delete_item(
-        Key={
-            'ticketHeaderKey': ticketHeaderKey,
-            'creationDate': creationDate
-        }
+    return [ddb_deserialize(item) for item in response['Items']]
+
+# Function to read entries by primary key from the dynamodb table with BatchGetItem (100 keys per call), retrying unprocessed keys with backoff
+def ddb_batch_get_entries(keys):
+    items = []
+
+    for i in range(0, len(keys), DDB_BATCH_GET_SIZE):
+        request_items = {DDB_TABLE: {'Keys': [ddb_serialize(key) for key in keys[i:i + DDB_BATCH_GET_SIZE]]}}
+        retries = 0
+        while request_items:
+            response = get_client('dynamodb').batch_get_item(RequestItems=request_items)
+            items += [ddb_deserialize(item) for item in response['Responses'].get(DDB_TABLE, [])]
+            request_items = response.get('UnprocessedKeys')
+            if request_items:
+                retries += 1
+                if retries > DDB_BATCH_MAX_RETRIES:
+                    raise Exception(f'Unable to read {len(request_items[DDB_TABLE]["Keys"])} entries from DDB after {DDB_BATCH_MAX_RETRIES} retries')
+                time.sleep(min(0.05 * 2 ** retries, 5))
+
+    return items
+
+# Function to count the entries of the open tickets of a BP in a workload lens question. 'bestPracticeId-index' only projects the
+# entry keys, so the entries of the BP in every workload, lens and question are read with BatchGetItem to keep the matching ones.
+# Only used until the ticket entries are migrated by the tracker.
+def ddb_count_open_tickets(workloadId, lensAlias, questionId, bestPracticeId):
+    query_kwargs = {
+        'TableName': DDB_TABLE,
+        'IndexName': 'bestPracticeId-index',
+        'KeyConditionExpression': 'bestPracticeId = :k',
+        'ExpressionAttributeValues': {':k': {'S': bestPracticeId}},
+        'ProjectionExpression': 'ticketHeaderKey, creationDate'
+    }
+    keys = []
+    while True:
+        response = get_client('dynamodb').query(**query_kwargs)
+        keys += [ddb_deserialize(item) for item in response['Items']]
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return len([item for item in ddb_batch_get_entries(keys) if (item['workloadId'], item['lensAlias'], item['questionId']) == (workloadId, lensAlias, questionId)])
+
+# Function to return whether the tracker completed the migration of the ticket entries, after which every ticket recorded counts in
+# the counter of its BP
+def is_ticket_entries_migration_completed():
+    if not ticket_entries_migration['completed']:
+        get_item_response = get_client('dynamodb').get_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize({'ticketHeaderKey': TICKET_ENTRIES_MIGRATION_KEY, 'creationDate': STATE_ENTRY_SORT_KEY})
+        )
+        ticket_entries_migration['completed'] = 'completedAt' in ddb_deserialize(get_item_response.get('Item', {}))
+    return ticket_entries_migration['completed']
+
+# Function to return the key of the DDB entry counting the open tickets of a BP in a workload lens question (see the tracker)
+def get_open_tickets_counter_key(workloadId, lensAlias, questionId, bestPracticeId):
+    return {'ticketHeaderKey': 'opentickets#' + workloadId + '#' + lensAlias + '#' + questionId + '#' + bestPracticeId, 'creationDate': STATE_ENTRY_SORT_KEY}
+
+# Function to return the pointer entry of a ticket entry (see the tracker), which holds the creationDate of the ticket entry
+def get_ticket_pointer(entry):
+    return {'ticketHeaderKey': entry['ticketHeaderKey'], 'creationDate': STATE_ENTRY_SORT_KEY, 'ticketCreationDate': entry['creationDate']}
+
+# Function to delete the entry of a ticket, unless it was already deleted (e.g. the resolution was delivered twice). Returns whether it was deleted.
+# The pointer of the entry is deleted with it, unless it already points to a newer entry of the ticket.
+def ddb_delete_entry_if_exists(entry):
+    try:
+        get_client('dynamodb').delete_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize({'ticketHeaderKey': entry['ticketHeaderKey'], 'creationDate': entry['creationDate']}),
+            ConditionExpression='attribute_exists(ticketHeaderKey)'
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        return False
+
+    try:
+        get_client('dynamodb').delete_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize({'ticketHeaderKey': entry['ticketHeaderKey'], 'creationDate': STATE_ENTRY_SORT_KEY}),
+            ConditionExpression='ticketCreationDate = :c',
+            ExpressionAttributeValues=ddb_serialize({':c': entry['creationDate']})
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        pass
+    return True
+
+# Function to decrement the open ticket counter of a BP by the number of tickets resolved. Returns the tickets still open, or None
+# if the BP has no counter (its tickets were all recorded before the counters existed).
+def ddb_decrement_open_tickets(bp, resolvedTickets):
+    try:
+        update_item_response = get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize(get_open_tickets_counter_key(*bp)),
+            UpdateExpression='ADD openTickets :d',
+            ConditionExpression='openTickets >= :n',
+            ExpressionAttributeValues=ddb_serialize({':d': -resolvedTickets, ':n': resolvedTickets}),
+            ReturnValues='UPDATED_NEW'
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        return None
+    return int(ddb_deserialize(update_item_response['Attributes'])['openTickets'])
+
+# Function to set the open ticket counter of a BP to the number of its entries left, when the counter is missing or lower than the number
+# of tickets resolved (see ddb_decrement_open_tickets). Returns whether the counter was set: a counter changed concurrently is left as is.
+def ddb_seed_open_tickets(bp, resolvedTickets, openTickets):
+    try:
+        get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize(get_open_tickets_counter_key(*bp)),
+            UpdateExpression='SET openTickets = :o',
+            ConditionExpression='attribute_not_exists(openTickets) OR openTickets < :n',
+            ExpressionAttributeValues=ddb_serialize({':o': openTickets, ':n': resolvedTickets})
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+# Function to record again the entries of resolved tickets (and their count in the BP counter) when their processing failed,
+# so that the retried messages find them again
+def ddb_restore_entries(bp, entries, counted):
+    for entry in entries:
+        get_client('dynamodb').put_item(TableName=DDB_TABLE, Item=ddb_serialize(entry))
+        get_client('dynamodb').put_item(TableName=DDB_TABLE, Item=ddb_serialize(get_ticket_pointer(entry)))
+    if counted:
+        get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize(get_open_tickets_counter_key(*bp)),
+            UpdateExpression='ADD openTickets :d',
+            ExpressionAttributeValues=ddb_serialize({':d': len(entries)})
+        )
+
+# Function to delete the entries of the tickets resolved for a BP and decrement its open ticket counter by the number deleted.
+# Only the invocation whose update brings the counter to 0 sees every ticket of the BP resolved, even with concurrent resolutions.
+# Returns the tickets deleted (tickets already deleted are left out), the tickets still open and whether the counter accounts for the deletion.
+@timed_stage
+def resolve_bp_tickets(bp, bp_tickets):
+    resolved_tickets = {ticketId: bp_ticket for ticketId, bp_ticket in bp_tickets.items() if ddb_delete_entry_if_exists(bp_ticket[0])}
+    if not resolved_tickets:
+        return resolved_tickets, None, False
+
+    try:
+        openTickets = ddb_decrement_open_tickets(bp, len(resolved_tickets))
+        if openTickets != None:
+            record_cache_lookups('OpenTicketCounters', 1, 0)
+            return resolved_tickets, openTickets, True
+        record_cache_lookups('OpenTicketCounters', 0, 1)
+        # No counter for this BP, or a counter lower than the tickets resolved. Once the ticket entries are migrated, every ticket
+        # recorded counted in the counter, so none is left open. Until then, count the entries left of the BP in this workload lens
+        # question. The counter is set so that the next resolutions of the BP use it.
+        if is_ticket_entries_migration_completed():
+            logger.warning(f'The open ticket counter of BP {bp} is missing or lower than the {len(resolved_tickets)} tickets resolved. Setting it to 0.')
+            openTickets = 0
+        else:
+            openTickets = ddb_count_open_tickets(*bp)
+        counted = ddb_seed_open_tickets(bp, len(resolved_tickets), openTickets)
+        return resolved_tickets, openTickets, counted
+    except Exception:
+        ddb_restore_entries(bp, [entry for entry, managementTool, message_ids in resolved_tickets.values()], False)
+        raise
+
+# Function to return the metadata entry of a question in a lens version recorded by the tracker, or None if there is none
+def get_lens_metadata(lensAlias, lensVersion, questionId):
+    item = lens_metadata_cache.get((lensAlias, lensVersion, questionId))
+    if item and item['expiresAt'] > time.time():
+        record_cache_lookups('LensMetadata', 1, 0)
+        return item
+    record_cache_lookups('LensMetadata', 0, 1)
+
+    get_item_response = get_client('dynamodb').get_item(
+        TableName=DDB_TABLE,
+        Key=ddb_serialize({'ticketHeaderKey': LENS_METADATA_KEY_PREFIX + lensAlias + '#' + lensVersion + '#' + questionId, 'creationDate': STATE_ENTRY_SORT_KEY})
     )
-    return response
+    if 'Item' not in get_item_response:
+        return None
+    item = ddb_deserialize(get_item_response['Item'])
+    if item['expiresAt'] <= time.time():
+        return None
+    lens_metadata_cache[(lensAlias, lensVersion, questionId)] = item
+    return item
+
+# Function to return the id of the "None of these" choice of a question. The lens metadata recorded by the tracker for the lens version
+# of the tickets is used if there is one, the answer of the question otherwise (e.g. tickets recorded before lensVersion).
+@timed_stage
+def get_none_of_these_choice_id(workloadId, lensAlias, questionId, lensVersion):
+    if lensVersion != None:
+        lens_metadata = get_lens_metadata(lensAlias, lensVersion, questionId)
+        if lens_metadata != None:
+            return lens_metadata.get('noneOfTheseChoiceId')
 
-def get_none_of_these_choice_id(workloadId, lensAlias, questionId):
-    answer = wa_client.get_answer(
+    answer = call_api('wellarchitected', get_client('wellarchitected').get_answer,
         WorkloadId=workloadId,
         LensAlias=lensAlias,
         QuestionId=questionId
@@ -57,18 +529,20 @@ def get_none_of_these_choice_id(workloadId, lensAlias, questionId):
         if choice['Title'] == "None of these":
             return choice['ChoiceId']
 
+@timed_stage
 def create_milestone(workloadId, ticketId):
-    create_milestone_response = wa_client.create_milestone(
+    create_milestone_response = call_api('wellarchitected', get_client('wellarchitected').create_milestone,
         WorkloadId=workloadId,
         MilestoneName=ticketId
     )
     return create_milestone_response
 
+@timed_stage
 def publish_sns_notification(bestPracticeName, workloadName, managementTool, allIssuesResolved, ticketId, pillarId, pillarQuestion):
     if allIssuesResolved:
         logger.info(f'Sending SNS notification in relation to an update of Best Practice {bestPracticeName} from Workload {workloadName}. All {managementTool} tickets related to this BP have been closed.')
         sns_message = '[WALAB Notification]\t\n\t\nYou are receiving this notification in relation to an update of your Well-Architected Tool Workload "' + workloadName + '" and its alignment with the Well-Architected Best Practice "' + bestPracticeName + '".\t\nThe ' + managementTool + ' ticket ' + ticketId + ' has been closed. All ' + managementTool + ' tickets related to the mentioned Best Practice have been closed.\t\nConsider updating the answer for this Best Practice in your Workload from the Well-Architected Tool.\t\n\t\n[AWS Well-Architected Pilar: "' + pillarId + '", Question: "' + pillarQuestion + '", Best Practice: "' + bestPracticeName + '"]'
-        publish_response = sns_client.publish(
+        publish_response = call_api('sns', get_client('sns').publish,
             TopicArn=TOPIC_WORKLOAD_BP_UPDATE,
             Message=sns_message,
             Subject='[WALAB] Well-Architected Tool - Workload ' + workloadName + ' Update Notification'
@@ -76,106 +550,168 @@ def publish_sns_notification(bestPracticeName, workloadName, managementTool, all
     else:
         logger.info(f'Sending SNS notification in relation to an update of Best Practice {bestPracticeName} from Workload {workloadName}. There are remaining {managementTool} tickets still open in relation to this BP.')
         sns_message = '[WALAB Notification]\t\n\t\nYou are receiving this notification in relation to an update of your Well-Architected Tool Workload "' + workloadName + '" and its alignment with the Well-Architected Best Practice "' + bestPracticeName + '".\t\nThe ' + managementTool + ' ticket ' + ticketId + ' has been closed. There are remaining ' + managementTool + ' tickets still open in relation to this Best Practice.\t\n\t\n[AWS Well-Architected Pilar: "' + pillarId + '", Question: "' + pillarQuestion + '", Best Practice: "' + bestPracticeName + '"]'
-        publish_response = sns_client.publish(
+        publish_response = call_api('sns', get_client('sns').publish,
             TopicArn=TOPIC_WORKLOAD_BP_UPDATE,
             Message=sns_message,
             Subject='[WALAB] Well-Architected Tool - Workload ' + workloadName + ' Update Notification'
         )
 
+# Function to return the management tool and the id of the ticket a message was sent for: a JIRA automation SNS message
+# (delivered by SNS or through SQS) or an OpsCenter UpdateOpsItem EventBridge event (delivered by EventBridge or through SQS)
+def get_resolved_ticket(message):
+    if 'Sns' in message:
+        return 'Jira', json.loads(message['Sns']['Message'])['automationData']['ticketId']
+    if 'Message' in message:
+        return 'Jira', json.loads(message['Message'])['automationData']['ticketId']
+    return 'OpsCenter', message['detail']['requestParameters']['opsItemId']
+
+# Function to list the resolved tickets of an invocation as (SQS message id, management tool, ticket id). The message id is None
+# when the function is not invoked by SQS. Messages that cannot be read are returned as failed message ids.
+def get_resolved_tickets(event):
+    resolved_tickets = []
+    failed_message_ids = set()
+
+    if 'Records' not in event:
+        messages = [(None, event)]
+    else:
+        messages = []
+        for record in event['Records']:
+            if record.get('eventSource') == 'aws:sqs':
+                try:
+                    messages.append((record['messageId'], json.loads(record['body'])))
+                except ValueError as e:
+                    logger.error(f'Unable to read SQS message {record["messageId"]}. Exception: {e}')
+                    failed_message_ids.add(record['messageId'])
+            else:
+                messages.append((None, record))
+
+    for message_id, message in messages:
+        try:
+            managementTool, ticketId = get_resolved_ticket(message)
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error(f'Unable to read the ticket id of message {message_id}. Exception: {e}')
+            if message_id == None:
+                raise
+            failed_message_ids.add(message_id)
+            continue
+        if (managementTool == 'Jira' and JIRA_INTEGRATION) or (managementTool == 'OpsCenter' and OPS_CENTER_INTEGRATION):
+            logger.info(f'{managementTool} issue {ticketId} was marked as resolved')
+            resolved_tickets.append((message_id, managementTool, ticketId))
+
+    return resolved_tickets, failed_message_ids
+
+# Function to resolve the tickets of a BP (see resolve_bp_tickets), returning None if it failed
+def resolve_bp_tickets_logging_errors(bp, bp_tickets):
+    try:
+        return resolve_bp_tickets(bp, bp_tickets)
+    except Exception as e:
+        logger.error(f'Error encountered resolving the tickets of Best Practice {bp[3]} in Workload {bp[0]}. Exception: {e}')
+        return None
+
+# Function to restore the entries of the tickets of BPs whose processing failed (see ddb_restore_entries).
+# Returns the message ids of the tickets, to be retried.
+def restore_resolutions(resolutions, bps):
+    message_ids_to_retry = []
+    for bp in bps:
+        resolved_tickets, openTickets, counted = resolutions.pop(bp, ({}, None, False))
+        if resolved_tickets:
+            ddb_restore_entries(bp, [entry for entry, managementTool, message_ids in resolved_tickets.values()], counted)
+        message_ids_to_retry += [message_id for entry, managementTool, message_ids in resolved_tickets.values() for message_id in message_ids]
+    return message_ids_to_retry
+
+# Function to return a milestone name made of the ids of the tickets resolved
+def get_milestone_name(ticketIds):
+    milestoneName = ', '.join(sorted(ticketIds))
+    if len(milestoneName) > MILESTONE_NAME_MAX_LENGTH:
+        milestoneName = milestoneName[:MILESTONE_NAME_MAX_LENGTH - 3] + '...'
+    return milestoneName
+
+# Processes the tickets resolved in a batch of messages. The DDB entries of the tickets are looked up concurrently and grouped by
+# question and BP: the entries of each BP are deleted and its open ticket counter decremented once, each question gets at most one
+# answer update and each workload at most one milestone.
+# When invoked by SQS, returns the messages that failed (ReportBatchItemFailures) so that only those are retried.
 def lambda_handler(event, context):
     try:
-        if JIRA_INTEGRATION and event['Records']:
-            for record in event['Records']:
-                ticketId = json.loads(record['Sns']['Message'])['automationData']['ticketId']
-                logger.info(f'JIRA issue {ticketId} was marked as resolved')
-                ddb_query_response = ddb_query_entries('ticketId-index', ticketId)
-                ddb_bp_count = len(ddb_query_entries('bestPracticeId-index', ddb_query_response[0]['bestPracticeId']))
-
-                if ddb_query_response and ddb_bp_count == 1:
-                    none_of_these_choice_id = get_none_of_these_choice_id(ddb_query_response[0]['workloadId'], ddb_query_response[0]['lensAlias'], ddb_query_response[0]['questionId'])
-
-                    # Only Update BP in WA Tool and Create Milestone automatically if AUTO_BP_MILESTONE_UPDATER is true
-                    if AUTO_BP_MILESTONE_UPDATER:
-                        logger.info(f'Updating Best Practice {ddb_query_response[0]["bestPracticeId"]} from Workload {ddb_query_response[0]["workloadId"]} to "SELECTED" status')
-                        update_answer_response = wa_client.update_answer(
-                            WorkloadId=ddb_query_response[0]['workloadId'],
-                            LensAlias=ddb_query_response[0]['lensAlias'],
-                            QuestionId=ddb_query_response[0]['questionId'],
-                            ChoiceUpdates={
-                                ddb_query_response[0]['bestPracticeId']: {
-                                    'Status': 'SELECTED'
-                                },
-                                none_of_these_choice_id: {
-                                    'Status': 'UNSELECTED'
-                                }
-                            }
-                        )
-                        logger.info(f'Creating new milestone for workload {ddb_query_response[0]["workloadId"]}')
-                        create_milestone(ddb_query_response[0]["workloadId"], ticketId)
-                    
-                    publish_sns_notification(ddb_query_response[0]["bestPracticeName"], ddb_query_response[0]["workloadName"], 'Jira', True, ddb_query_response[0]["ticketId"], ddb_query_response[0]["pillarId"], ddb_query_response[0]["pillarQuestion"])
-
-                    logger.info(f'Deleting {ticketId} entry from DDB')
-                    ticketHeaderKey = ddb_query_response[0]['ticketHeaderKey']
-                    delete_entry(ticketHeaderKey, ddb_query_response[0]['creationDate'])
-
-                elif ddb_query_response and ddb_bp_count > 1:
-                    publish_sns_notification(ddb_query_response[0]["bestPracticeName"], ddb_query_response[0]["workloadName"], 'Jira', False, ddb_query_response[0]["ticketId"], ddb_query_response[0]["pillarId"], ddb_query_response[0]["pillarQuestion"])
-
-                    logger.info(f'There are outstanding JIRA issues related to {ddb_query_response[0]["bestPracticeId"]} in Workload {ddb_query_response[0]["workloadId"]}. Leaving Best Practice in "UNSELECTED" status')
-                    logger.info(f'Deleting {ticketId} entry from DDB')
-                    ticketHeaderKey = ddb_query_response[0]['ticketHeaderKey']
-                    delete_entry(ticketHeaderKey, ddb_query_response[0]['creationDate'])
+        resolved_tickets, failed_message_ids = get_resolved_tickets(event)
 
-                else:
-                    logger.info(f'No entry in DDB for JIRA issue: {ticketId}')
-        
-        if OPS_CENTER_INTEGRATION and event['detail']:
-            ticketId = event['detail']['requestParameters']['opsItemId']
-            logger.info(f'OpsCenter issue {ticketId} was marked as resolved')
-            ddb_query_response = ddb_query_entries('ticketId-index', ticketId)
-            ddb_bp_count = len(ddb_query_entries('bestPracticeId-index', ddb_query_response[0]['bestPracticeId']))
+        # DDB entry of each ticket (a ticket resolved twice in the batch is looked up once)
+        ticketIds = list(dict.fromkeys(ticketId for message_id, managementTool, ticketId in resolved_tickets))
+        ddb_entries = dict(zip(ticketIds, run_concurrently(ddb_query_entries, [('ticketId-index', ticketId) for ticketId in ticketIds])))
+
+        # Group the entries by BP: {(workloadId, lensAlias, questionId, bestPracticeId): {ticketId: (entry, managementTool, message ids)}}
+        bps = {}
+        for message_id, managementTool, ticketId in resolved_tickets:
+            if not ddb_entries[ticketId]:
+                logger.info(f'No entry in DDB for {managementTool} issue: {ticketId}')
+                continue
+            entry = ddb_entries[ticketId][0]
+            bp_tickets = bps.setdefault((entry['workloadId'], entry['lensAlias'], entry['questionId'], entry['bestPracticeId']), {})
+            bp_tickets.setdefault(ticketId, (entry, managementTool, []))[2].append(message_id)
+
+        # Delete the entries and decrement the open ticket counter of each BP
+        resolutions = {}
+        for bp, resolution in zip(bps, run_concurrently(resolve_bp_tickets_logging_errors, list(bps.items()))):
+            if resolution == None:
+                failed_message_ids.update(message_id for entry, managementTool, message_ids in bps[bp].values() for message_id in message_ids)
+            elif resolution[0]:
+                resolutions[bp] = resolution
 
-            if ddb_query_response and ddb_bp_count == 1:
-                none_of_these_choice_id = get_none_of_these_choice_id(ddb_query_response[0]['workloadId'], ddb_query_response[0]['lensAlias'], ddb_query_response[0]['questionId'])
+        # Group the BPs by question: {(workloadId, lensAlias, questionId): [bp]}
+        questions = {}
+        for bp in resolutions:
+            questions.setdefault(bp[:3], []).append(bp)
+
+        milestones = {}
+        for (workloadId, lensAlias, questionId), question_bps in questions.items():
+            try:
+                # BPs for which every open ticket is now resolved
+                resolved_bestPracticeIds = [bp[3] for bp in question_bps if resolutions[bp][1] == 0]
 
                 # Only Update BP in WA Tool and Create Milestone automatically if AUTO_BP_MILESTONE_UPDATER is true
-                if AUTO_BP_MILESTONE_UPDATER:
-                    logger.info(f'Updating Best Practice {ddb_query_response[0]["bestPracticeId"]} from Workload {ddb_query_response[0]["workloadId"]} to "SELECTED" status')
-                    update_answer_response = wa_client.update_answer(
-                        WorkloadId=ddb_query_response[0]['workloadId'],
-                        LensAlias=ddb_query_response[0]['lensAlias'],
-                        QuestionId=ddb_query_response[0]['questionId'],
-                        ChoiceUpdates={
-                            ddb_query_response[0]['bestPracticeId']: {
-                                'Status': 'SELECTED'
-                            },
-                            none_of_these_choice_id: {
-                                'Status': 'UNSELECTED'
-                            }
-                        }
+                if AUTO_BP_MILESTONE_UPDATER and resolved_bestPracticeIds:
+                    lensVersion = next((entry['lensVersion'] for bp in question_bps for entry, managementTool, message_ids in resolutions[bp][0].values() if 'lensVersion' in entry), None)
+                    none_of_these_choice_id = get_none_of_these_choice_id(workloadId, lensAlias, questionId, lensVersion)
+                    choice_updates = {bestPracticeId: {'Status': 'SELECTED'} for bestPracticeId in resolved_bestPracticeIds}
+                    if none_of_these_choice_id != None:
+                        choice_updates[none_of_these_choice_id] = {'Status': 'UNSELECTED'}
+                    logger.info(f'Updating Best Practices {resolved_bestPracticeIds} from Workload {workloadId} to "SELECTED" status')
+                    update_answer_response = call_api('wellarchitected', get_client('wellarchitected').update_answer,
+                        WorkloadId=workloadId,
+                        LensAlias=lensAlias,
+                        QuestionId=questionId,
+                        ChoiceUpdates=choice_updates
                     )
-                    logger.info(f'Creating new milestone for workload {ddb_query_response[0]["workloadId"]}')
-                    create_milestone(ddb_query_response[0]["workloadId"], ticketId)
 
-                publish_sns_notification(ddb_query_response[0]["bestPracticeName"], ddb_query_response[0]["workloadName"], 'OpsCenter', True, ddb_query_response[0]["ticketId"], ddb_query_response[0]["pillarId"], ddb_query_response[0]["pillarQuestion"])
+                for bp in question_bps:
+                    resolved_tickets, openTickets, counted = resolutions[bp]
+                    if openTickets != 0:
+                        logger.info(f'There are outstanding issues related to {bp[3]} in Workload {workloadId}. Leaving Best Practice in "UNSELECTED" status')
+                    for ticketId, (entry, managementTool, message_ids) in resolved_tickets.items():
+                        publish_sns_notification(entry["bestPracticeName"], entry["workloadName"], managementTool, openTickets == 0, entry["ticketId"], entry["pillarId"], entry["pillarQuestion"])
 
-                logger.info(f'Deleting {ticketId} entry from DDB')
-                ticketHeaderKey = ddb_query_response[0]['ticketHeaderKey']
-                delete_entry(ticketHeaderKey, ddb_query_response[0]['creationDate'])
+                if AUTO_BP_MILESTONE_UPDATER and resolved_bestPracticeIds:
+                    milestone = milestones.setdefault(workloadId, {'ticketIds': [], 'bps': []})
+                    milestone['ticketIds'] += [ticketId for bp in question_bps if bp[3] in resolved_bestPracticeIds for ticketId in resolutions[bp][0]]
+                    milestone['bps'] += question_bps
+            except Exception as e:
+                logger.error(f'Error encountered processing question {questionId} of Workload {workloadId}. Exception: {e}')
+                failed_message_ids.update(restore_resolutions(resolutions, question_bps))
 
-            elif ddb_query_response and ddb_bp_count > 1:
-                publish_sns_notification(ddb_query_response[0]["bestPracticeName"], ddb_query_response[0]["workloadName"], 'OpsCenter', False, ddb_query_response[0]["ticketId"], ddb_query_response[0]["pillarId"], ddb_query_response[0]["pillarQuestion"])
+        for workloadId, milestone in milestones.items():
+            try:
+                logger.info(f'Creating new milestone for workload {workloadId}')
+                create_milestone(workloadId, get_milestone_name(milestone['ticketIds']))
+            except Exception as e:
+                logger.error(f'Error encountered creating milestone for Workload {workloadId}. Exception: {e}')
+                failed_message_ids.update(restore_resolutions(resolutions, milestone['bps']))
 
-                logger.info(f'There are outstanding OpsCenter issues related to {ddb_query_response[0]["bestPracticeId"]} in Workload {ddb_query_response[0]["workloadId"]}. Leaving Best Practice in "UNSELECTED" status')
-                logger.info(f'Deleting {ticketId} entry from DDB')
-                ticketHeaderKey = ddb_query_response[0]['ticketHeaderKey']
-                delete_entry(ticketHeaderKey, ddb_query_response[0]['creationDate'])
+        if 'Records' in event and all(record.get('eventSource') == 'aws:sqs' for record in event['Records']):
+            return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed_message_ids)]}
+        if failed_message_ids:
+            raise Exception('Unable to process every resolved ticket')
 
-            else:
-                logger.info(f'No entry in DDB for OpsCenter issue: {ticketId}')
-    
     except Exception as e:
         logger.error(f"Error encountered. Exception: {e}")
         raise e
-        
+    finally:
+        log_invocation_metrics()
@@ -1,20 +1,27 @@
 import boto3
+import botocore.exceptions
 import logging
 import os
-from jira import JIRA
 import json
 import hashlib
 import re
-from boto3.dynamodb.conditions import Key
+import time
+import random
+import threading
+import functools
+import abc
+import concurrent.futures
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from botocore.config import Config
 from datetime import datetime, timezone
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-wa_client = boto3.client('wellarchitected')
-ta_client = boto3.client('support')
-ssm_client = boto3.client('ssm')
-dynamodb_resource = boto3.resource('dynamodb')
-sts_client = boto3.client('sts')
+# AWS clients are created on first use (see get_client), and the jira module is only imported when a JIRA ticket operation is needed.
+aws_clients = {}
+aws_clients_lock = threading.Lock()
+ddb_serializer = TypeSerializer()
+ddb_deserializer = TypeDeserializer()
 
 ######################################
 # Uncomment below for running on AWS Lambda
@@ -30,6 +37,9 @@ TAG_VALUE = os.environ['TAG_VALUE']
 # Scan all resources in region (Supported by AWS Resource Groups Tag Editor Tagging https://docs.aws.amazon.com/ARG/latest/userguide/supported-resources.html)
 SCAN_ALL = (os.environ['SCAN_ALL'] == 'True')
 
+# Regions of the workload resources, comma separated (e.g. "us-east-1,eu-west-1"). Empty lists the region of the Lambda only.
+INVENTORY_REGIONS = [region.strip() for region in os.environ.get('INVENTORY_REGIONS', '').split(',') if region.strip()]
+
 # WA Implementation plan base-URL
 WA_WEB_URL='https://docs.aws.amazon.com/wellarchitected/latest/framework/'
 WA_WEB_ANCHOR='.html#implementation-guidance'
@@ -40,109 +50,939 @@ JIRA_USERNAME = os.environ['JIRA_USERNAME']
 JIRA_SECRET_SSM_PARAM = os.environ['JIRA_SECRET_SSM_PARAM']
 JIRA_PROJECT_KEY = os.environ['JIRA_PROJECT_KEY']
 
+# JIRA API token cache lifetime (seconds)
+JIRA_SECRET_TTL = int(os.environ.get('JIRA_SECRET_TTL', '900'))
+
 # DDB
-DDB_TABLE = dynamodb_resource.Table(os.environ['DDB_TABLE'])
+DDB_TABLE = os.environ['DDB_TABLE']
 
 # Assumed Role Name
 WORKLOAD_ACCOUNT_ROLE_NAME = os.environ['WORKLOAD_ACCOUNT_ROLE_NAME']
 
 # List of TA Checks that are no specific to individual resources
 NON_RESOURCE_SPECIFIC_TA_CHECKS = ['wuy7G1zxql']
+
+# TA Check catalog cache lifetime (seconds) and persisted copy location
+TA_CHECK_CATALOG_TTL = int(os.environ.get('TA_CHECK_CATALOG_TTL', '86400'))
+TA_CHECK_CATALOG_FILE = '/tmp/ta-check-catalog.json'
+
+# Workload resource inventory cache lifetime (seconds)
+WORKLOAD_RESOURCES_TTL = int(os.environ.get('WORKLOAD_RESOURCES_TTL', '300'))
+
+# Concurrent processing of workload accounts and TA Checks (1 runs everything serially), and per service concurrency limits
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '8'))
+SUPPORT_API_CONCURRENCY = int(os.environ.get('SUPPORT_API_CONCURRENCY', '4'))
+TAGGING_API_CONCURRENCY = int(os.environ.get('TAGGING_API_CONCURRENCY', '2'))
+STS_API_CONCURRENCY = int(os.environ.get('STS_API_CONCURRENCY', '4'))
+
+# Client-side rate limits (calls per second) per service. The rate of a service is halved on each throttling error and recovers
+# on successful calls. Throttled calls, and calls failing with a transient error, are retried up to API_MAX_RETRIES times.
+# A rate of 0 does not limit the calls to the service.
+SUPPORT_API_RATE = float(os.environ.get('SUPPORT_API_RATE', '5'))
+TAGGING_API_RATE = float(os.environ.get('TAGGING_API_RATE', '5'))
+WELLARCHITECTED_API_RATE = float(os.environ.get('WELLARCHITECTED_API_RATE', '5'))
+SSM_API_RATE = float(os.environ.get('SSM_API_RATE', '3'))
+JIRA_API_RATE = float(os.environ.get('JIRA_API_RATE', '5'))
+API_MAX_RETRIES = int(os.environ.get('API_MAX_RETRIES', '5'))
+
+# Error codes of the AWS APIs and HTTP status codes of JIRA that mean the call was throttled
+THROTTLING_ERROR_CODES = ['Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException', 'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown']
+THROTTLING_STATUS_CODES = [429, 503]
+
+# botocore configuration of the AWS clients of the rate limited services: botocore does not retry their calls, call_api does, so that
+# a throttled call is retried at most API_MAX_RETRIES times and every attempt goes through the rate limiter
+RATE_LIMITED_CLIENT_CONFIG = Config(retries={'max_attempts': 0, 'mode': 'standard'})
+
+# Assumed role credentials are refreshed this many seconds before they expire
+CREDENTIALS_REFRESH_MARGIN = int(os.environ.get('CREDENTIALS_REFRESH_MARGIN', '300'))
+
+# DDB BatchWriteItem size limit and retries of unprocessed entries
+DDB_BATCH_WRITE_SIZE = 25
+DDB_BATCH_MAX_RETRIES = int(os.environ.get('DDB_BATCH_MAX_RETRIES', '8'))
+
+# TA metadata columns that change on TA refreshes without the resource changing, left out of the ticket fingerprint
+VOLATILE_TA_METADATA_COLUMNS = os.environ.get('VOLATILE_TA_METADATA_COLUMNS', 'Last Updated Time').split(',')
+
+# Maximum number of flagged resource keys recorded per ticket entry in DDB to report the resources added or removed, and maximum
+# length of the readable identifier recorded with each key
+MAX_RECORDED_FLAGGED_RESOURCE_KEYS = int(os.environ.get('MAX_RECORDED_FLAGGED_RESOURCE_KEYS', '2000'))
+FLAGGED_RESOURCE_LABEL_LENGTH = 100
+
+# TA metadata columns identifying a resource, by order of preference (see FlaggedResource.label)
+FLAGGED_RESOURCE_LABEL_COLUMNS = ['ARN', 'ID', 'NAME']
+
+# TA Check state entries (TA refresh timestamp and workload flagged resources digest per account and TA Check) lifetime (seconds)
+TA_CHECK_STATE_TTL = int(os.environ.get('TA_CHECK_STATE_TTL', '604800'))
+
+# Sort key of the DDB entries that record tracker state instead of a ticket
+STATE_ENTRY_SORT_KEY = 'state'
+
+# DDB BatchGetItem size limit
+DDB_BATCH_GET_SIZE = 100
+
+# New entries written per DDB transaction, together with their pointers and the increments of their open ticket counters (100 items per transaction)
+DDB_TRANSACTION_ENTRIES = 33
+
+# Ticket description size limits (characters) of OpsCenter and JIRA. Flagged resources that do not fit are left out of the
+# description and written to a gzip JSON Lines file (S3 object for OpsItems, attachment for JIRA issues).
+OPS_ITEM_DESCRIPTION_LIMIT = 2048
+JIRA_DESCRIPTION_LIMIT = 32767
+
+# Maximum number of flagged resources shown in a ticket description (and in the OpsItem related resources)
+MAX_INLINE_FLAGGED_RESOURCES = int(os.environ.get('MAX_INLINE_FLAGGED_RESOURCES', '100'))
+
+# S3 bucket and prefix of the flagged resources files of OpsItems. If no bucket is configured, the flagged resources left out are only counted.
+FLAGGED_RESOURCES_BUCKET = os.environ.get('FLAGGED_RESOURCES_BUCKET', '')
+FLAGGED_RESOURCES_PREFIX = 'flagged-resources/'
+
+# Placeholder of the flagged resources in a ticket description template
+FLAGGED_RESOURCES_PLACEHOLDER = '\x00flaggedResources\x00'
+
+# Lens metadata entries (choices, "None of these" choice and TA Checks of each choice of a question in a lens version) lifetime (seconds).
+# The questions and choices of a lens version do not change, but the TA Checks related to a choice can change without a new lens version.
+# The lens version of a workload is kept in the warm container for the same lifetime.
+LENS_METADATA_TTL = int(os.environ.get('LENS_METADATA_TTL', '604800'))
+LENS_METADATA_KEY_PREFIX = 'lensmetadata#'
+
+# JIRA issues created per bulk request, and attempts of each ticket creation or update before the run fails (see TicketSink)
+JIRA_BULK_CREATE_SIZE = int(os.environ.get('JIRA_BULK_CREATE_SIZE', '50'))
+TICKET_SINK_MAX_ATTEMPTS = int(os.environ.get('TICKET_SINK_MAX_ATTEMPTS', '3'))
+
+# Prefix of the label identifying a JIRA issue, followed by its ticketHeaderKey
+JIRA_TICKET_LABEL_PREFIX = 'walab-'
+
+# Minimum number of seconds between two scheduled sweeps of every workload (reconciliation_handler)
+RECONCILIATION_INTERVAL = int(os.environ.get('RECONCILIATION_INTERVAL', '86400'))
+
+# Time (milliseconds) left to the invocation below which a sweep stops and resumes in the next scheduled invocation
+RECONCILIATION_TIME_MARGIN = int(os.environ.get('RECONCILIATION_TIME_MARGIN', '120000'))
+
+# Key of the DDB entry that records the progress of the sweep
+RECONCILIATION_CHECKPOINT_KEY = 'reconciliation#checkpoint'
+
+# Invocations a workload can be interrupted in (e.g. by the function timeout) before the sweep skips it until the next sweep
+RECONCILIATION_MAX_ATTEMPTS = int(os.environ.get('RECONCILIATION_MAX_ATTEMPTS', '3'))
+
+# Key of the DDB entry recording the migration of the ticket entries recorded before the ticket pointers and the open ticket counters
+# existed (see migrate_ticket_entries)
+TICKET_ENTRIES_MIGRATION_KEY = 'migration#ticketentries'
+
+# Workloads listing more than SHARD_ACCOUNTS account ids are processed in shards of SHARD_ACCOUNTS accounts, each one in its own
+# asynchronous invocation of this function (0 processes every workload in a single invocation)
+SHARD_ACCOUNTS = int(os.environ.get('SHARD_ACCOUNTS', '0'))
+
+# Prefix of the keys of the DDB entries that record the shards of a sharded run, and lifetime (seconds) of these entries
+SHARD_RUN_KEY_PREFIX = 'shardrun#'
+SHARD_RUN_TTL = 86400
+
+# Key of the DDB entry listing the sharded runs not completed yet
+SHARD_RUNS_PENDING_KEY = 'shardruns#pending'
+
+# Time (seconds) after which the shards of a run not completed yet are dispatched again by the scheduled invocations (see
+# redispatch_incomplete_shard_runs), and number of dispatches of a run before its missing shards are given up
+SHARD_RUN_TIMEOUT = int(os.environ.get('SHARD_RUN_TIMEOUT', '3600'))
+SHARD_RUN_MAX_DISPATCHES = int(os.environ.get('SHARD_RUN_MAX_DISPATCHES', '3'))
+
+# CloudWatch Embedded Metric Format (EMF) output of the stage durations, AWS API calls and cache hits of each invocation on/off.
+# When off, the stage functions are not wrapped and no metric is collected.
+EMBEDDED_METRICS = (os.environ.get('EMBEDDED_METRICS', 'True') == 'True')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'WALab')
 ######################################
 
+# Class of a client-side token bucket limiting the rate of the calls to a service, shared by all the worker threads.
+# The rate is halved on each throttling error (down to a tenth of the configured rate) and increases back on successful calls.
+# A throttling error with a Retry-After delay also pauses every call to the service for that delay.
+class RateLimiter:
+    __slots__ = ('maxRate', 'rate', 'tokens', 'updatedAt', 'pausedUntil', 'lock', 'calls', 'throttles', 'waitTime')
+
+    def __init__(self, rate):
+        self.maxRate = rate
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.updatedAt = time.monotonic()
+        self.pausedUntil = 0.0
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttles = 0
+        self.waitTime = 0.0
+
+    # Waits for a token. A rate of 0 or less does not limit the calls, only the pauses apply.
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.maxRate <= 0:
+                    self.tokens = 1.0
+                else:
+                    self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updatedAt) * self.rate)
+                self.updatedAt = now
+                if now >= self.pausedUntil and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    return
+                wait = self.pausedUntil - now if self.maxRate <= 0 else max(self.pausedUntil - now, (1 - self.tokens) / self.rate)
+                self.waitTime += wait
+            time.sleep(wait)
+
+    def throttled(self, delay):
+        with self.lock:
+            self.throttles += 1
+            self.rate = max(self.maxRate / 10, self.rate / 2)
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + delay)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.maxRate, self.rate + self.maxRate / 20)
+
+    # Returns the metrics since the previous call and resets them
+    def pop_metrics(self):
+        with self.lock:
+            metrics = {'calls': self.calls, 'throttles': self.throttles, 'waitTime': round(self.waitTime, 3), 'rate': round(self.rate, 2)}
+            self.calls = 0
+            self.throttles = 0
+            self.waitTime = 0.0
+        return metrics
+
+# Class collecting the metrics of an invocation from every worker thread: calls and duration of each pipeline stage,
+# AWS API calls and botocore retries per service, hits and misses of each cache.
+class InvocationMetrics:
+    __slots__ = ('lock', 'stages', 'apiCalls', 'cacheLookups')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.apiCalls = {}
+        self.cacheLookups = {}
+
+    def add_stage_time(self, stage, seconds):
+        with self.lock:
+            stage_metrics = self.stages.setdefault(stage, [0, 0.0])
+            stage_metrics[0] += 1
+            stage_metrics[1] += seconds
+
+    def add_api_call(self, service, retries):
+        with self.lock:
+            api_metrics = self.apiCalls.setdefault(service, [0, 0])
+            api_metrics[0] += 1
+            api_metrics[1] += retries
+
+    def add_cache_lookups(self, cache, hits, misses):
+        with self.lock:
+            cache_metrics = self.cacheLookups.setdefault(cache, [0, 0])
+            cache_metrics[0] += hits
+            cache_metrics[1] += misses
+
+    # Returns the metrics since the previous call and resets them
+    def pop_metrics(self):
+        with self.lock:
+            metrics = (self.stages, self.apiCalls, self.cacheLookups)
+            self.stages = {}
+            self.apiCalls = {}
+            self.cacheLookups = {}
+        return metrics
+
+# Class of a flagged resource of a TA Check: its TA status and its metadata values, in the column order of the TA Check
+class FlaggedResource:
+    __slots__ = ('status', 'metadata')
+
+    def __init__(self, status, metadata):
+        self.status = status
+        self.metadata = metadata
+
+    # Keeps only the TA status and metadata of a flagged resource returned by TA
+    @classmethod
+    def from_ta_flagged_resource(cls, flagged_resource):
+        return cls(flagged_resource['status'], tuple(flagged_resource['metadata']))
+
+    # Canonical key: a short hash of the TA status and normalized metadata, leaving out the volatile TA metadata columns
+    def key(self, metadataOrder):
+        metadata = ['' if value is None else str(value).strip() for column, value in zip(metadataOrder, self.metadata) if column not in VOLATILE_TA_METADATA_COLUMNS]
+        return hashlib.blake2b(json.dumps([self.status] + metadata, separators=(',', ':')).encode(), digest_size=8).hexdigest()
+
+    # Readable identifier: the region, if any, and the first ARN, ID or name column (the first other column otherwise)
+    def label(self, metadataOrder):
+        values = {column: '' if value is None else str(value).strip() for column, value in zip(metadataOrder, self.metadata)}
+        columns = [column for column in metadataOrder if values.get(column) and column not in VOLATILE_TA_METADATA_COLUMNS and column not in ['Region', 'Status']]
+        identifiers = [column for word in FLAGGED_RESOURCE_LABEL_COLUMNS for column in columns if word in column.upper().split()] or columns
+        return ' '.join(([values['Region']] if values.get('Region') else []) + [values[column] for column in identifiers[:1]])[:FLAGGED_RESOURCE_LABEL_LENGTH]
+
+    # Metadata indexed by column name (e.g. {'Region': 'us-east-1', 'Bucket Name': 'my-bucket'})
+    def as_dict(self, metadataOrder):
+        return dict(zip(metadataOrder, self.metadata))
+
+# Class of a TA Check of a BP, with the workload flagged resources retrieved for an account. The column order of the
+# metadata (metadataOrder) is the tuple of the TA Check catalog entry, shared by every instance of the TA Check.
+class TACheck:
+    __slots__ = ('id', 'name', 'taRecommedationUrls', 'metadataOrder', 'flaggedResources', 'flaggedResourceKeys', 'flaggedResourcesDigest')
+
+    def __init__(self, catalog_entry):
+        self.id = catalog_entry['id']
+        self.name = catalog_entry['name']
+        self.taRecommedationUrls = catalog_entry['taRecommedationUrls']
+        self.metadataOrder = catalog_entry['metadataOrder']
+        self.flaggedResources = None
+        self.flaggedResourceKeys = None
+        self.flaggedResourcesDigest = None
+
+# Class of a ticket creation or update queued in a ticket sink (see TicketSink). entryFields are the workloadId, lensAlias, lensVersion,
+# questionId, bestPracticeId, workloadName, bestPracticeName, pillarId and pillarQuestion of the DDB entry of the ticket (see ddb_put_entry).
+class TicketOperation:
+    __slots__ = ('ticketHeaderKey', 'ticketContentKey', 'flaggedResourceKeys', 'accountId', 'checkFlagged', 'entryFields', 'ticketId', 'title', 'description', 'truncated')
+
+    def __init__(self, ticketHeaderKey, ticketContentKey, flaggedResourceKeys, accountId, checkFlagged, entryFields):
+        self.ticketHeaderKey = ticketHeaderKey
+        self.ticketContentKey = ticketContentKey
+        self.flaggedResourceKeys = flaggedResourceKeys
+        self.accountId = accountId
+        self.checkFlagged = checkFlagged
+        self.entryFields = entryFields
+        # Id of the ticket to update, None to create the ticket
+        self.ticketId = None
+        self.title = None
+        self.description = None
+        self.truncated = False
+
+# Class of the identity of the ticket of a BP <--> TA Check pair in a workload account
+class TicketKey:
+    __slots__ = ('ticketType', 'accountId', 'workloadId', 'bestPracticeTitle', 'checkId')
+
+    def __init__(self, ticketType, accountId, workloadId, bestPracticeTitle, checkId):
+        self.ticketType = ticketType
+        self.accountId = accountId
+        self.workloadId = workloadId
+        self.bestPracticeTitle = bestPracticeTitle
+        self.checkId = checkId
+
+    # ticketHeaderKey of the ticket entry in the DDB table
+    def header_key(self):
+        return hashlib.md5((self.ticketType + self.accountId + self.workloadId + self.bestPracticeTitle + self.checkId).encode()).hexdigest()
+
+# TA Check catalog indexed by check id, kept for the lifetime of the warm container
+ta_check_catalog = {'checks': {}, 'expiresAt': 0}
+ta_check_catalog_lock = threading.Lock()
+
+# Workload resource inventory per account id, reused across choices, questions and warm invocations
+workload_resources_cache = {}
+
+# Lens metadata entries indexed by (lensAlias, lensVersion, questionId), kept for the lifetime of the warm container (see get_lens_metadata)
+lens_metadata_cache = {}
+
+# Lens version per (workloadId, lensAlias), reused across warm invocations for LENS_METADATA_TTL (see get_workload_lens_version)
+workload_lens_versions_cache = {}
+
+# Whether the migration of the ticket entries is completed, kept for the lifetime of the warm container once it is (see migrate_ticket_entries)
+ticket_entries_migration = {'completed': False}
+
+# Concurrency limit per service, shared by all the worker threads
+api_concurrency_limits = {
+    'support': threading.BoundedSemaphore(SUPPORT_API_CONCURRENCY),
+    'resourcegroupstaggingapi': threading.BoundedSemaphore(TAGGING_API_CONCURRENCY),
+    'sts': threading.BoundedSemaphore(STS_API_CONCURRENCY)
+}
+
+# JIRA client and API token, created on the first ticket operation and reused across warm invocations
+jira_connection = {'client': None, 'client_secret': None, 'secret': None, 'secretExpiresAt': 0}
+jira_connection_lock = threading.Lock()
+
+# Rate limiter per service, shared by all the worker threads and kept across warm invocations
+rate_limiters = {
+    'support': RateLimiter(SUPPORT_API_RATE),
+    'resourcegroupstaggingapi': RateLimiter(TAGGING_API_RATE),
+    'wellarchitected': RateLimiter(WELLARCHITECTED_API_RATE),
+    'ssm': RateLimiter(SSM_API_RATE),
+    'jira': RateLimiter(JIRA_API_RATE)
+}
+
+# Metrics of the current invocation (see log_invocation_metrics)
+invocation_metrics = InvocationMetrics()
+
+# Caller identity, retrieved once per container
+caller_identity = {}
+
+# Workload account sessions and clients keyed by account id, reused (with their HTTP connection pools) across warm invocations
+workload_account_pool = {}
+workload_account_pool_lock = threading.Lock()
+
+# Function to return the client of an AWS service in the Lambda account, created on first use
+def get_client(service):
+    if service not in aws_clients:
+        with aws_clients_lock:
+            if service not in aws_clients:
+                aws_clients[service] = instrument_client(boto3.client(service, config=get_client_config(service)))
+    return aws_clients[service]
+
+# Function to return the botocore configuration of the clients of a service: the default one, or RATE_LIMITED_CLIENT_CONFIG if the
+# calls of the service go through call_api
+def get_client_config(service):
+    return RATE_LIMITED_CLIENT_CONFIG if service in rate_limiters else None
+
+# Functions to convert an item between its python and its DDB low-level client representation
+def ddb_serialize(item):
+    return {key: ddb_serializer.serialize(value) for key, value in item.items()}
+
+def ddb_deserialize(item):
+    return {key: ddb_deserializer.deserialize(value) for key, value in item.items()}
+
+# Function to call an AWS API without exceeding the concurrency limit of its service
+def call_with_concurrency_limit(service, function, *args, **kwargs):
+    with api_concurrency_limits[service]:
+        return function(*args, **kwargs)
+
+# Function to return the delay requested by a throttling error (JIRA Retry-After header), or None if the error is not a throttling error
+def get_throttling_delay(error):
+    status_code = getattr(error, 'status_code', None)
+    if status_code in THROTTLING_STATUS_CODES:
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        return float(retry_after) if retry_after and retry_after.isdigit() else 0.0
+
+    error_response = getattr(error, 'response', None)
+    if isinstance(error_response, dict) and error_response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+        return 0.0
+    return None
+
+# Function to return whether an AWS API call failed with a transient error (connection error, or server error) that botocore
+# would have retried
+def is_transient_error(error):
+    if isinstance(error, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return True
+    error_response = getattr(error, 'response', None)
+    return isinstance(error_response, dict) and error_response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+# Function to call an API within the rate limit of its service (and its concurrency limit, if any). Throttled calls slow down
+# the service rate limiter and are retried with exponential backoff and jitter, or after the delay requested by the service.
+# Calls failing with a transient error are retried with the same backoff, without slowing down the rate limiter.
+def call_api(service, function, *args, **kwargs):
+    rate_limiter = rate_limiters[service]
+    for attempt in range(API_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            if service in api_concurrency_limits:
+                response = call_with_concurrency_limit(service, function, *args, **kwargs)
+            else:
+                response = function(*args, **kwargs)
+        except Exception as e:
+            delay = get_throttling_delay(e)
+            transient = delay == None and is_transient_error(e)
+            if (delay == None and not transient) or attempt == API_MAX_RETRIES:
+                raise
+            delay = max(delay or 0.0, random.uniform(0, min(20, 0.5 * 2 ** attempt)))
+            if transient:
+                logger.info(f'{service} call failed with a transient error. Retrying in {delay:.2f} seconds. Exception: {e}')
+                time.sleep(delay)
+            else:
+                logger.info(f'{service} call throttled. Retrying in {delay:.2f} seconds')
+                rate_limiter.throttled(delay)
+            continue
+        rate_limiter.succeeded()
+        return response
+
+# Decorator timing each call of a pipeline stage function. The function is returned unchanged when EMBEDDED_METRICS is off.
+def timed_stage(function):
+    if not EMBEDDED_METRICS:
+        return function
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            invocation_metrics.add_stage_time(function.__name__, time.perf_counter() - start)
+    return timed_function
+
+# Function to record the hits and misses of a cache
+def record_cache_lookups(cache, hits, misses):
+    if EMBEDDED_METRICS:
+        invocation_metrics.add_cache_lookups(cache, hits, misses)
+
+# botocore 'after-call' event handler counting the calls of an AWS client and the retries botocore made for them
+def count_api_call(model, parsed, **kwargs):
+    invocation_metrics.add_api_call(model.service_model.service_name, parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+# Function to count the calls of a new AWS client in the invocation metrics
+def instrument_client(client):
+    if EMBEDDED_METRICS:
+        client.meta.events.register('after-call', count_api_call)
+    return client
+
+# Function to build an EMF document of metrics ({name: (value, unit)}) sharing the same dimensions
+def get_emf_document(dimensions, metrics):
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in metrics.items()]
+            }]
+        }
+    }
+    document.update(dimensions)
+    document.update({name: value for name, (value, unit) in metrics.items()})
+    return document
+
+# Function to log the metrics of the invocation and reset them. The calls, throttling errors and time spent waiting for each rate
+# limiter are always logged. With EMBEDDED_METRICS on, every metric is also printed as an EMF document per stage, service and cache,
+# which CloudWatch Logs turns into CloudWatch metrics.
+def log_invocation_metrics():
+    rate_limiter_metrics = {service: rate_limiter.pop_metrics() for service, rate_limiter in rate_limiters.items()}
+    logger.info('Rate limiter metrics: ' + json.dumps(rate_limiter_metrics))
+    if not EMBEDDED_METRICS:
+        return
+
+    stages, api_calls, cache_lookups = invocation_metrics.pop_metrics()
+    function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+    documents = []
+    for stage, (calls, seconds) in stages.items():
+        documents.append(get_emf_document({'FunctionName': function_name, 'Stage': stage}, {
+            'StageCalls': (calls, 'Count'),
+            'StageDuration': (round(seconds * 1000, 3), 'Milliseconds')
+        }))
+
+    for service in sorted(set(api_calls) | set(rate_limiter_metrics)):
+        if service in api_calls:
+            metrics = {'ApiCalls': (api_calls[service][0], 'Count'), 'ApiRetries': (api_calls[service][1], 'Count')}
+        elif rate_limiter_metrics[service]['calls']:
+            # Not an AWS client (e.g. JIRA): every call goes through its rate limiter
+            metrics = {'ApiCalls': (rate_limiter_metrics[service]['calls'], 'Count')}
+        else:
+            continue
+        if service in rate_limiter_metrics:
+            metrics['ApiThrottles'] = (rate_limiter_metrics[service]['throttles'], 'Count')
+            metrics['RateLimiterWaitTime'] = (rate_limiter_metrics[service]['waitTime'], 'Seconds')
+        documents.append(get_emf_document({'FunctionName': function_name, 'Service': service}, metrics))
+
+    for cache, (hits, misses) in cache_lookups.items():
+        metrics = {'CacheHits': (hits, 'Count'), 'CacheMisses': (misses, 'Count')}
+        if hits + misses:
+            metrics['CacheHitRate'] = (round(100.0 * hits / (hits + misses), 2), 'Percent')
+        documents.append(get_emf_document({'FunctionName': function_name, 'Cache': cache}, metrics))
+
+    # EMF documents must be log events of their own, not formatted by the logger
+    for document in documents:
+        print(json.dumps(document))
+
+# Function to run a function for each arguments tuple in a bounded thread pool. Results keep the order of the arguments.
+def run_concurrently(function, arguments_list):
+    if MAX_WORKERS <= 1 or len(arguments_list) <= 1:
+        return [function(*arguments) for arguments in arguments_list]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(arguments_list))) as executor:
+        return list(executor.map(lambda arguments: function(*arguments), arguments_list))
+
+# Function to return the account id of the Lambda function, retrieved once per container
+def get_caller_account_id():
+    if 'Account' not in caller_identity:
+        caller_identity.update(get_client('sts').get_caller_identity())
+    return caller_identity['Account']
+
+# Function to return a client of a workload account from the pool.
+# The role of other workload accounts is assumed again shortly before the credentials expire. Until then, the session
+# and its clients are reused. A session per account is used, as the default boto3 session is not thread safe.
+def get_workload_account_client(account_id, service, region=None):
+    with workload_account_pool_lock:
+        pool_entry = workload_account_pool.setdefault(account_id, {'lock': threading.Lock(), 'session': None, 'expiration': None, 'clients': {}})
+
+    with pool_entry['lock']:
+        if pool_entry['session'] == None or (pool_entry['expiration'] != None and pool_entry['expiration'] - time.time() < CREDENTIALS_REFRESH_MARGIN):
+            # Only assume role for reviewing workload resources in other accounts
+            if account_id == get_caller_account_id():
+                pool_entry['session'] = boto3.session.Session()
+                pool_entry['expiration'] = None
+            else:
+                logger.info(f'Assuming role of Account: {account_id}')
+                assumed_role_credentials = call_with_concurrency_limit('sts', assume_workload_account_role, account_id)
+                pool_entry['session'] = boto3.session.Session(
+                    aws_access_key_id=assumed_role_credentials['AccessKeyId'],
+                    aws_secret_access_key=assumed_role_credentials['SecretAccessKey'],
+                    aws_session_token=assumed_role_credentials['SessionToken']
+                )
+                pool_entry['expiration'] = assumed_role_credentials['Expiration'].timestamp()
+            pool_entry['clients'] = {}
+
+        client_key = service if region == None else service + '#' + region
+        if client_key not in pool_entry['clients']:
+            pool_entry['clients'][client_key] = instrument_client(pool_entry['session'].client(service, region_name=region, config=get_client_config(service)))
+
+        return pool_entry['clients'][client_key]
+
 # Assume Role of Workload Account
 def assume_workload_account_role(account_id):
     workload_account_role = 'arn:aws:iam::' + account_id + ':role/' + WORKLOAD_ACCOUNT_ROLE_NAME
-    assumed_role_credentials = sts_client.assume_role(
+    assumed_role_credentials = get_client('sts').assume_role(
         RoleArn=workload_account_role,
         RoleSessionName='workload-account-role'
     )['Credentials']
     return assumed_role_credentials
 
+# Function to return the JIRA API token stored in the SSM encrypted parameter, read again once JIRA_SECRET_TTL expires
+def get_jira_secret():
+    if jira_connection['secretExpiresAt'] <= time.time():
+        get_parameter_response = call_api('ssm', get_client('ssm').get_parameter, Name=JIRA_SECRET_SSM_PARAM, WithDecryption=True)
+        jira_connection['secret'] = str(get_parameter_response['Parameter']['Value'])
+        jira_connection['secretExpiresAt'] = time.time() + JIRA_SECRET_TTL
+    return jira_connection['secret']
+
+# Function to return the JIRA client, created on first use. Its HTTP session is reused until the API token changes.
+def get_jira_client():
+    from jira import JIRA
+
+    # Worker threads creating or updating issues concurrently share the client
+    with jira_connection_lock:
+        jira_secret = get_jira_secret()
+        if jira_connection['client'] == None or jira_connection['client_secret'] != jira_secret:
+            logger.info('Connecting to JIRA')
+            jira_options = {'server': JIRA_URL}
+            # call_jira retries the throttled calls within the JIRA rate limit, the client does not retry them itself
+            jira_connection['client'] = JIRA(options=jira_options, basic_auth=(JIRA_USERNAME,jira_secret), max_retries=0)
+            jira_connection['client_secret'] = jira_secret
+        return jira_connection['client']
+
+# Function to call a JIRA client method (e.g. 'create_issue') within the JIRA rate limit. If JIRA rejects the credentials (401),
+# the API token is read again from SSM and the call is retried once with a new client.
+def call_jira(method, *args, **kwargs):
+    from jira import JIRAError
+
+    try:
+        return call_api('jira', getattr(get_jira_client(), method), *args, **kwargs)
+    except JIRAError as e:
+        if e.status_code != 401:
+            raise
+        logger.info('JIRA rejected the credentials. Reading the JIRA API token again')
+        jira_connection['client'] = None
+        jira_connection['secretExpiresAt'] = 0
+        return call_api('jira', getattr(get_jira_client(), method), *args, **kwargs)
+
 # Function to query the dynamodb table
 def ddb_query_entries(ticketHeaderKey):
-    response = DDB_TABLE.query(
-        KeyConditionExpression=Key('ticketHeaderKey').eq(ticketHeaderKey)
-    )
-    return response['Items']
-
-# Function to add an entry to the dynamodb table
-def ddb_put_entry(ticketId, ticketType, creationDate, updateDate, ticketHeaderKey, ticketContentKey, workloadId, lensAlias, questionId, bestPracticeId, workloadName, bestPracticeName, pillarId, pillarQuestion):
-    response = DDB_TABLE.put_item(
-       Item={
-            'ticketId': ticketId,
-            'ticketType': ticketType,
-            'creationDate': creationDate,
-            'updateDate': updateDate,
-            'ticketHeaderKey': ticketHeaderKey,
-            'ticketContentKey': ticketContentKey,
-            'workloadId': workloadId,
-            'lensAlias': lensAlias,
-            'questionId': questionId,
-            'bestPracticeId': bestPracticeId,
-            'workloadName': workloadName,
-            'bestPracticeName': bestPracticeName,
-            'pillarId': pillarId,
-            'pillarQuestion': pillarQuestion
-        }
-    )
-    return response
-
-# Function to update an entry in the dynamodb table
-def ddb_update_entry(ticketHeaderKey, creationDate, updateDate, ticketContentKey):
-    response = DDB_TABLE.update_item(
-        Key={
-            'ticketHeaderKey': ticketHeaderKey,
-            'creationDate': creationDate
-        },
-        UpdateExpression="set #u=:u, #t=:t",
-        ExpressionAttributeValues={
-            ':u': updateDate,
-            ':t': ticketContentKey
-        },
-        ExpressionAttributeNames={
-            '#u': 'updateDate',
-            '#t': 'ticketContentKey'
-        },
-        ReturnValues="UPDATED_NEW"
+    response = get_client('dynamodb').query(
+        TableName=DDB_TABLE,
+        KeyConditionExpression='ticketHeaderKey = :k',
+        ExpressionAttributeValues={':k': {'S': ticketHeaderKey}}
     )
-    return response
+    return [ddb_deserialize(item) for item in response['Items']]
+
+# Function to compute the key of the DDB entry pointing to the entry of a ticket. The creationDate sort key of a ticket entry is only
+# known once the entry has been read, the pointer (ticketHeaderKey, 'state') holds it so that ticket entries can be read with BatchGetItem.
+def get_ticket_pointer_key(ticketHeaderKey):
+    return {'ticketHeaderKey': ticketHeaderKey, 'creationDate': STATE_ENTRY_SORT_KEY}
 
-def get_workload_resources(assumed_role_credentials):
-    resources = {"resource_arns":[], "resource_names":[]}
+# Function to build the pointer entry of a ticket entry
+def new_ticket_pointer(item):
+    pointer = get_ticket_pointer_key(item['ticketHeaderKey'])
+    pointer['ticketCreationDate'] = item['creationDate']
+    return pointer
 
-    if assumed_role_credentials != None:
-        resource_group_client_workload_account = boto3.client(
-            'resourcegroupstaggingapi',
-            aws_access_key_id=assumed_role_credentials['AccessKeyId'],
-            aws_secret_access_key=assumed_role_credentials['SecretAccessKey'],
-            aws_session_token=assumed_role_credentials['SessionToken']
+# Function to return whether the migration of the ticket entries is completed (see migrate_ticket_entries)
+def is_ticket_entries_migration_completed():
+    if not ticket_entries_migration['completed']:
+        get_item_response = get_client('dynamodb').get_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize({'ticketHeaderKey': TICKET_ENTRIES_MIGRATION_KEY, 'creationDate': STATE_ENTRY_SORT_KEY})
         )
+        ticket_entries_migration['completed'] = 'completedAt' in ddb_deserialize(get_item_response.get('Item', {}))
+    return ticket_entries_migration['completed']
+
+# Function to load the state of every ticket of the run from the dynamodb table, indexed by ticketHeaderKey.
+# The pointers of the tickets are read first, then the entries they point to, both with BatchGetItem. A pointer whose entry no longer
+# exists (the ticket was resolved) is ignored. Once the ticket entries are migrated, a ticket without a pointer is a new ticket. Until then,
+# tickets without a pointer may have an entry recorded before the pointers existed: they are looked up with queries running
+# concurrently, and the entries found get their pointer.
+@timed_stage
+def ddb_load_ticket_states(ticketHeaderKeys):
+    ticketHeaderKeys = list(dict.fromkeys(ticketHeaderKeys))
+    ticket_states = {'entries': {}, 'pendingWrites': {}, 'newEntries': set()}
+
+    pointers = ddb_batch_get_entries([get_ticket_pointer_key(ticketHeaderKey) for ticketHeaderKey in ticketHeaderKeys])
+    for item in ddb_batch_get_entries([{'ticketHeaderKey': pointer['ticketHeaderKey'], 'creationDate': pointer['ticketCreationDate']} for pointer in pointers]):
+        ticket_states['entries'][item['ticketHeaderKey']] = item
+
+    pointed_ticketHeaderKeys = set(pointer['ticketHeaderKey'] for pointer in pointers)
+    unpointed_ticketHeaderKeys = [ticketHeaderKey for ticketHeaderKey in ticketHeaderKeys if ticketHeaderKey not in pointed_ticketHeaderKeys]
+    queried_ticketHeaderKeys = [] if is_ticket_entries_migration_completed() else unpointed_ticketHeaderKeys
+    query_responses = run_concurrently(ddb_query_entries, [(ticketHeaderKey,) for ticketHeaderKey in queried_ticketHeaderKeys])
+    for ticketHeaderKey, items in zip(queried_ticketHeaderKeys, query_responses):
+        items = [item for item in items if item['creationDate'] != STATE_ENTRY_SORT_KEY]
+        if items:
+            ticket_states['entries'][ticketHeaderKey] = items[0]
+            pointer = new_ticket_pointer(items[0])
+            ticket_states['pendingWrites'][(pointer['ticketHeaderKey'], pointer['creationDate'])] = pointer
+
+    record_cache_lookups('TicketPointers', len(pointers), len(unpointed_ticketHeaderKeys))
+    logger.info(f'Loaded {len(ticket_states["entries"])} existing entries from DDB for {len(ticketHeaderKeys)} tickets ({len(unpointed_ticketHeaderKeys)} tickets without pointer, {len(queried_ticketHeaderKeys)} queried)')
+    return ticket_states
+
+# Function to add an entry to the dynamodb table. The entry is written by ddb_flush_entries.
+def ddb_put_entry(ticket_states, ticketId, ticketType, creationDate, updateDate, ticketHeaderKey, ticketContentKey, workloadId, lensAlias, lensVersion, questionId, bestPracticeId, workloadName, bestPracticeName, pillarId, pillarQuestion, flaggedResourceKeys):
+    item = {
+        'ticketId': ticketId,
+        'ticketType': ticketType,
+        'creationDate': creationDate,
+        'updateDate': updateDate,
+        'ticketHeaderKey': ticketHeaderKey,
+        'ticketContentKey': ticketContentKey,
+        'workloadId': workloadId,
+        'lensAlias': lensAlias,
+        'lensVersion': lensVersion,
+        'questionId': questionId,
+        'bestPracticeId': bestPracticeId,
+        'workloadName': workloadName,
+        'bestPracticeName': bestPracticeName,
+        'pillarId': pillarId,
+        'pillarQuestion': pillarQuestion
+    }
+    set_entry_flagged_resource_keys(item, flaggedResourceKeys)
+    ticket_states['entries'][ticketHeaderKey] = item
+    ticket_states['pendingWrites'][(ticketHeaderKey, creationDate)] = item
+    ticket_states['newEntries'].add((ticketHeaderKey, creationDate))
+    return item
+
+# Function to update an entry in the dynamodb table. BatchWriteItem only supports puts, so the whole entry is written again by ddb_flush_entries.
+def ddb_update_entry(ticket_states, ticketHeaderKey, updateDate, ticketContentKey, flaggedResourceKeys):
+    item = dict(ticket_states['entries'][ticketHeaderKey])
+    item['updateDate'] = updateDate
+    item['ticketContentKey'] = ticketContentKey
+    set_entry_flagged_resource_keys(item, flaggedResourceKeys)
+    ticket_states['entries'][ticketHeaderKey] = item
+    ticket_states['pendingWrites'][(ticketHeaderKey, item['creationDate'])] = item
+    return item
+
+# Function to read entries by primary key from the dynamodb table with BatchGetItem (100 keys per call), retrying unprocessed keys with backoff
+def ddb_batch_get_entries(keys):
+    items = []
+
+    for i in range(0, len(keys), DDB_BATCH_GET_SIZE):
+        request_items = {DDB_TABLE: {'Keys': [ddb_serialize(key) for key in keys[i:i + DDB_BATCH_GET_SIZE]]}}
+        retries = 0
+        while request_items:
+            response = get_client('dynamodb').batch_get_item(RequestItems=request_items)
+            items += [ddb_deserialize(item) for item in response['Responses'].get(DDB_TABLE, [])]
+            request_items = response.get('UnprocessedKeys')
+            if request_items:
+                retries += 1
+                if retries > DDB_BATCH_MAX_RETRIES:
+                    raise Exception(f'Unable to read {len(request_items[DDB_TABLE]["Keys"])} entries from DDB after {DDB_BATCH_MAX_RETRIES} retries')
+                time.sleep(min(0.05 * 2 ** retries, 5))
+
+    return items
+
+# Function to compute the key of the DDB entry recording the state of a TA Check in a workload account
+def get_ta_check_state_key(account_id, check_id):
+    return {'ticketHeaderKey': 'tacheck#' + account_id + '#' + check_id, 'creationDate': STATE_ENTRY_SORT_KEY}
+
+# Function to load the recorded TA Check states, indexed by (account id, check id)
+def ddb_load_ta_check_states(account_ids, ta_check_ids):
+    items = ddb_batch_get_entries([get_ta_check_state_key(account_id, check_id) for account_id in account_ids for check_id in ta_check_ids])
+    return {(item['accountId'], item['checkId']): item for item in items}
+
+# Function to record the state of a TA Check in a workload account. The entry is written by ddb_flush_entries.
+def ddb_put_ta_check_state(ticket_states, account_id, check_id, ta_check_result):
+    item = get_ta_check_state_key(account_id, check_id)
+    item.update({
+        'accountId': account_id,
+        'checkId': check_id,
+        'taTimestamp': ta_check_result['timestamp'],
+        'inventoryDigest': ta_check_result['inventoryDigest'],
+        'flaggedResourcesDigest': ta_check_result['flaggedResourcesDigest'],
+        'flaggedResourcesCount': ta_check_result['flaggedResourcesCount'],
+        'expiresAt': int(time.time()) + TA_CHECK_STATE_TTL
+    })
+    ticket_states['pendingWrites'][(item['ticketHeaderKey'], item['creationDate'])] = item
+    return item
+
+# Function to compute the key of the DDB entry recording the metadata of a question in a lens version
+def get_lens_metadata_key(lensAlias, lensVersion, questionId):
+    return {'ticketHeaderKey': LENS_METADATA_KEY_PREFIX + lensAlias + '#' + lensVersion + '#' + questionId, 'creationDate': STATE_ENTRY_SORT_KEY}
+
+# Function to record the metadata of a question in a lens version. The entry is written by ddb_flush_entries.
+def ddb_put_lens_metadata(ticket_states, item):
+    ticket_states['pendingWrites'][(item['ticketHeaderKey'], item['creationDate'])] = item
+    return item
+
+# Function to record in an entry the number of flagged resources and, up to MAX_RECORDED_FLAGGED_RESOURCE_KEYS, their keys mapped to
+# the readable identifier of their resource. Entries recorded before the identifiers hold the list of the keys (flaggedResourceKeys).
+def set_entry_flagged_resource_keys(item, flaggedResourceKeys):
+    item['flaggedResourcesCount'] = len(flaggedResourceKeys)
+    item.pop('flaggedResourceKeys', None)
+    if len(flaggedResourceKeys) <= MAX_RECORDED_FLAGGED_RESOURCE_KEYS:
+        item['flaggedResourceLabels'] = dict(flaggedResourceKeys)
     else:
-        resource_group_client_workload_account = boto3.client(
-            'resourcegroupstaggingapi'
+        item.pop('flaggedResourceLabels', None)
+
+# Function to return the key of the DDB entry counting the open tickets of a BP in a workload lens question
+def get_open_tickets_counter_key(workloadId, lensAlias, questionId, bestPracticeId):
+    return {'ticketHeaderKey': 'opentickets#' + workloadId + '#' + lensAlias + '#' + questionId + '#' + bestPracticeId, 'creationDate': STATE_ENTRY_SORT_KEY}
+
+# Function to count the entries of the open tickets of a BP in a workload lens question. 'bestPracticeId-index' only projects the
+# entry keys, so the entries of the BP in every workload, lens and question are read with BatchGetItem to keep the matching ones.
+# Only used until the ticket entries are migrated (see migrate_ticket_entries).
+def ddb_count_open_tickets(workloadId, lensAlias, questionId, bestPracticeId):
+    query_kwargs = {
+        'TableName': DDB_TABLE,
+        'IndexName': 'bestPracticeId-index',
+        'KeyConditionExpression': 'bestPracticeId = :k',
+        'ExpressionAttributeValues': {':k': {'S': bestPracticeId}},
+        'ProjectionExpression': 'ticketHeaderKey, creationDate'
+    }
+    keys = []
+    while True:
+        response = get_client('dynamodb').query(**query_kwargs)
+        keys += [ddb_deserialize(item) for item in response['Items']]
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return len([item for item in ddb_batch_get_entries(keys) if (item['workloadId'], item['lensAlias'], item['questionId']) == (workloadId, lensAlias, questionId)])
+
+# Function to set the open ticket counter of a BP, unless it already exists
+def ddb_seed_open_tickets(bp, openTickets):
+    try:
+        get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize(get_open_tickets_counter_key(*bp)),
+            UpdateExpression='SET openTickets = :o',
+            ConditionExpression='attribute_not_exists(openTickets)',
+            ExpressionAttributeValues=ddb_serialize({':o': openTickets})
         )
-    paginator = resource_group_client_workload_account.get_paginator('get_resources')
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        pass
+
+# Function to write new entries to the dynamodb table with transactions that also write their pointers (see get_ticket_pointer_key) and
+# increment the open ticket counters of their BPs, so that a counter never misses a ticket that was recorded. Once the ticket entries
+# are migrated, a missing counter starts from 0. Until then, a counter created for a BP that may have tickets recorded before the
+# counters existed starts from the number of their entries.
+def ddb_put_new_entries(items):
+    # Open ticket counter of each entry, and the BP it counts the tickets of
+    counters = {}
+    for item in items:
+        bp = (item['workloadId'], item['lensAlias'], item['questionId'], item['bestPracticeId'])
+        counters.setdefault(get_open_tickets_counter_key(*bp)['ticketHeaderKey'], bp)
+
+    seeds = {}
+    if items and not is_ticket_entries_migration_completed():
+        existing_counters = set(counter['ticketHeaderKey'] for counter in ddb_batch_get_entries([get_open_tickets_counter_key(*bp) for bp in counters.values()]))
+        seeds = {counterKey: ddb_count_open_tickets(*bp) for counterKey, bp in counters.items() if counterKey not in existing_counters}
+
+    for i in range(0, len(items), DDB_TRANSACTION_ENTRIES):
+        chunk = items[i:i + DDB_TRANSACTION_ENTRIES]
+        increments = {}
+        for item in chunk:
+            counterKey = get_open_tickets_counter_key(item['workloadId'], item['lensAlias'], item['questionId'], item['bestPracticeId'])['ticketHeaderKey']
+            increments[counterKey] = increments.get(counterKey, 0) + 1
+
+        transact_items = [{'Put': {'TableName': DDB_TABLE, 'Item': ddb_serialize(item)}} for item in chunk]
+        transact_items += [{'Put': {'TableName': DDB_TABLE, 'Item': ddb_serialize(new_ticket_pointer(item))}} for item in chunk]
+        for counterKey, increment in increments.items():
+            transact_items.append({'Update': {
+                'TableName': DDB_TABLE,
+                'Key': ddb_serialize(get_open_tickets_counter_key(*counters[counterKey])),
+                'UpdateExpression': 'SET openTickets = if_not_exists(openTickets, :seed) + :n',
+                'ExpressionAttributeValues': ddb_serialize({':seed': seeds.pop(counterKey, 0), ':n': increment})
+            }})
+        get_client('dynamodb').transact_write_items(TransactItems=transact_items)
+
+    if items:
+        logger.info(f'Recorded {len(items)} new entries in DDB and incremented {len(counters)} open ticket counters')
+
+# Function to write the pending entries to the dynamodb table. New entries are written with their open ticket counters
+# (see ddb_put_new_entries), the others with BatchWriteItem (25 entries per call), retrying unprocessed entries with backoff.
+@timed_stage
+def ddb_flush_entries(ticket_states):
+    new_items = [item for key, item in ticket_states['pendingWrites'].items() if key in ticket_states['newEntries']]
+    write_requests = [{'PutRequest': {'Item': ddb_serialize(item)}} for key, item in ticket_states['pendingWrites'].items() if key not in ticket_states['newEntries']]
+    ticket_states['pendingWrites'] = {}
+    ticket_states['newEntries'] = set()
+    batch_calls = 0
+
+    ddb_put_new_entries(new_items)
 
-    if SCAN_ALL:
-        response_iterator = paginator.paginate()
-    elif not SCAN_ALL:
-        response_iterator = paginator.paginate(TagFilters=[
+    for i in range(0, len(write_requests), DDB_BATCH_WRITE_SIZE):
+        request_items = {DDB_TABLE: write_requests[i:i + DDB_BATCH_WRITE_SIZE]}
+        retries = 0
+        while request_items:
+            response = get_client('dynamodb').batch_write_item(RequestItems=request_items)
+            batch_calls += 1
+            request_items = response.get('UnprocessedItems')
+            if request_items:
+                retries += 1
+                if retries > DDB_BATCH_MAX_RETRIES:
+                    raise Exception(f'Unable to write {len(request_items[DDB_TABLE])} entries to DDB after {DDB_BATCH_MAX_RETRIES} retries')
+                logger.info(f'Retrying {len(request_items[DDB_TABLE])} unprocessed DDB entries')
+                time.sleep(min(0.05 * 2 ** retries, 5))
+
+    if write_requests:
+        logger.info(f'Recorded {len(write_requests)} entries in DDB with {batch_calls} batch calls')
+
+# Function to list the workload resources of an account in one region
+@timed_stage
+def get_workload_resources(account_id, region):
+    resource_group_client_workload_account = get_workload_account_client(account_id, 'resourcegroupstaggingapi', region)
+    # Hash sets, so that matching a flagged resource against the inventory does not scan it.
+    resources = {"resource_arns":set(), "resource_names":set()}
+
+    get_resources_kwargs = {}
+    if not SCAN_ALL:
+        get_resources_kwargs['TagFilters'] = [
                 {
                     'Key': TAG_KEY,
                     'Values': [
                         TAG_VALUE,
                     ]
                 },
-            ])
+            ]
 
-    for page in response_iterator:
+    # Pages are retrieved one at a time, so that each call is rate limited and a throttled page is retried on its own.
+    while True:
+        page = call_api('resourcegroupstaggingapi', resource_group_client_workload_account.get_resources, **get_resources_kwargs)
         for resource in page['ResourceTagMappingList']:
-            resources["resource_arns"].append(resource['ResourceARN'])
-            resources["resource_names"].append(resource['ResourceARN'].split(':')[-1])
+            resources["resource_arns"].add(resource['ResourceARN'])
+            resources["resource_names"].add(resource['ResourceARN'].split(':')[-1])
+        if not page.get('PaginationToken'):
+            break
+        get_resources_kwargs['PaginationToken'] = page['PaginationToken']
+
+    return resources
+
+# Function to build the workload resource inventory of an account from its region partitions. The inventory keeps the resources
+# of each region in a partition of its own ("regions", indexed by region name), next to the hash sets of all regions.
+def merge_workload_resources(regions, partitions):
+    resources = {"resource_arns":set(), "resource_names":set(), "regions":{}}
+    for region, partition in zip(regions, partitions):
+        resources["regions"][region or os.environ.get('AWS_REGION', '')] = partition
+        resources["resource_arns"].update(partition["resource_arns"])
+        resources["resource_names"].update(partition["resource_names"])
+
+    # Digest of the inventory, so that a TA Check result is matched again when the workload resources change.
+    resources["digest"] = hashlib.blake2b('\n'.join(sorted(resources["resource_arns"])).encode(), digest_size=16).hexdigest()
 
     return resources
 
+# Function to return the workload resource inventory of each account, listing the account resources only once per TTL.
+# The (account, region) pairs to list are submitted to a single pool, so that at most MAX_WORKERS listings run at a time.
+def get_accounts_workload_resources(account_ids):
+    workload_resources = {}
+    for account_id in account_ids:
+        cached_resources = workload_resources_cache.get(account_id)
+        if cached_resources and cached_resources['expiresAt'] > time.time():
+            workload_resources[account_id] = cached_resources['resources']
+    listed_account_ids = [account_id for account_id in account_ids if account_id not in workload_resources]
+    record_cache_lookups('WorkloadResources', len(workload_resources), len(listed_account_ids))
+    if not listed_account_ids:
+        return workload_resources
+
+    regions = INVENTORY_REGIONS or [None]
+    logger.info(f'Listing workload resources in {len(regions)} regions for Accounts: {listed_account_ids}')
+    partitions = run_concurrently(get_workload_resources, [(account_id, region) for account_id in listed_account_ids for region in regions])
+
+    for index, account_id in enumerate(listed_account_ids):
+        resources = merge_workload_resources(regions, partitions[index * len(regions):(index + 1) * len(regions)])
+        workload_resources_cache[account_id] = {'resources': resources, 'expiresAt': time.time() + WORKLOAD_RESOURCES_TTL}
+        workload_resources[account_id] = resources
+        logger.info(f'Found {len(resources["resource_arns"])} workload resources in {len(resources["regions"])} regions for Account: {account_id}')
+
+    return workload_resources
+
 def get_unselected_choices(answer):
     selected_choices = answer['SelectedChoices']
 
@@ -151,7 +991,8 @@ def get_unselected_choices(answer):
         all_choices.append({'choiceId': choice['ChoiceId'], 'title': choice['Title']})
     
     not_applicable_choices = []
-    for choice in answer['ChoiceAnswers']:
+    # get_answer returns ChoiceAnswers, list_answers returns ChoiceAnswerSummaries
+    for choice in answer.get('ChoiceAnswers', answer.get('ChoiceAnswerSummaries', [])):
         if choice['Status'] in ['NOT_APPLICABLE']:
             not_applicable_choices.append(choice['ChoiceId'])
 
@@ -169,305 +1010,1291 @@ def get_bp_ta_check_ids_list(check_details):
         bp_ta_check_ids_list.append(check['Id'])
     return bp_ta_check_ids_list
 
-def get_ta_check_summary(bp_ta_check_ids_list):
-    bp_ta_checks = []
-    ta_checks_list = ta_client.describe_trusted_advisor_checks(
+# Function to download the TA Check catalog and index it by check id.
+# The recommendation URLs are parsed from the check description only once per check.
+def build_ta_check_catalog():
+    catalog = {}
+    ta_checks_list = call_api('support', get_client('support').describe_trusted_advisor_checks,
         language='en'
     )['checks']
 
-    filtered_ta_checks_list = [d for d in ta_checks_list if 'id' in d and d['id'] in bp_ta_check_ids_list]
-
-    for check in filtered_ta_checks_list:
+    for check in ta_checks_list:
+        if 'id' not in check:
+            continue
         ta_urls = [d for d in re.split('href="|" target=', check['description']) if d.startswith('https')]
-        bp_ta_checks.append({'id': check['id'], 'name': check['name'], 'taRecommedationUrls': ta_urls, 'metadataOrder': check['metadata']})
+        catalog[check['id']] = {'id': check['id'], 'name': check['name'], 'taRecommedationUrls': ta_urls, 'metadataOrder': check['metadata']}
+
+    return catalog
+
+# Function to read the TA Check catalog persisted in /tmp. /tmp survives a runtime restart within the same execution environment.
+def load_persisted_ta_check_catalog():
+    try:
+        with open(TA_CHECK_CATALOG_FILE) as catalog_file:
+            persisted_catalog = json.load(catalog_file)
+    except (OSError, ValueError):
+        return None
+
+    if persisted_catalog.get('expiresAt', 0) > time.time():
+        return persisted_catalog
+    return None
+
+# Function to persist the TA Check catalog in /tmp. The catalog is written to a temporary file of this process first, so that
+# a reader never sees a partial catalog.
+def persist_ta_check_catalog(catalog):
+    tmp_file = TA_CHECK_CATALOG_FILE + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmp_file, 'w') as catalog_file:
+            json.dump(catalog, catalog_file)
+        os.replace(tmp_file, TA_CHECK_CATALOG_FILE)
+    except OSError as e:
+        logger.warning(f'Unable to persist TA Check catalog to {TA_CHECK_CATALOG_FILE}. Exception: {e}')
+
+# Function to return the TA Check catalog, refreshing it once the TTL expires. Worker threads finding the catalog expired
+# wait for the one refreshing it, so that the catalog is only downloaded once.
+def get_ta_check_catalog():
+    if ta_check_catalog['expiresAt'] > time.time():
+        record_cache_lookups('TACheckCatalog', 1, 0)
+        return ta_check_catalog['checks']
+
+    with ta_check_catalog_lock:
+        if ta_check_catalog['expiresAt'] > time.time():
+            record_cache_lookups('TACheckCatalog', 1, 0)
+            return ta_check_catalog['checks']
+        record_cache_lookups('TACheckCatalog', 0, 1)
+
+        persisted_catalog = load_persisted_ta_check_catalog()
+        if persisted_catalog:
+            logger.info('Loaded TA Check catalog from ' + TA_CHECK_CATALOG_FILE)
+            checks, expiresAt = persisted_catalog['checks'], persisted_catalog['expiresAt']
+        else:
+            logger.info('Refreshing TA Check catalog')
+            checks, expiresAt = build_ta_check_catalog(), time.time() + TA_CHECK_CATALOG_TTL
+            persist_ta_check_catalog({'checks': checks, 'expiresAt': expiresAt})
+
+        # The metadata column order is shared by every TACheck instance and every result of the TA Check
+        for catalog_entry in checks.values():
+            catalog_entry['metadataOrder'] = tuple(catalog_entry['metadataOrder'])
+
+        # The new catalog is only published once complete, threads reading it without the lock never see it partially built
+        ta_check_catalog['checks'] = checks
+        ta_check_catalog['expiresAt'] = expiresAt
+
+    return ta_check_catalog['checks']
+
+@timed_stage
+def get_ta_check_summary(bp_ta_check_ids_list):
+    ta_checks_catalog = get_ta_check_catalog()
+
+    # A new TACheck is returned for each catalog entry, as the caller adds the flagged resources of an account to it.
+    bp_ta_checks = [TACheck(ta_checks_catalog[check_id]) for check_id in bp_ta_check_ids_list if check_id in ta_checks_catalog]
 
     return bp_ta_checks
 
-def add_flagged_resources(bp_ta_checks, workload_resources, assumed_role_credentials = None):
-    workload_resources = get_workload_resources(assumed_role_credentials)
+# Function to match a TA flagged resource against the workload resources.
+# The flagged resource metadata is turned into a set and intersected with the inventory hash sets, keeping the
+# arn -> name -> non resource specific TA Check precedence. Returns the rule that matched or None.
+# Flagged resources of a region listed in the inventory are only matched against the resources of that region, the others
+# (no Region column, global resources) against the resources of every region.
+def match_flagged_resource(flagged_resource, check_id, workload_resources, region_column=None):
+    flagged_metadata = set(flagged_resource['metadata'])
+    if region_column != None and region_column < len(flagged_resource['metadata']):
+        workload_resources = workload_resources["regions"].get(flagged_resource['metadata'][region_column], workload_resources)
 
-    if assumed_role_credentials != None:
-        ta_client_workload_account = boto3.client(
-            'support',
-            aws_access_key_id=assumed_role_credentials['AccessKeyId'],
-            aws_secret_access_key=assumed_role_credentials['SecretAccessKey'],
-            aws_session_token=assumed_role_credentials['SessionToken']
-        )
-    else:
-        ta_client_workload_account = boto3.client(
-            'support'
-        )
-    for check in bp_ta_checks:
-        check['flaggedResources'] = []
-        # Retrieving results for the specific TA Check.
-        check_result = ta_client_workload_account.describe_trusted_advisor_check_result(
-            checkId=check['id'],
-            language='en'
-        )['result']
-        # Adding only flagged resources related to the workload that are in 'warning' or 'error' TA status.
-        if check_result['status'] in ['warning', 'error']:
-            for flagged_resource in check_result['flaggedResources']:
-                if flagged_resource['status'] in ['warning', 'error'] and any(x in flagged_resource['metadata'] for x in workload_resources["resource_arns"]):
-                    check['flaggedResources'].append(flagged_resource)
-
-                elif flagged_resource['status'] in ['warning', 'error'] and any(x in flagged_resource['metadata'] for x in workload_resources["resource_names"]):
-                    check['flaggedResources'].append(flagged_resource)
-
-                elif flagged_resource['status'] in ['warning', 'error'] and check_result['checkId'] in NON_RESOURCE_SPECIFIC_TA_CHECKS:
-                    check['flaggedResources'].append(flagged_resource)
-
-    return(bp_ta_checks)
-
-def flagged_resource_formatter(check_flagged):
-    flagged_resources_list = []
-    for resource in check_flagged['flaggedResources']:
-        i = 0
-        flagged_resource = {}
-        for metadata in resource['metadata']:
-            flagged_resource[check_flagged['metadataOrder'][i]] = metadata
-            i+=1
-        flagged_resources_list.append(flagged_resource)
-
-    return (flagged_resources_list)
-
-def create_ops_item(answer, choice, bp_ta_checks, WORKLOAD_ID, LENS_ALIAS, account_id, workload_name):
-    # Filter out any TA Check for which there were no flagged resources.
-    bp_ta_checks_flagged = [d for d in bp_ta_checks if len(d['flaggedResources']) > 0]
+    if not flagged_metadata.isdisjoint(workload_resources["resource_arns"]):
+        return 'arn'
+    elif not flagged_metadata.isdisjoint(workload_resources["resource_names"]):
+        return 'name'
+    elif check_id in NON_RESOURCE_SPECIFIC_TA_CHECKS:
+        return 'check'
 
-    # If there are any TA Check with flagged resources, proceed to create or update the OpsItem. If not omit the create/update.
-    if len(bp_ta_checks_flagged) > 0:
-        for check_flagged in bp_ta_checks_flagged:
-            logger.info(f'Processing Best Practice: {choice["choiceId"]}, and Trusted Advisor check: {check_flagged["name"]}')
-
-            imp_guid_web = WA_WEB_URL + choice['choiceId'] + WA_WEB_ANCHOR
-            check_flagged['workloadId'] = WORKLOAD_ID
-            check_flagged['pillarId'] = answer['PillarId'],
-            check_flagged['questionTitle'] = answer['QuestionTitle']
-            check_flagged['risk'] = answer['Risk']
-            check_flagged['bestPracticeTitle'] = choice['title']
-            check_flagged['implementationGuide'] = imp_guid_web
-            flagged_resources_list = flagged_resource_formatter(check_flagged)
-
-            ops_item_description = ("*AWS Account ID:* " + account_id + "\n*AWS Well-Architected related information:*\nWorkload Name: " + workload_name +
-                "\nWorkload Id: " + WORKLOAD_ID +
-                "\nPillar Id: " + answer['PillarId'] +
-                "\nQuestion: " + answer['QuestionTitle'] +
-                "\nQuestion Risk Identified: " + answer['Risk'] +
-                "\nBest Practice: " + choice['title'] +
-                "\n\n*AWS Trusted Advisor (TA) related information:*" + 
-                "\nTA Check Id: " + check_flagged['id'] +
-                "\nTA Check Name: " + check_flagged['name'] +
-                "\n\n*Raw data with resources affected:*" + 
-                "\nFlagged Resources (" + str(len(check_flagged['flaggedResources'])) + "):\n " + json.dumps(flagged_resources_list, indent = 3) + 
-                "\n\n*Useful link for resolution:*" +
-                "\nWell-Architected Implementation Guidance links:\n[" + imp_guid_web + "]" +
-                "\n\nTrusted Advisor useful links:\n" + json.dumps(check_flagged['taRecommedationUrls'], indent = 3)
-            )
+    return None
 
-            operation_data = []
-            for resource in flagged_resources_list:
-                if 'Resource' in resource:
-                    operation_data.append({'arn': resource['Resource']})
+# Function to compute the union of the TA Checks of the BPs (choices) of the questions processed.
+# Returns the unique TA Check ids and the number of BP <--> TA Check pairs they cover.
+def get_unique_ta_check_ids(question_choices):
+    ta_checks_catalog = get_ta_check_catalog()
+    ta_check_ids = []
+    bp_ta_check_pairs = 0
 
-            operational_data_object = {
-                '/aws/resources': {
-                    'Value': json.dumps(operation_data),
-                    'Type': 'SearchableString'
-                },
-                'WorkloadId': {
-                    'Value': WORKLOAD_ID,
-                    'Type': 'SearchableString'
-                },
-                'BestPracticeId': {
-                    'Value': choice['choiceId'],
-                    'Type': 'SearchableString'
-                },
-                'Runbook': {
-                    'Value': imp_guid_web,
-                    'Type': 'SearchableString'
+    for answer, choice, bp_ta_check_ids_list in question_choices:
+        for check_id in bp_ta_check_ids_list:
+            if check_id in ta_checks_catalog:
+                bp_ta_check_pairs += 1
+                if check_id not in ta_check_ids:
+                    ta_check_ids.append(check_id)
+
+    return ta_check_ids, bp_ta_check_pairs
+
+# Function to retrieve a TA Check result for an account, keeping only the flagged resources related to the workload
+# that are in 'warning' or 'error' TA status, together with their fingerprint.
+@timed_stage
+def get_ta_check_result(account_id, check_id, workload_resources):
+    ta_client_workload_account = get_workload_account_client(account_id, 'support')
+
+    # Retrieving results for the specific TA Check.
+    check_result = call_api('support', ta_client_workload_account.describe_trusted_advisor_check_result,
+        checkId=check_id,
+        language='en'
+    )['result']
+
+    return new_ta_check_result(check_id, check_result['timestamp'], workload_resources, list(iter_workload_flagged_resources(check_result, workload_resources)))
+
+# Function to yield the flagged resources of a TA Check result related to the workload that are in 'warning' or 'error' TA status
+def iter_workload_flagged_resources(check_result, workload_resources):
+    if check_result['status'] not in ['warning', 'error']:
+        return
+    metadataOrder = get_ta_check_catalog()[check_result['checkId']]['metadataOrder']
+    region_column = metadataOrder.index('Region') if 'Region' in metadataOrder else None
+    for flagged_resource in check_result['flaggedResources']:
+        if flagged_resource['status'] in ['warning', 'error'] and match_flagged_resource(flagged_resource, check_result['checkId'], workload_resources, region_column):
+            yield FlaggedResource.from_ta_flagged_resource(flagged_resource)
+
+# Function to build the record of a retrieved TA Check result
+def new_ta_check_result(check_id, timestamp, workload_resources, flagged_resources):
+    flaggedResourceKeys, flaggedResourcesDigest = get_flagged_resources_fingerprint(flagged_resources, get_ta_check_catalog()[check_id]['metadataOrder'])
+    return {
+        'timestamp': timestamp,
+        'inventoryDigest': workload_resources['digest'],
+        'flaggedResources': flagged_resources,
+        'flaggedResourceKeys': flaggedResourceKeys,
+        'flaggedResourcesDigest': flaggedResourcesDigest,
+        'flaggedResourcesCount': len(flagged_resources),
+        'refreshed': True
+    }
+
+# Function to retrieve the TA refresh timestamp and status of TA Checks for an account with a single call, indexed by check id.
+# Returns None if the summaries cannot be retrieved (e.g. the workload account role does not allow it).
+def get_ta_check_summaries(account_id, ta_check_ids):
+    if not ta_check_ids:
+        return {}
+    ta_client_workload_account = get_workload_account_client(account_id, 'support')
+    try:
+        summaries = call_api('support', ta_client_workload_account.describe_trusted_advisor_check_summaries,
+            checkIds=ta_check_ids
+        )['summaries']
+    except Exception as e:
+        logger.warning(f'Unable to retrieve TA Check summaries for Account: {account_id}. Retrieving every TA Check result. Exception: {e}')
+        return None
+    return {summary['checkId']: summary for summary in summaries}
+
+# Function to retrieve each TA Check result once per workload account, running the accounts and TA Checks concurrently.
+# TA Checks not refreshed by TA since the last run, for an unchanged inventory, are not retrieved nor matched again: their record
+# only holds the recorded fingerprint ('flaggedResources' is None) until a ticket needs them (see retrieve_ta_check_results_needed_by_tickets).
+# Returns the TA Check result records indexed by account id and check id, and the workload resources indexed by account id.
+@timed_stage
+def get_accounts_ta_check_results(account_ids, ta_check_ids, shared_ta_check_results = None):
+    # Workload resources of each account (listed once and reused by every choice).
+    workload_resources = get_accounts_workload_resources(account_ids)
+    check_summaries = dict(zip(account_ids, run_concurrently(get_ta_check_summaries, [(account_id, ta_check_ids) for account_id in account_ids])))
+    check_states = ddb_load_ta_check_states(account_ids, ta_check_ids)
+
+    accounts_ta_check_results = {account_id: {} for account_id in account_ids}
+    account_check_pairs = []
+    for account_id in account_ids:
+        for check_id in ta_check_ids:
+            check_summary = (check_summaries[account_id] or {}).get(check_id)
+            check_state = check_states.get((account_id, check_id))
+            check_state_current = check_summary and check_state and check_state['taTimestamp'] == check_summary['timestamp'] and check_state['inventoryDigest'] == workload_resources[account_id]['digest']
+            if check_summary and check_summary['status'] not in ['warning', 'error']:
+                # No resource is flagged in 'warning' or 'error' TA status, there is nothing to retrieve. The state already recorded
+                # for this TA refresh and inventory is not written again.
+                accounts_ta_check_results[account_id][check_id] = new_ta_check_result(check_id, check_summary['timestamp'], workload_resources[account_id], [])
+                accounts_ta_check_results[account_id][check_id]['refreshed'] = not check_state_current
+            elif check_state_current:
+                accounts_ta_check_results[account_id][check_id] = {
+                    'timestamp': check_state['taTimestamp'],
+                    'inventoryDigest': check_state['inventoryDigest'],
+                    'flaggedResources': None,
+                    'flaggedResourcesDigest': check_state['flaggedResourcesDigest'],
+                    'flaggedResourcesCount': int(check_state['flaggedResourcesCount']),
+                    'refreshed': False
                 }
-            }
-
-            ticketHeaderKey = hashlib.md5(('opscenter' + account_id + check_flagged['workloadId'] + check_flagged['bestPracticeTitle'] + check_flagged['id']).encode()).hexdigest()
-            ticketContentKey = hashlib.md5(str(check_flagged).encode()).hexdigest()
-
-            ddb_query_response = ddb_query_entries(ticketHeaderKey)
-            
-            # Verify in DDB table if the OpsItem was already created for this BP<-->TA Check pair.
-            # If exist, check if affected resources or the question risk changed. If so, update the OpsItem and update entry in DDB.
-            # If not exist, create the OpsItem and add new entry in DDB.
-            if ddb_query_response:
-                if ddb_query_response[0]['ticketContentKey'] != ticketContentKey:
-                    logger.info(f'Either the number of affected resources or the question risk changed. Updating OpsItem issue: {ddb_query_response[0]["ticketId"]}')
-                    update_ops_item_response = ssm_client.update_ops_item(
-                        Description=ops_item_description,
-                        OperationalData=operational_data_object,
-                        Title='[WALAB] [' + account_id + '] - ' + check_flagged['name'],
-                        OpsItemId=ddb_query_response[0]['ticketId']
-                    )
-                    ddb_update_entry(ticketHeaderKey, ddb_query_response[0]['creationDate'], datetime.now(timezone.utc).isoformat(), ticketContentKey)
-                else:
-                    logger.info(f'No changes for OpsItem issue: {ddb_query_response[0]["ticketId"]}')
             else:
-                logger.info('Creating OpsItem issue')
-                create_ops_item_response = ssm_client.create_ops_item(
-                    Description=ops_item_description,
-                    OperationalData=operational_data_object,
-                    Source='wa_labs',
-                    Title='[WALAB] [' + account_id + '] - ' + check_flagged['name']
-                )
-                ddb_put_entry(create_ops_item_response['OpsItemId'], 'opscenter', datetime.now(timezone.utc).isoformat(), '', ticketHeaderKey, ticketContentKey, check_flagged['workloadId'], LENS_ALIAS, answer['QuestionId'], choice['choiceId'], workload_name, choice['title'], answer['PillarId'], answer['QuestionTitle'])
-                logger.info(f'OpsItem issue {create_ops_item_response["OpsItemId"]} created and recorded in DDB')
+                account_check_pairs.append((account_id, check_id))
+
+    logger.info(f'{len(account_check_pairs)} of {len(account_ids) * len(ta_check_ids)} TA Check results refreshed since the last run')
+    record_cache_lookups('TACheckState', len(account_ids) * len(ta_check_ids) - len(account_check_pairs), len(account_check_pairs))
+    retrieve_ta_check_results(accounts_ta_check_results, account_check_pairs, workload_resources, shared_ta_check_results)
+
+    return accounts_ta_check_results, workload_resources
+
+# Function to retrieve the TA Check results of (account id, check id) pairs concurrently.
+# The workload resources come from the same tag in every workload, so the results retrieved are also kept in shared_ta_check_results
+# (when given) for the other workloads processed by the same invocation.
+def retrieve_ta_check_results(accounts_ta_check_results, account_check_pairs, workload_resources, shared_ta_check_results = None):
+    if shared_ta_check_results == None:
+        shared_ta_check_results = {}
+
+    account_check_pairs_to_retrieve = [account_check_pair for account_check_pair in account_check_pairs if account_check_pair not in shared_ta_check_results]
+    record_cache_lookups('SharedTACheckResults', len(account_check_pairs) - len(account_check_pairs_to_retrieve), len(account_check_pairs_to_retrieve))
+    check_results = run_concurrently(get_ta_check_result, [(account_id, check_id, workload_resources[account_id]) for account_id, check_id in account_check_pairs_to_retrieve])
+    shared_ta_check_results.update(zip(account_check_pairs_to_retrieve, check_results))
+
+    for account_id, check_id in account_check_pairs:
+        accounts_ta_check_results[account_id][check_id] = shared_ta_check_results[(account_id, check_id)]
+
+# Function to retrieve the TA Check results not refreshed since the last run that a ticket still needs: the ticket does not exist yet,
+# or its recorded content does not match the question risk and the recorded fingerprint of the flagged resources.
+def retrieve_ta_check_results_needed_by_tickets(ticket_states, question_choices, accounts_ta_check_results, workload_resources, workloadId, shared_ta_check_results = None):
+    ticket_types = get_ticket_types()
+    account_check_pairs = []
+    account_check_pairs_needed = set()
+
+    for answer, choice, bp_ta_check_ids_list in question_choices:
+        for account_id, ta_check_results in accounts_ta_check_results.items():
+            for check_id in bp_ta_check_ids_list:
+                ta_check_result = ta_check_results.get(check_id)
+                if not ta_check_result or ta_check_result['flaggedResources'] is not None or ta_check_result['flaggedResourcesCount'] == 0 or (account_id, check_id) in account_check_pairs_needed:
+                    continue
+                ticketContentKey = get_ticket_content_key(answer['Risk'], ta_check_result['flaggedResourcesDigest'])
+                for ticketType in ticket_types:
+                    ticket_state = ticket_states['entries'].get(TicketKey(ticketType, account_id, workloadId, choice['title'], check_id).header_key())
+                    if not ticket_state or 'flaggedResourcesCount' not in ticket_state or ticket_state['ticketContentKey'] != ticketContentKey:
+                        account_check_pairs.append((account_id, check_id))
+                        account_check_pairs_needed.add((account_id, check_id))
+                        break
+
+    if account_check_pairs:
+        logger.info(f'Retrieving {len(account_check_pairs)} unchanged TA Check results needed by new or outdated tickets')
+        retrieve_ta_check_results(accounts_ta_check_results, account_check_pairs, workload_resources, shared_ta_check_results)
+
+# Function to record the state of the TA Check results retrieved, or refreshed by TA without flagged resources, in this run
+def record_ta_check_states(ticket_states, accounts_ta_check_results):
+    for account_id, ta_check_results in accounts_ta_check_results.items():
+        for check_id, ta_check_result in ta_check_results.items():
+            if ta_check_result['refreshed']:
+                ddb_put_ta_check_state(ticket_states, account_id, check_id, ta_check_result)
+
+# Function to add to each TA Check of a BP the workload flagged resources already retrieved for the account.
+# TA Checks whose result was not retrieved (unchanged since the last run and not needed by any ticket) are left out.
+@timed_stage
+def add_flagged_resources(bp_ta_checks, ta_check_results):
+    bp_ta_checks_retrieved = []
+    for check in bp_ta_checks:
+        ta_check_result = ta_check_results.get(check.id)
+        if ta_check_result and ta_check_result['flaggedResources'] is not None:
+            check.flaggedResources = ta_check_result['flaggedResources']
+            check.flaggedResourceKeys = ta_check_result['flaggedResourceKeys']
+            check.flaggedResourcesDigest = ta_check_result['flaggedResourcesDigest']
+            bp_ta_checks_retrieved.append(check)
+
+    return(bp_ta_checks_retrieved)
+
+# Function to return the ticket types of the enabled integrations
+def get_ticket_types():
+    return [ticketType for ticketType, enabled in [('opscenter', OPS_CENTER_INTEGRATION), ('jira', JIRA_INTEGRATION)] if enabled]
+
+# Function to compute the ticketHeaderKey of every ticket a run can create or update: one per ticket type for each
+# BP <--> TA Check pair with workload flagged resources in a workload account.
+def get_ticket_header_keys(question_choices, accounts_ta_check_results, workloadId):
+    ticket_types = get_ticket_types()
+    ticketHeaderKeys = []
+
+    for answer, choice, bp_ta_check_ids_list in question_choices:
+        for account_id, ta_check_results in accounts_ta_check_results.items():
+            for check_id in bp_ta_check_ids_list:
+                if check_id in ta_check_results and ta_check_results[check_id]['flaggedResourcesCount'] > 0:
+                    ticketHeaderKeys += [TicketKey(ticketType, account_id, workloadId, choice['title'], check_id).header_key() for ticketType in ticket_types]
+
+    return ticketHeaderKeys
+
+# Function to compute the canonical fingerprint of the flagged resources of a TA Check: the flagged resource keys, mapped to the
+# readable identifier of their resource, and a digest of the sorted keys, so that the order in which TA returns the resources does not change it.
+def get_flagged_resources_fingerprint(flagged_resources, metadataOrder):
+    flaggedResourceKeys = {flagged_resource.key(metadataOrder): flagged_resource.label(metadataOrder) for flagged_resource in flagged_resources}
+    flaggedResourcesDigest = hashlib.blake2b('\n'.join(sorted(flaggedResourceKeys)).encode(), digest_size=16).hexdigest()
+    return flaggedResourceKeys, flaggedResourcesDigest
+
+# Function to compute the ticketContentKey from the question risk and the flagged resources fingerprint
+def get_ticket_content_key(risk, flaggedResourcesDigest):
+    return hashlib.blake2b((risk + '\n' + flaggedResourcesDigest).encode(), digest_size=16).hexdigest()
+
+# Function to list the readable identifiers of flagged resources, one per line after sign, stopping before max_length characters or
+# MAX_INLINE_FLAGGED_RESOURCES resources
+def render_flagged_resource_labels(labels, sign, max_length):
+    lines = []
+    rendered_length = 0
+    for label in labels:
+        line = '\n' + sign + ' ' + label
+        if len(lines) == MAX_INLINE_FLAGGED_RESOURCES or rendered_length + len(line) > max_length:
+            lines.append('\n' + sign + ' ... ' + str(len(labels) - len(lines)) + ' more')
+            break
+        lines.append(line)
+        rendered_length += len(line)
+    return ''.join(lines)
+
+# Function to describe the flagged resources added and removed since the ticket entry was last recorded, listing them within
+# max_length characters. Resources recorded before their identifiers are listed by key.
+def describe_flagged_resources_changes(ticket_state, flaggedResourceKeys, max_length):
+    if 'flaggedResourceLabels' in ticket_state:
+        recordedFlaggedResourceKeys = ticket_state['flaggedResourceLabels']
+    elif 'flaggedResourceKeys' in ticket_state:
+        recordedFlaggedResourceKeys = {key: 'resource ' + key for key in ticket_state['flaggedResourceKeys']}
     else:
-        logger.info(f'No flagged resources for this Best Practice {choice["choiceId"]} on any of its Trusted Advisor checks')
+        return 'flagged resources went from ' + str(ticket_state['flaggedResourcesCount']) + ' to ' + str(len(flaggedResourceKeys))
+
+    added = sorted(flaggedResourceKeys[key] for key in flaggedResourceKeys.keys() - recordedFlaggedResourceKeys.keys())
+    removed = sorted(recordedFlaggedResourceKeys[key] for key in recordedFlaggedResourceKeys.keys() - flaggedResourceKeys.keys())
+    return (str(len(added)) + ' flagged resources added, ' + str(len(removed)) + ' removed'
+        + render_flagged_resource_labels(added, '+', max_length // 2) + render_flagged_resource_labels(removed, '-', max_length // 2))
+
+# Function to yield each flagged resource of a TA Check as a dict of its metadata indexed by column name
+def iter_formatted_flagged_resources(check_flagged):
+    for resource in check_flagged.flaggedResources:
+        yield resource.as_dict(check_flagged.metadataOrder)
+
+# Function to render the flagged resources of a TA Check as an indented JSON list, one resource at a time, stopping before
+# max_length characters or MAX_INLINE_FLAGGED_RESOURCES resources. Returns the text and the number of resources rendered.
+def render_flagged_resources(check_flagged, max_length):
+    rendered_resources = []
+    rendered_length = len('[\n\n]')
+    for resource in iter_formatted_flagged_resources(check_flagged):
+        resource_text = '   ' + json.dumps(resource, indent = 3).replace('\n', '\n   ')
+        if len(rendered_resources) == MAX_INLINE_FLAGGED_RESOURCES or rendered_length + len(resource_text) + 2 > max_length:
+            break
+        rendered_resources.append(resource_text)
+        rendered_length += len(resource_text) + 2
+
+    if not rendered_resources:
+        return '[]', 0
+    return '[\n' + ',\n'.join(rendered_resources) + '\n]', len(rendered_resources)
+
+# Function to render a ticket description from a template holding FLAGGED_RESOURCES_PLACEHOLDER, within description_limit characters.
+# The flagged resources that do not fit are replaced by truncation_note, formatted with their number. Returns the description and
+# whether any flagged resource was left out.
+def render_ticket_description(description_template, check_flagged, description_limit, truncation_note):
+    max_length = description_limit - len(description_template) + len(FLAGGED_RESOURCES_PLACEHOLDER) - len(truncation_note) - 10
+    flagged_resources_text, rendered_count = render_flagged_resources(check_flagged, max_length)
+
+    left_out_count = len(check_flagged.flaggedResources) - rendered_count
+    if left_out_count > 0:
+        flagged_resources_text += truncation_note.format(left_out_count)
+
+    return description_template.replace(FLAGGED_RESOURCES_PLACEHOLDER, flagged_resources_text)[:description_limit], left_out_count > 0
+
+# Function to write every flagged resource of a TA Check to a file object as gzip JSON Lines, one resource at a time
+def write_flagged_resources_file(check_flagged, flagged_resources_file):
+    import gzip
+
+    with gzip.GzipFile(fileobj=flagged_resources_file, mode='wb') as gzip_file:
+        for resource in iter_formatted_flagged_resources(check_flagged):
+            gzip_file.write((json.dumps(resource, separators=(',', ':')) + '\n').encode())
+    flagged_resources_file.seek(0)
+
+# Function to upload the flagged resources file of an OpsItem to FLAGGED_RESOURCES_BUCKET, replacing the previous one
+def upload_flagged_resources_file(check_flagged, key):
+    import tempfile
+
+    with tempfile.TemporaryFile() as flagged_resources_file:
+        write_flagged_resources_file(check_flagged, flagged_resources_file)
+        get_client('s3').put_object(Bucket=FLAGGED_RESOURCES_BUCKET, Key=key, Body=flagged_resources_file, ContentType='application/x-ndjson', ContentEncoding='gzip')
+
+# Function to attach the flagged resources file to a JIRA issue. With replace, the previous attachments with the same filename are
+# deleted once the new one is attached, so that the issue holds the single file its truncation note names.
+def attach_flagged_resources_file(issue_key, check_flagged, filename, replace = False):
+    import tempfile
+
+    previous_attachment_ids = []
+    if replace:
+        issue = call_jira('issue', issue_key, fields='attachment')
+        previous_attachment_ids = [attachment.id for attachment in issue.fields.attachment if attachment.filename == filename]
+
+    with tempfile.TemporaryFile() as flagged_resources_file:
+        write_flagged_resources_file(check_flagged, flagged_resources_file)
+        call_jira('add_attachment', issue_key, attachment=flagged_resources_file, filename=filename)
+
+    for attachment_id in previous_attachment_ids:
+        call_jira('delete_attachment', attachment_id)
+
+# Function to build the description of the ticket of a BP <--> TA Check pair, holding FLAGGED_RESOURCES_PLACEHOLDER wrapped as
+# flagged_resources_format requires (e.g. JIRA color markup) in place of the flagged resources
+def get_ticket_description_template(answer, choice, check_flagged, account_id, workload_name, workloadId, flagged_resources_format):
+    imp_guid_web = WA_WEB_URL + choice['choiceId'] + WA_WEB_ANCHOR
+    return ("*AWS Account ID:* " + account_id + "\n*AWS Well-Architected related information:*\nWorkload Name: " + workload_name +
+        "\nWorkload Id: " + workloadId +
+        "\nPillar Id: " + answer['PillarId'] +
+        "\nQuestion: " + answer['QuestionTitle'] +
+        "\nQuestion Risk Identified: " + answer['Risk'] +
+        "\nBest Practice: " + choice['title'] +
+        "\n\n*AWS Trusted Advisor (TA) related information:*" +
+        "\nTA Check Id: " + check_flagged.id +
+        "\nTA Check Name: " + check_flagged.name +
+        "\n\n*Raw data with resources affected:*" +
+        "\nFlagged Resources (" + str(len(check_flagged.flaggedResources)) + "):\n" + flagged_resources_format.format(FLAGGED_RESOURCES_PLACEHOLDER) +
+        "\n\n*Useful link for resolution:*" +
+        "\nWell-Architected Implementation Guidance links:\n[" + imp_guid_web + "]" +
+        "\n\nTrusted Advisor useful links:\n" + json.dumps(check_flagged.taRecommedationUrls, indent = 3)
+    )
+
+# Class of a ticket sink: collects the ticket creations and updates of a run (TicketOperation), then performs them in bulk or
+# concurrently on flush and records each ticket done in the ticket states. Operations that fail are attempted again, up to
+# TICKET_SINK_MAX_ATTEMPTS times, the sink finding the tickets already created by a failed attempt instead of creating them twice.
+# Subclasses implement the abstract create_tickets and update_ticket for their ticketing system.
+class TicketSink(abc.ABC):
+    ticketType = None
+    ticketName = None
+    descriptionLimit = None
+    flaggedResourcesFormat = ' {}'
+
+    def __init__(self):
+        self.creates = []
+        self.updates = []
 
-def create_jira_issue(jira_client, answer, choice, bp_ta_checks, WORKLOAD_ID, LENS_ALIAS, account_id, workload_name):
+    # Note replacing the flagged resources left out of the description of a ticket, formatted with their number
+    def truncation_note(self, operation):
+        return '\n... {} more flagged resources'
+
+    def add(self, operation):
+        (self.updates if operation.ticketId else self.creates).append(operation)
+
+    # Creates the tickets of a list of operations. Returns the ticket id, or the exception raised, of each operation.
+    @abc.abstractmethod
+    def create_tickets(self, operations):
+        pass
+
+    # Updates the ticket of an operation. Returns None, or the exception raised.
+    @abc.abstractmethod
+    def update_ticket(self, operation):
+        pass
+
+    # Performs the operations collected and records them in the ticket states. Returns the number of operations that still failed
+    # after TICKET_SINK_MAX_ATTEMPTS attempts.
+    def flush(self, ticket_states):
+        creates, updates = self.creates, self.updates
+        self.creates, self.updates = [], []
+        for attempt in range(TICKET_SINK_MAX_ATTEMPTS):
+            if not creates and not updates:
+                break
+            if attempt > 0:
+                logger.info(f'Attempting again {len(creates)} {self.ticketName} creations and {len(updates)} updates that failed')
+
+            failed_creates = []
+            for operation, result in zip(creates, self.create_tickets(creates) if creates else []):
+                if isinstance(result, Exception):
+                    logger.error(f'Failed to create {self.ticketName} for ticket {operation.ticketHeaderKey}. Exception: {result}')
+                    failed_creates.append(operation)
+                else:
+                    ddb_put_entry(ticket_states, result, self.ticketType, datetime.now(timezone.utc).isoformat(), '', operation.ticketHeaderKey, operation.ticketContentKey, *operation.entryFields, operation.flaggedResourceKeys)
+                    logger.info(f'{self.ticketName} {result} created and queued for recording in DDB')
+
+            failed_updates = []
+            for operation, result in zip(updates, run_concurrently(self.update_ticket, [(operation,) for operation in updates])):
+                if isinstance(result, Exception):
+                    logger.error(f'Failed to update {self.ticketName} {operation.ticketId}. Exception: {result}')
+                    failed_updates.append(operation)
+                else:
+                    ddb_update_entry(ticket_states, operation.ticketHeaderKey, datetime.now(timezone.utc).isoformat(), operation.ticketContentKey, operation.flaggedResourceKeys)
+
+            creates, updates = failed_creates, failed_updates
+        return len(creates) + len(updates)
+
+# OpsCenter ticket sink: OpsItems are created and updated concurrently, within the SSM rate limit. Each OpsItem carries its
+# ticketHeaderKey as a searchable TicketHeaderKey and as the /aws/dedup string, so that OpsCenter returns the open OpsItem
+# created by a failed attempt instead of creating another one.
+class OpsCenterTicketSink(TicketSink):
+    ticketType = 'opscenter'
+    ticketName = 'OpsItem'
+    descriptionLimit = OPS_ITEM_DESCRIPTION_LIMIT
+
+    def flagged_resources_key(self, operation):
+        return FLAGGED_RESOURCES_PREFIX + operation.ticketHeaderKey + '.jsonl.gz'
+
+    def truncation_note(self, operation):
+        if FLAGGED_RESOURCES_BUCKET:
+            return '\n... {} more flagged resources in s3://' + FLAGGED_RESOURCES_BUCKET + '/' + self.flagged_resources_key(operation)
+        return '\n... {} more flagged resources'
+
+    def operational_data(self, operation):
+        operation_data = []
+        for resource in iter_formatted_flagged_resources(operation.checkFlagged):
+            if len(operation_data) == MAX_INLINE_FLAGGED_RESOURCES:
+                break
+            if 'Resource' in resource:
+                operation_data.append({'arn': resource['Resource']})
+
+        operational_data_object = {
+            '/aws/resources': {'Value': json.dumps(operation_data), 'Type': 'SearchableString'},
+            'WorkloadId': {'Value': operation.entryFields[0], 'Type': 'SearchableString'},
+            'BestPracticeId': {'Value': operation.entryFields[4], 'Type': 'SearchableString'},
+            'Runbook': {'Value': WA_WEB_URL + operation.entryFields[4] + WA_WEB_ANCHOR, 'Type': 'SearchableString'},
+            'TicketHeaderKey': {'Value': operation.ticketHeaderKey, 'Type': 'SearchableString'}
+        }
+        if operation.truncated and FLAGGED_RESOURCES_BUCKET:
+            upload_flagged_resources_file(operation.checkFlagged, self.flagged_resources_key(operation))
+            operational_data_object['FlaggedResources'] = {'Value': 's3://' + FLAGGED_RESOURCES_BUCKET + '/' + self.flagged_resources_key(operation), 'Type': 'String'}
+        return operational_data_object
+
+    def create_ticket(self, operation):
+        operational_data_object = self.operational_data(operation)
+        operational_data_object['/aws/dedup'] = {'Value': json.dumps({'dedupString': operation.ticketHeaderKey}), 'Type': 'SearchableString'}
+        try:
+            return call_api('ssm', get_client('ssm').create_ops_item,
+                Description=operation.description,
+                OperationalData=operational_data_object,
+                Source='wa_labs',
+                Title=operation.title
+            )['OpsItemId']
+        except get_client('ssm').exceptions.OpsItemAlreadyExistsException as e:
+            logger.info(f'OpsItem {e.response["OpsItemId"]} was already created for ticket {operation.ticketHeaderKey}')
+            return e.response['OpsItemId']
+        except Exception as e:
+            return e
+
+    def create_tickets(self, operations):
+        return run_concurrently(self.create_ticket, [(operation,) for operation in operations])
+
+    def update_ticket(self, operation):
+        try:
+            call_api('ssm', get_client('ssm').update_ops_item,
+                Description=operation.description,
+                OperationalData=self.operational_data(operation),
+                Title=operation.title,
+                OpsItemId=operation.ticketId
+            )
+        except Exception as e:
+            return e
+
+# JIRA ticket sink: issues are created with bulk requests of JIRA_BULK_CREATE_SIZE issues, comments are added concurrently, within
+# the JIRA rate limit. Each issue is labelled with its ticketHeaderKey, and the issues of a bulk request are searched by label
+# before it is sent, so that an issue created by a failed attempt (or by a run that failed before recording it) is not created again.
+class JiraTicketSink(TicketSink):
+    ticketType = 'jira'
+    ticketName = 'JIRA issue'
+    descriptionLimit = JIRA_DESCRIPTION_LIMIT
+    flaggedResourcesFormat = '{{color:#97a0af}} {}{{color}}'
+
+    def flagged_resources_filename(self, operation):
+        return 'flagged-resources-' + operation.accountId + '-' + operation.checkFlagged.id + '.jsonl.gz'
+
+    def truncation_note(self, operation):
+        return '\n... {} more flagged resources in the attachment ' + self.flagged_resources_filename(operation)
+
+    def attach_flagged_resources_file(self, issue_key, operation, replace = False):
+        try:
+            attach_flagged_resources_file(issue_key, operation.checkFlagged, self.flagged_resources_filename(operation), replace)
+        except Exception as e:
+            # The issue exists, creating it again would duplicate it
+            logger.error(f'Failed to attach the flagged resources file to JIRA issue {issue_key}. Exception: {e}')
+
+    # Returns the issue key of each label found on an unresolved issue of the JIRA project. Resolved issues keep their label, and
+    # a label may be on several issues, so every page of the results is read.
+    def search_labelled_issues(self, labels):
+        jql = 'project = "' + JIRA_PROJECT_KEY + '" AND statusCategory != Done AND labels in (' + ', '.join('"' + label + '"' for label in labels) + ')'
+        issues = call_jira('search_issues', jql, maxResults=False, fields='labels')
+        return {label: issue.key for issue in issues for label in issue.fields.labels if label in labels}
+
+    def create_chunk(self, operations):
+        labels = [JIRA_TICKET_LABEL_PREFIX + operation.ticketHeaderKey for operation in operations]
+        try:
+            existing_issues = self.search_labelled_issues(labels)
+        except Exception as e:
+            return [e] * len(operations)
+
+        results = [existing_issues.get(label) for label in labels]
+        to_create = [i for i, result in enumerate(results) if result == None]
+        if len(to_create) < len(operations):
+            logger.info(f'{len(operations) - len(to_create)} JIRA issues were already created by a previous attempt')
+            # The previous attempt may have failed before attaching the flagged resources file
+            for operation, result in zip(operations, results):
+                if result != None and operation.truncated:
+                    self.attach_flagged_resources_file(result, operation, replace = True)
+        if not to_create:
+            return results
+
+        field_list = [{
+            'project': {'key': JIRA_PROJECT_KEY},
+            'summary': operations[i].title,
+            'description': operations[i].description,
+            'issuetype': {'name': 'Task'},
+            'labels': [labels[i]]
+        } for i in to_create]
+        try:
+            created_issues = call_jira('create_issues', field_list, prefetch=False)
+        except Exception as e:
+            created_issues = [{'status': 'Error', 'error': e, 'issue': None}] * len(field_list)
+
+        for i, created_issue in zip(to_create, created_issues):
+            if created_issue['status'] == 'Success':
+                results[i] = created_issue['issue'].key
+                if operations[i].truncated:
+                    self.attach_flagged_resources_file(results[i], operations[i])
+            else:
+                error = created_issue['error']
+                results[i] = error if isinstance(error, Exception) else Exception(str(error))
+        return results
+
+    def create_tickets(self, operations):
+        chunks = run_concurrently(self.create_chunk, [(operations[i:i + JIRA_BULK_CREATE_SIZE],) for i in range(0, len(operations), JIRA_BULK_CREATE_SIZE)])
+        return [result for chunk in chunks for result in chunk]
+
+    def update_ticket(self, operation):
+        try:
+            call_jira('add_comment', operation.ticketId, operation.description)
+        except Exception as e:
+            return e
+        if operation.truncated:
+            self.attach_flagged_resources_file(operation.ticketId, operation, replace = True)
+
+# Function to return a ticket sink for each enabled integration
+def get_ticket_sinks():
+    sinks = []
+    if OPS_CENTER_INTEGRATION:
+        sinks.append(OpsCenterTicketSink())
+    if JIRA_INTEGRATION:
+        sinks.append(JiraTicketSink())
+    return sinks
+
+# Function to queue in a ticket sink the creation or update of the ticket of each BP <--> TA Check pair with flagged resources
+# of an account, depending on the ticket state recorded in DDB
+@timed_stage
+def queue_ticket_operations(sink, ticket_states, answer, choice, bp_ta_checks, WORKLOAD_ID, LENS_ALIAS, LENS_VERSION, account_id, workload_name):
     # Filter out any TA Check for which there were no flagged resources.
-    bp_ta_checks_flagged = [d for d in bp_ta_checks if len(d['flaggedResources']) > 0]
+    bp_ta_checks_flagged = [d for d in bp_ta_checks if len(d.flaggedResources) > 0]
 
-    # If there are any TA Check with flagged resources, proceed to create or update the Jira ticket. If not omit the create/update.
+    # If there are any TA Check with flagged resources, proceed to create or update the ticket. If not omit the create/update.
     if len(bp_ta_checks_flagged) > 0:
         for check_flagged in bp_ta_checks_flagged:
-            logger.info(f'Processing Best Practice: {choice["choiceId"]}, and Trusted Advisor check: {check_flagged["name"]}')
-
-            imp_guid_web = WA_WEB_URL + choice['choiceId'] + WA_WEB_ANCHOR
-            check_flagged['workloadId'] = WORKLOAD_ID
-            check_flagged['pillarId'] = answer['PillarId']
-            check_flagged['questionTitle'] = answer['QuestionTitle']
-            check_flagged['risk'] = answer['Risk']
-            check_flagged['bestPracticeTitle'] = choice['title']
-            check_flagged['implementationGuide'] = imp_guid_web
-            flagged_resources_list = json.dumps(flagged_resource_formatter(check_flagged), indent = 3)
-
-            jira_issue_description = ("*AWS Account ID:* " + account_id + "\n*AWS Well-Architected related information:*\nWorkload Name: " + workload_name +
-                "\nWorkload Id: " + WORKLOAD_ID +
-                "\nPillar Id: " + answer['PillarId'] +
-                "\nQuestion: " + answer['QuestionTitle'] +
-                "\nQuestion Risk Identified: " + answer['Risk'] +
-                "\nBest Practice: " + choice['title'] +
-                "\n\n*AWS Trusted Advisor (TA) related information:*" + 
-                "\nTA Check Id: " + check_flagged['id'] +
-                "\nTA Check Name: " + check_flagged['name'] +
-                "\n\n*Raw data with resources affected:*" + 
-                "\nFlagged Resources (" + str(len(check_flagged['flaggedResources'])) + "):\n{color:#97a0af} " + flagged_resources_list + "{color}" + 
-                "\n\n*Useful link for resolution:*" +
-                "\nWell-Architected Implementation Guidance links:\n[" + imp_guid_web + "]" +
-                "\n\nTrusted Advisor useful links:\n" + json.dumps(check_flagged['taRecommedationUrls'], indent = 3)
-            )
-           
-            ticketHeaderKey = hashlib.md5(('jira' + account_id + check_flagged['workloadId'] + check_flagged['bestPracticeTitle'] + check_flagged['id']).encode()).hexdigest()
-            ticketContentKey = hashlib.md5(str(check_flagged).encode()).hexdigest()
-            ddb_query_response = ddb_query_entries(ticketHeaderKey)
-            
-            # Verify in DDB table if the Jira ticket was already created for this BP<-->TA Check pair.
-            # If exist, check if affected resources or the question risk changed. If so, update the Jira ticket and update entry in DDB.
-            # If not exist, create the Jira ticket and add new entry in DDB.
-            if ddb_query_response:
-                if ddb_query_response[0]['ticketContentKey'] != ticketContentKey:
-                    logger.info(f'Either the number of affected resources or the question risk changed. Updating JIRA issue: {ddb_query_response[0]["ticketId"]}')
-                    jira_client.add_comment(ddb_query_response[0]['ticketId'], jira_issue_description)
-                    ddb_update_entry(ticketHeaderKey, ddb_query_response[0]['creationDate'], datetime.now(timezone.utc).isoformat(), ticketContentKey)
+            logger.info(f'Processing Best Practice: {choice["choiceId"]}, and Trusted Advisor check: {check_flagged.name}')
+
+            ticketHeaderKey = TicketKey(sink.ticketType, account_id, WORKLOAD_ID, choice['title'], check_flagged.id).header_key()
+            flaggedResourceKeys = check_flagged.flaggedResourceKeys
+            ticketContentKey = get_ticket_content_key(answer['Risk'], check_flagged.flaggedResourcesDigest)
+            ticket_state = ticket_states['entries'].get(ticketHeaderKey)
+            operation = TicketOperation(ticketHeaderKey, ticketContentKey, flaggedResourceKeys, account_id, check_flagged,
+                (WORKLOAD_ID, LENS_ALIAS, LENS_VERSION, answer['QuestionId'], choice['choiceId'], workload_name, choice['title'], answer['PillarId'], answer['QuestionTitle']))
+            operation.title = '[WALAB] [' + account_id + '] - ' + check_flagged.name
+            description_template = get_ticket_description_template(answer, choice, check_flagged, account_id, workload_name, WORKLOAD_ID, sink.flaggedResourcesFormat)
+
+            # Verify in DDB table if the ticket was already created for this BP<-->TA Check pair.
+            # If exist, check if affected resources or the question risk changed. If so, update the ticket and update entry in DDB.
+            # If not exist, create the ticket and add new entry in DDB.
+            if ticket_state and 'flaggedResourcesCount' not in ticket_state:
+                # Entry recorded before the canonical fingerprint was introduced. Record it without updating the ticket.
+                logger.info(f'Recording canonical fingerprint for {sink.ticketName}: {ticket_state["ticketId"]}')
+                ddb_update_entry(ticket_states, ticketHeaderKey, ticket_state['updateDate'], ticketContentKey, flaggedResourceKeys)
+            elif ticket_state:
+                if ticket_state['ticketContentKey'] != ticketContentKey:
+                    # The changes take up to a quarter of the description, the flagged resources the rest
+                    flagged_resources_changes = describe_flagged_resources_changes(ticket_state, flaggedResourceKeys, sink.descriptionLimit // 4)
+                    logger.info(f'Either the affected resources ({flagged_resources_changes.splitlines()[0]}) or the question risk changed. Updating {sink.ticketName}: {ticket_state["ticketId"]}')
+                    operation.ticketId = ticket_state['ticketId']
+                    operation.description, operation.truncated = render_ticket_description("*Changes since last update:* " + flagged_resources_changes + "\n\n" + description_template, check_flagged, sink.descriptionLimit, sink.truncation_note(operation))
+                    sink.add(operation)
                 else:
-                    logger.info(f'No changes for JIRA issue: {ddb_query_response[0]["ticketId"]}')
+                    logger.info(f'No changes for {sink.ticketName}: {ticket_state["ticketId"]}')
             else:
-                logger.info('Creating JIRA issue')
-                jira_create_issue_response = jira_client.create_issue(
-                    project=JIRA_PROJECT_KEY,
-                    summary='[WALAB] [' + account_id + '] - ' + check_flagged['name'],
-                    description=jira_issue_description,
-                    issuetype={'name': 'Task'}
-                )
-                ddb_put_entry(jira_create_issue_response.key, 'jira', datetime.now(timezone.utc).isoformat(), '', ticketHeaderKey, ticketContentKey, check_flagged['workloadId'], LENS_ALIAS, answer['QuestionId'], choice['choiceId'], workload_name, choice['title'], answer['PillarId'], answer['QuestionTitle'])
-                logger.info(f'JIRA issue {jira_create_issue_response.key} created and recorded in DDB')
+                logger.info(f'Creating {sink.ticketName}')
+                operation.description, operation.truncated = render_ticket_description(description_template, check_flagged, sink.descriptionLimit, sink.truncation_note(operation))
+                sink.add(operation)
     else:
         logger.info(f'No flagged resources for this Best Practice {choice["choiceId"]} on any of its Trusted Advisor checks')
 
-def lambda_handler(event, context):
-    if not OPS_CENTER_INTEGRATION and not JIRA_INTEGRATION:
-        logger.info('No JIRA/OpsCenter integration enabled')
-        return
+# Function to perform the ticket operations collected by each sink. The tickets created or updated are recorded in the ticket states
+# even if other operations failed, then the run fails if any operation still failed.
+@timed_stage
+def flush_ticket_sinks(sinks, ticket_states):
+    failed_operations = sum(sink.flush(ticket_states) for sink in sinks)
+    if failed_operations:
+        raise Exception(f'{failed_operations} ticket creations or updates failed after {TICKET_SINK_MAX_ATTEMPTS} attempts')
 
-    ######################################
-    # Uncomment below for running on AWS Lambda
-    ######################################
-    WORKLOAD_ID=event['detail']['requestParameters']['WorkloadId']
-    LENS_ALIAS=event['detail']['requestParameters']['LensAlias']
-    LENS_ARN=event['detail']['responseElements']['LensArn']
-    QUESTION_ID=event['detail']['requestParameters']['QuestionId']
-    ######################################
+# Function to return the version of a lens the workload is reviewed with, retrieved only once per LENS_METADATA_TTL.
+# A lens review upgraded meanwhile keeps the previous version for the metadata cache key until the cached version expires.
+def get_workload_lens_version(workloadId, lensAlias):
+    cached_version = workload_lens_versions_cache.get((workloadId, lensAlias))
+    if cached_version and cached_version['expiresAt'] > time.time():
+        record_cache_lookups('LensVersion', 1, 0)
+        return cached_version['lensVersion']
+    record_cache_lookups('LensVersion', 0, 1)
 
-    try:
-        if JIRA_INTEGRATION:
-            get_parameter_response = ssm_client.get_parameter(Name=JIRA_SECRET_SSM_PARAM,WithDecryption=True)
-            jira_secret = str(get_parameter_response['Parameter']['Value'])
-            jira_options = {'server': JIRA_URL}
-            jira_client = JIRA(options=jira_options, basic_auth=(JIRA_USERNAME,jira_secret))
+    lensVersion = call_api('wellarchitected', get_client('wellarchitected').get_lens_review,
+        WorkloadId=workloadId,
+        LensAlias=lensAlias
+    )['LensReview']['LensVersion']
+    workload_lens_versions_cache[(workloadId, lensAlias)] = {'lensVersion': lensVersion, 'expiresAt': time.time() + LENS_METADATA_TTL}
 
-        workload_details = wa_client.get_workload(
-            WorkloadId=WORKLOAD_ID
-        )['Workload']
+    return lensVersion
 
-        workload_name = workload_details['WorkloadName']
+# Function to build the metadata entry of a question in a lens version from an answer: its choices and "None of these" choice.
+# The TA Checks of each choice (choiceCheckIds) are added as they are listed.
+def new_lens_metadata(lensAlias, lensVersion, answer):
+    item = get_lens_metadata_key(lensAlias, lensVersion, answer['QuestionId'])
+    item.update({
+        'lensAlias': lensAlias,
+        'lensVersion': lensVersion,
+        'questionId': answer['QuestionId'],
+        'pillarId': answer['PillarId'],
+        'choices': {choice['ChoiceId']: choice['Title'] for choice in answer['Choices']},
+        'choiceCheckIds': {},
+        'expiresAt': int(time.time()) + LENS_METADATA_TTL
+    })
+    none_of_these_choice_ids = [choice['ChoiceId'] for choice in answer['Choices'] if choice['Title'] == 'None of these']
+    if none_of_these_choice_ids:
+        item['noneOfTheseChoiceId'] = none_of_these_choice_ids[0]
+    return item
 
-        if 'AccountIds' not in workload_details:
-            logger.info(f'There are no Account IDs listed for this workload in the Well-Architected Tool. Specify at least one Account ID used by Trusted Advisor in the Well-Architected Tool workload Account IDs field. This field is required to activate Trusted Advisor. Exiting.')
-            return
-        else:
-            account_ids = workload_details['AccountIds']
+# Function to return the metadata entry of each question of a set of answers in a lens version, indexed by question id.
+# Entries are read from the warm container cache, then from DDB, and built from the answers when missing, expired or no longer
+# matching the choices of the answer.
+def get_lens_metadata(lensAlias, lensVersion, answers):
+    now = time.time()
+    metadata = {}
+    for answer in answers:
+        item = lens_metadata_cache.get((lensAlias, lensVersion, answer['QuestionId']))
+        if item and item['expiresAt'] > now:
+            metadata[answer['QuestionId']] = item
+    missing_questionIds = [answer['QuestionId'] for answer in answers if answer['QuestionId'] not in metadata]
+    record_cache_lookups('LensMetadata', len(metadata), len(missing_questionIds))
+
+    if missing_questionIds:
+        items = ddb_batch_get_entries([get_lens_metadata_key(lensAlias, lensVersion, questionId) for questionId in missing_questionIds])
+        items = [item for item in items if item['expiresAt'] > now]
+        record_cache_lookups('LensMetadataTable', len(items), len(missing_questionIds) - len(items))
+        for item in items:
+            metadata[item['questionId']] = item
+
+    for answer in answers:
+        item = metadata.get(answer['QuestionId'])
+        if item == None or set(item['choices']) != set(choice['ChoiceId'] for choice in answer['Choices']):
+            metadata[answer['QuestionId']] = new_lens_metadata(lensAlias, lensVersion, answer)
+        lens_metadata_cache[(lensAlias, lensVersion, answer['QuestionId'])] = metadata[answer['QuestionId']]
 
-        # Retrieve WA Question answer details
-        answer = wa_client.get_answer(
-            WorkloadId=WORKLOAD_ID,
-            LensAlias=LENS_ALIAS,
-            QuestionId=QUESTION_ID
-        )['Answer']
+    return metadata
 
+# Function to get the TA Checks related to each unselected WA BP (choice) of a set of questions.
+# Returns (answer, choice, TA Check ids) for every BP that can get a ticket ('None of these' never does), and the lens metadata
+# entries that gained TA Checks, to record in DDB. The TA Checks of a choice are only listed once per lens version (see get_lens_metadata).
+@timed_stage
+def get_question_choices(workloadId, lensAlias, lensArn, lensVersion, answers):
+    question_choices = []
+    lens_metadata_updates = {}
+    lens_metadata = get_lens_metadata(lensAlias, lensVersion, [answer for answer in answers if answer['IsApplicable']])
+
+    for answer in answers:
         if not answer['IsApplicable']:
-            logger.info(f'Question {QUESTION_ID} for Workload {WORKLOAD_ID} was marked as Not Applicable. Exiting.')
-            return
+            logger.info(f'Question {answer["QuestionId"]} for Workload {workloadId} was marked as Not Applicable. Skipping.')
+            continue
+        question_metadata = lens_metadata[answer['QuestionId']]
 
         # Get list of unselected BPs (choices) for this question
-        unselected_choices = get_unselected_choices(answer)
-        
-        # Loop through each unselected BPs (choices) for this question
-        for choice in unselected_choices:
-            # Get TA check details related to the WA BP (choice)
-            check_details = wa_client.list_check_details(
-                WorkloadId=WORKLOAD_ID,
-                LensArn=LENS_ARN,
-                PillarId=answer['PillarId'],
-                QuestionId=QUESTION_ID,
-                ChoiceId=choice['choiceId']
-            )
+        for choice in get_unselected_choices(answer):
+            if choice['title'] == 'None of these':
+                continue
 
-            # Get list of TA check Ids from here (e.g. ['opQPADkZvH', 'R365s2Qddf', 'H7IgTzjTYb']).
-            bp_ta_check_ids_list = get_bp_ta_check_ids_list(check_details)
+            bp_ta_check_ids_list = question_metadata['choiceCheckIds'].get(choice['choiceId'])
+            if bp_ta_check_ids_list == None:
+                # Get TA check details related to the WA BP (choice)
+                check_details = call_api('wellarchitected', get_client('wellarchitected').list_check_details,
+                    WorkloadId=workloadId,
+                    LensArn=lensArn,
+                    PillarId=answer['PillarId'],
+                    QuestionId=answer['QuestionId'],
+                    ChoiceId=choice['choiceId']
+                )
 
-            # Loop through each of the account ids listed for this workload in the WA Tool
-            for account_id in account_ids:
-                logger.info(f'Processing Account: {account_id}')
+                # Get list of TA check Ids from here (e.g. ['opQPADkZvH', 'R365s2Qddf', 'H7IgTzjTYb']).
+                bp_ta_check_ids_list = get_bp_ta_check_ids_list(check_details)
 
-                # Only assume role for reviewing workload resources in other accounts
-                if account_id == sts_client.get_caller_identity().get('Account'):
-                    assumed_role_credentials = None
-                else:
-                    assumed_role_credentials = assume_workload_account_role(account_id)
+                # The cached entry may be read by other threads, so it is replaced rather than changed
+                choiceCheckIds = dict(question_metadata['choiceCheckIds'])
+                choiceCheckIds[choice['choiceId']] = bp_ta_check_ids_list
+                question_metadata = dict(question_metadata, choiceCheckIds=choiceCheckIds)
+                lens_metadata_cache[(lensAlias, lensVersion, answer['QuestionId'])] = question_metadata
+                lens_metadata_updates[answer['QuestionId']] = question_metadata
+
+            question_choices.append((answer, choice, bp_ta_check_ids_list))
+
+    return question_choices, list(lens_metadata_updates.values())
+
+# Function to create or update the Jira tickets or OpsItems of the unselected BPs (choices) of a set of questions of a workload lens.
+# Each TA Check result is retrieved once per account for all the questions, and the ticket states are loaded and written in batches.
+@timed_stage
+def process_workload_answers(workloadId, workloadName, account_ids, lensAlias, lensArn, answers, shared_ta_check_results = None):
+    # Get TA check details related to each WA BP (choice) first, so that a TA Check shared by several BPs is only fetched once per account.
+    lensVersion = get_workload_lens_version(workloadId, lensAlias)
+    question_choices, lens_metadata_updates = get_question_choices(workloadId, lensAlias, lensArn, lensVersion, answers)
+
+    # Union of the TA Checks of every BP (choice)
+    ta_check_ids, bp_ta_check_pairs = get_unique_ta_check_ids(question_choices)
+
+    # Retrieving each TA Check result once for each of the account ids listed for this workload in the WA Tool, keeping only
+    # the flagged resources related to the workload that are in 'warning' or 'error' TA status.
+    accounts_ta_check_results, workload_resources = get_accounts_ta_check_results(account_ids, ta_check_ids, shared_ta_check_results)
+    logger.info(f'Checked {len(ta_check_ids)} TA Check results for {bp_ta_check_pairs} Best Practice <--> TA Check pairs per Account ({(bp_ta_check_pairs - len(ta_check_ids)) * len(account_ids)} calls saved)')
+
+    # Load the state of every ticket this run can create or update at once
+    ticket_states = ddb_load_ticket_states(get_ticket_header_keys(question_choices, accounts_ta_check_results, workloadId))
+    for item in lens_metadata_updates:
+        ddb_put_lens_metadata(ticket_states, item)
 
-                # Creates initial schema list for all TA checks relevant to the BP.
-                # E.g. [{'id': 'R365s2Qddf', 'name': 'Amazon S3 Bucket Versioning', 'taRecommedationUrls': ['https://docs.aws.amazon.com/.../'], 'metadataOrder': ['Region', 'Bucket Name']}]
+    try:
+        # TA Check results unchanged since the last run are only retrieved for the tickets they would create or change
+        retrieve_ta_check_results_needed_by_tickets(ticket_states, question_choices, accounts_ta_check_results, workload_resources, workloadId, shared_ta_check_results)
+        record_ta_check_states(ticket_states, accounts_ta_check_results)
+
+        # Loop through each unselected BPs (choices), queueing the ticket creations and updates in the sink of each integration
+        sinks = get_ticket_sinks()
+        for answer, choice, bp_ta_check_ids_list in question_choices:
+            # Proceed to create Jira tickets or OpsItems for each WA-BP<-->TA-Check unique pair (e.g. There can be 'n' TA Checks related to a WA BP, so it will create 'n' Jira/OpsItems for that BP).
+            for account_id in account_ids:
+                # Creates the TACheck list for all TA checks relevant to the BP.
+                # E.g. [TACheck(id='R365s2Qddf', name='Amazon S3 Bucket Versioning', taRecommedationUrls=['https://docs.aws.amazon.com/.../'], metadataOrder=('Region', 'Bucket Name'))]
                 bp_ta_checks = get_ta_check_summary(bp_ta_check_ids_list)
 
-                # Retrieving TA Check results and adding only the flagged resources related to the workload that are in 'warning' or 'error' TA status.
-                add_flagged_resources(bp_ta_checks, account_id, assumed_role_credentials)
+                # Adding the flagged resources retrieved for this account to each TA Check of the BP.
+                bp_ta_checks = add_flagged_resources(bp_ta_checks, accounts_ta_check_results[account_id])
+
+                for sink in sinks:
+                    queue_ticket_operations(sink, ticket_states, answer, choice, bp_ta_checks, workloadId, lensAlias, lensVersion, account_id, workloadName)
+
+        # Creating and updating the tickets of the run, in bulk or concurrently
+        flush_ticket_sinks(sinks, ticket_states)
+    finally:
+        # Tickets already created must be recorded even if a later one fails, otherwise they would be created again by the next run.
+        ddb_flush_entries(ticket_states)
+
+# Function to list the ids of every workload in the WA Tool
+def list_workload_ids():
+    workload_ids = []
+    list_workloads_kwargs = {}
+    while True:
+        list_workloads_response = call_api('wellarchitected', get_client('wellarchitected').list_workloads, **list_workloads_kwargs)
+        workload_ids.extend(workload['WorkloadId'] for workload in list_workloads_response['WorkloadSummaries'])
+        if 'NextToken' not in list_workloads_response:
+            return workload_ids
+        list_workloads_kwargs['NextToken'] = list_workloads_response['NextToken']
+
+# Function to list the answers of every question of a workload lens. Returns the lens ARN and the answers.
+def list_workload_answers(workloadId, lensAlias):
+    answers = []
+    list_answers_kwargs = {'WorkloadId': workloadId, 'LensAlias': lensAlias}
+    while True:
+        list_answers_response = call_api('wellarchitected', get_client('wellarchitected').list_answers, **list_answers_kwargs)
+        answers.extend(list_answers_response['AnswerSummaries'])
+        if 'NextToken' not in list_answers_response:
+            return list_answers_response['LensArn'], answers
+        list_answers_kwargs['NextToken'] = list_answers_response['NextToken']
+
+# Function to migrate the ticket entries recorded before the ticket pointers and the open ticket counters existed: the table is
+# scanned for ticket entries, their pointers are written, and the counters missing of their BPs are set to the number of entries of
+# the BP. The migration entry records the last page scanned, so a migration that does not fit in one invocation resumes in the next,
+# and its completion, after which a ticket without a pointer is a new ticket and a BP without a counter has no open ticket.
+# A pointer written for an entry deleted meanwhile is ignored by ddb_load_ticket_states, and a counter set meanwhile is left as is.
+def migrate_ticket_entries(context):
+    if is_ticket_entries_migration_completed():
+        return
+
+    key = {'ticketHeaderKey': TICKET_ENTRIES_MIGRATION_KEY, 'creationDate': STATE_ENTRY_SORT_KEY}
+    migration = ddb_deserialize(get_client('dynamodb').get_item(TableName=DDB_TABLE, Key=ddb_serialize(key)).get('Item', {})) or dict(key)
+    scan_kwargs = {
+        'TableName': DDB_TABLE,
+        'FilterExpression': 'attribute_exists(ticketType)',
+        'ProjectionExpression': 'ticketHeaderKey, creationDate, workloadId, lensAlias, questionId, bestPracticeId'
+    }
+    if 'lastEvaluatedKey' in migration:
+        scan_kwargs['ExclusiveStartKey'] = ddb_serialize(migration['lastEvaluatedKey'])
+
+    while context.get_remaining_time_in_millis() > RECONCILIATION_TIME_MARGIN:
+        scan_response = get_client('dynamodb').scan(**scan_kwargs)
+        items = [ddb_deserialize(item) for item in scan_response['Items']]
+        pointers = [new_ticket_pointer(item) for item in items]
+        ticket_states = {'entries': {}, 'pendingWrites': {(pointer['ticketHeaderKey'], pointer['creationDate']): pointer for pointer in pointers}, 'newEntries': set()}
+        ddb_flush_entries(ticket_states)
+
+        bps = list(set((item['workloadId'], item['lensAlias'], item['questionId'], item['bestPracticeId']) for item in items))
+        existing_counters = set(counter['ticketHeaderKey'] for counter in ddb_batch_get_entries([get_open_tickets_counter_key(*bp) for bp in bps]))
+        for bp in bps:
+            if get_open_tickets_counter_key(*bp)['ticketHeaderKey'] not in existing_counters:
+                ddb_seed_open_tickets(bp, ddb_count_open_tickets(*bp))
+        migration['migratedEntries'] = int(migration.get('migratedEntries', 0)) + len(pointers)
 
-                # Proceed to create Jira tickets or OpsItems for each WA-BP<-->TA-Check unique pair (e.g. There can be 'n' TA Checks related to a WA BP, so it will create 'n' Jira/OpsItems for that BP).
-                if choice['title'] != 'None of these':
-                    if OPS_CENTER_INTEGRATION:
-                        create_ops_item(answer, choice, bp_ta_checks, WORKLOAD_ID, LENS_ALIAS, account_id, workload_name)
+        if 'LastEvaluatedKey' not in scan_response:
+            migration.pop('lastEvaluatedKey', None)
+            migration['completedAt'] = int(time.time())
+            get_client('dynamodb').put_item(TableName=DDB_TABLE, Item=ddb_serialize(migration))
+            ticket_entries_migration['completed'] = True
+            logger.info(f'Migration of the ticket entries completed: {migration["migratedEntries"]} entries migrated')
+            return
+        migration['lastEvaluatedKey'] = ddb_deserialize(scan_response['LastEvaluatedKey'])
+        scan_kwargs['ExclusiveStartKey'] = scan_response['LastEvaluatedKey']
+        get_client('dynamodb').put_item(TableName=DDB_TABLE, Item=ddb_serialize(migration))
+
+    logger.info(f'{migration.get("migratedEntries", 0)} ticket entries migrated, the migration resumes in the next scheduled invocation')
+
+# Function to take the lease of the sweep checkpoint entry until leaseExpiresAt, so that overlapping scheduled invocations do not sweep
+# the same workloads. Returns the checkpoint entry, or None if another invocation holds the lease.
+def ddb_acquire_reconciliation_checkpoint(leaseExpiresAt):
+    try:
+        update_item_response = get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize({'ticketHeaderKey': RECONCILIATION_CHECKPOINT_KEY, 'creationDate': STATE_ENTRY_SORT_KEY}),
+            UpdateExpression='SET #l = :l',
+            ConditionExpression='attribute_not_exists(#l) OR #l < :now',
+            ExpressionAttributeNames={'#l': 'leaseExpiresAt'},
+            ExpressionAttributeValues=ddb_serialize({':l': leaseExpiresAt, ':now': int(time.time())}),
+            ReturnValues='ALL_NEW'
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        return None
+    return ddb_deserialize(update_item_response['Attributes'])
+
+# Function to record the progress of the sweep in the checkpoint entry, releasing the lease when released is True
+def ddb_save_reconciliation_checkpoint(checkpoint, released = False):
+    if released:
+        checkpoint['leaseExpiresAt'] = 0
+    get_client('dynamodb').put_item(TableName=DDB_TABLE, Item=ddb_serialize(checkpoint))
+
+# Function to split the accounts of a workload lens into shards of SHARD_ACCOUNTS accounts and process each shard in its own
+# asynchronous invocation of this function, so that the processing time of a workload with many accounts depends on the size of
+# the shards rather than on the number of accounts. The tickets of an account only depend on the TA Check results of that account,
+# so each shard creates or updates its own tickets in DDB. questionIds None processes every question of the lens.
+# The run entry records the shards and the run is listed as pending until its last shard completes, so that the scheduled invocations
+# dispatch again the shards that did not complete (see redispatch_incomplete_shard_runs).
+# Returns False, without dispatching anything, when the workload is processed in this invocation.
+def dispatch_workload_shards(workloadId, account_ids, lensAlias, lensArn, questionIds, context):
+    if SHARD_ACCOUNTS <= 0 or len(account_ids) <= SHARD_ACCOUNTS or context == None:
+        return False
+
+    shards = [account_ids[i:i + SHARD_ACCOUNTS] for i in range(0, len(account_ids), SHARD_ACCOUNTS)]
+    runId = workloadId + '#' + lensAlias + '#' + str(int(time.time() * 1000))
+    run = {
+        'ticketHeaderKey': SHARD_RUN_KEY_PREFIX + runId,
+        'creationDate': STATE_ENTRY_SORT_KEY,
+        'runId': runId,
+        'workloadId': workloadId,
+        'lensAlias': lensAlias,
+        'lensArn': lensArn,
+        'questionIds': questionIds,
+        'shards': shards,
+        'shardCount': len(shards),
+        'startedAt': int(time.time()),
+        'dispatchedAt': int(time.time()),
+        'dispatches': 1,
+        'expiresAt': int(time.time()) + SHARD_RUN_TTL
+    }
+    get_client('dynamodb').put_item(TableName=DDB_TABLE, Item=ddb_serialize(run))
+    ddb_update_pending_shard_runs('ADD', [runId])
+
+    run_concurrently(invoke_shard, [(context.function_name, get_shard_payload(run, shardIndex)) for shardIndex in range(len(shards))])
+    logger.info(f'Dispatched {len(shards)} shards of up to {SHARD_ACCOUNTS} accounts for Lens {lensAlias} of Workload {workloadId} (run {runId})')
+    return True
+
+# Function to build the event of the invocation of a shard of a run
+def get_shard_payload(run, shardIndex):
+    return {'shard': {
+        'runId': run['runId'],
+        'shardIndex': shardIndex,
+        'workloadId': run['workloadId'],
+        'lensAlias': run['lensAlias'],
+        'lensArn': run['lensArn'],
+        'questionIds': run['questionIds'],
+        'accountIds': run['shards'][shardIndex]
+    }}
+
+# Function to invoke this function asynchronously for a shard. Lambda retries failed asynchronous invocations, then sends them to the
+# on-failure destination of the function (see EventInvokeConfig in the template).
+def invoke_shard(function_name, payload):
+    get_client('lambda').invoke(FunctionName=function_name, InvocationType='Event', Payload=json.dumps(payload))
+
+# Function to add ('ADD') or remove ('DELETE') run ids to or from the list of the sharded runs not completed yet
+def ddb_update_pending_shard_runs(action, runIds):
+    get_client('dynamodb').update_item(
+        TableName=DDB_TABLE,
+        Key=ddb_serialize({'ticketHeaderKey': SHARD_RUNS_PENDING_KEY, 'creationDate': STATE_ENTRY_SORT_KEY}),
+        UpdateExpression=action + ' runIds :r',
+        ExpressionAttributeValues=ddb_serialize({':r': set(runIds)})
+    )
+
+# Function to record the completion of a shard in the entry of its run. Returns the run entry to the single invocation that completes
+# the last shard, None otherwise (a shard retried by Lambda or delivered twice only counts once).
+def ddb_complete_shard(runId, shardIndex):
+    key = ddb_serialize({'ticketHeaderKey': SHARD_RUN_KEY_PREFIX + runId, 'creationDate': STATE_ENTRY_SORT_KEY})
+    update_item_response = get_client('dynamodb').update_item(
+        TableName=DDB_TABLE,
+        Key=key,
+        UpdateExpression='ADD completedShards :s',
+        ExpressionAttributeValues=ddb_serialize({':s': set([str(shardIndex)])}),
+        ReturnValues='ALL_NEW'
+    )
+    run = ddb_deserialize(update_item_response['Attributes'])
+    if len(run['completedShards']) < run['shardCount']:
+        return None
+
+    try:
+        get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=key,
+            UpdateExpression='SET completedAt = :now',
+            ConditionExpression='attribute_not_exists(completedAt)',
+            ExpressionAttributeValues=ddb_serialize({':now': int(time.time())})
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        return None
+    ddb_update_pending_shard_runs('DELETE', [runId])
+    return run
 
-                    if JIRA_INTEGRATION:
-                        create_jira_issue(jira_client, answer, choice, bp_ta_checks, WORKLOAD_ID, LENS_ALIAS, account_id, workload_name)
+# Function to dispatch again the shards not completed of the pending sharded runs dispatched more than SHARD_RUN_TIMEOUT seconds ago
+# (e.g. shards that still failed after the Lambda retries). A run dispatched SHARD_RUN_MAX_DISPATCHES times is given up and logged as
+# an error. Runs completed or expired are removed from the pending runs.
+def redispatch_incomplete_shard_runs(context):
+    get_item_response = get_client('dynamodb').get_item(
+        TableName=DDB_TABLE,
+        Key=ddb_serialize({'ticketHeaderKey': SHARD_RUNS_PENDING_KEY, 'creationDate': STATE_ENTRY_SORT_KEY})
+    )
+    runIds = sorted(ddb_deserialize(get_item_response.get('Item', {})).get('runIds', []))
+    if not runIds:
+        return
+
+    runs = {run['runId']: run for run in ddb_batch_get_entries([{'ticketHeaderKey': SHARD_RUN_KEY_PREFIX + runId, 'creationDate': STATE_ENTRY_SORT_KEY} for runId in runIds])}
+    finished_runIds = []
+    for runId in runIds:
+        run = runs.get(runId)
+        if run == None or 'completedAt' in run or int(run['expiresAt']) <= time.time():
+            finished_runIds.append(runId)
+            continue
+        if int(run['dispatchedAt']) + SHARD_RUN_TIMEOUT > time.time():
+            continue
+
+        missing_shards = [shardIndex for shardIndex in range(int(run['shardCount'])) if str(shardIndex) not in run.get('completedShards', set())]
+        if int(run['dispatches']) >= SHARD_RUN_MAX_DISPATCHES:
+            logger.error(f'Shards {missing_shards} of run {runId} did not complete after {int(run["dispatches"])} dispatches. Giving up.')
+            finished_runIds.append(runId)
+            continue
+
+        logger.warning(f'Shards {missing_shards} of run {runId} did not complete within {SHARD_RUN_TIMEOUT} seconds. Dispatching them again.')
+        get_client('dynamodb').update_item(
+            TableName=DDB_TABLE,
+            Key=ddb_serialize({'ticketHeaderKey': SHARD_RUN_KEY_PREFIX + runId, 'creationDate': STATE_ENTRY_SORT_KEY}),
+            UpdateExpression='SET dispatchedAt = :now ADD dispatches :one',
+            ExpressionAttributeValues=ddb_serialize({':now': int(time.time()), ':one': 1})
+        )
+        run_concurrently(invoke_shard, [(context.function_name, get_shard_payload(run, shardIndex)) for shardIndex in missing_shards])
 
+    if finished_runIds:
+        ddb_update_pending_shard_runs('DELETE', finished_runIds)
+
+# Shard entry point (see dispatch_workload_shards): creates or updates the tickets of the shard accounts, then records the shard as
+# completed. The invocation completing the last shard removes the run from the pending runs and reports the whole run.
+def shard_handler(event, context):
+    shard = event['shard']
+    workloadId = shard['workloadId']
+    lensAlias = shard['lensAlias']
+    logger.info(f'Processing shard {shard["shardIndex"]} of run {shard["runId"]}: {len(shard["accountIds"])} accounts of Workload {workloadId}')
+
+    try:
+        workload_name = call_api('wellarchitected', get_client('wellarchitected').get_workload,
+            WorkloadId=workloadId
+        )['Workload']['WorkloadName']
+
+        if shard['questionIds'] == None:
+            lensArn, answers = list_workload_answers(workloadId, lensAlias)
+        else:
+            lensArn = shard['lensArn']
+            answers = [call_api('wellarchitected', get_client('wellarchitected').get_answer,
+                WorkloadId=workloadId,
+                LensAlias=lensAlias,
+                QuestionId=questionId
+            )['Answer'] for questionId in shard['questionIds']]
+            answers = [answer for answer in answers if answer['IsApplicable']]
+
+        process_workload_answers(workloadId, workload_name, shard['accountIds'], lensAlias, lensArn, answers, {})
+
+        run = ddb_complete_shard(shard['runId'], shard['shardIndex'])
+        if run != None:
+            logger.info(f'All {run["shardCount"]} shards of run {shard["runId"]} completed in {int(time.time()) - int(run["startedAt"])} seconds ({int(run["dispatches"])} dispatches)')
     except Exception as e:
-        logger.error(f"Error encountered. Exception: {e}")
+        logger.error(f"Error encountered processing shard {shard['shardIndex']} of run {shard['runId']}. Exception: {e}")
         raise e
+    finally:
+        log_invocation_metrics()
+
+# Function to create or update the tickets of one workload for every lens and question
+def reconcile_workload(workloadId, shared_ta_check_results, context):
+    workload_details = call_api('wellarchitected', get_client('wellarchitected').get_workload,
+        WorkloadId=workloadId
+    )['Workload']
+
+    if 'AccountIds' not in workload_details:
+        logger.info(f'There are no Account IDs listed for Workload {workloadId} in the Well-Architected Tool. Skipping.')
+        return
+
+    for lensAlias in workload_details.get('Lenses', []):
+        lensArn, answers = list_workload_answers(workloadId, lensAlias)
+        # Shards list the answers of the lens again themselves
+        if dispatch_workload_shards(workloadId, workload_details['AccountIds'], lensAlias, lensArn, None, context):
+            continue
+        logger.info(f'Reconciling {len(answers)} questions of Lens {lensAlias} for Workload {workloadId}')
+        process_workload_answers(workloadId, workload_details['WorkloadName'], workload_details['AccountIds'], lensAlias, lensArn, answers, shared_ta_check_results)
+
+# Scheduled entry point: sweeps every workload, lens and question so that TA changes made without a WA Tool update are also tracked.
+# The workloads left are recorded in a checkpoint entry after each one, so a sweep that does not fit in one invocation resumes in the next.
+# Each scheduled invocation first dispatches again the shards of sharded runs that did not complete (see redispatch_incomplete_shard_runs)
+# and, until it is completed, continues the migration of the ticket entries (see migrate_ticket_entries).
+# The attempts of the workload being reconciled are recorded before it is processed, so that a workload that never completes within an
+# invocation is skipped after RECONCILIATION_MAX_ATTEMPTS attempts instead of blocking the sweep.
+def reconciliation_handler(event, context):
+    checkpoint = ddb_acquire_reconciliation_checkpoint(int(time.time() + context.get_remaining_time_in_millis() / 1000))
+    if checkpoint == None:
+        logger.info('A sweep is already running in another invocation. Exiting.')
+        return
+
+    try:
+        try:
+            redispatch_incomplete_shard_runs(context)
+        except Exception as e:
+            # The pending runs are checked again by the next scheduled invocation
+            logger.error(f'Error encountered dispatching again the shards of incomplete runs. Exception: {e}')
+
+        try:
+            migrate_ticket_entries(context)
+        except Exception as e:
+            # The migration resumes from its last page in the next scheduled invocation
+            logger.error(f'Error encountered migrating the ticket entries. Exception: {e}')
+
+        if not checkpoint.get('pendingWorkloadIds'):
+            if int(checkpoint.get('lastSweepCompletedAt', 0)) + RECONCILIATION_INTERVAL > time.time():
+                logger.info('The last sweep completed less than RECONCILIATION_INTERVAL seconds ago. Exiting.')
+                return
+            checkpoint['pendingWorkloadIds'] = list_workload_ids()
+            checkpoint['sweepStartedAt'] = int(time.time())
+            checkpoint.pop('currentWorkloadId', None)
+            checkpoint.pop('workloadAttempts', None)
+            logger.info(f'Starting a sweep of {len(checkpoint["pendingWorkloadIds"])} workloads')
+
+        # TA Check results retrieved for a workload account are reused by the other workloads of the same account
+        shared_ta_check_results = {}
+        while checkpoint['pendingWorkloadIds'] and context.get_remaining_time_in_millis() > RECONCILIATION_TIME_MARGIN:
+            workloadId = checkpoint['pendingWorkloadIds'][0]
+            attempts = int(checkpoint.get('workloadAttempts', 0)) + 1 if checkpoint.get('currentWorkloadId') == workloadId else 1
+            if attempts > RECONCILIATION_MAX_ATTEMPTS:
+                logger.error(f'Reconciling Workload {workloadId} was interrupted {RECONCILIATION_MAX_ATTEMPTS} times. Skipping it until the next sweep.')
+            else:
+                checkpoint['currentWorkloadId'] = workloadId
+                checkpoint['workloadAttempts'] = attempts
+                ddb_save_reconciliation_checkpoint(checkpoint)
+                try:
+                    reconcile_workload(workloadId, shared_ta_check_results, context)
+                except Exception as e:
+                    # A workload failing must not block the sweep of the others, it is reconciled again by the next sweep
+                    logger.error(f'Error encountered reconciling Workload {workloadId}. Exception: {e}')
+            checkpoint.pop('currentWorkloadId', None)
+            checkpoint.pop('workloadAttempts', None)
+            checkpoint['pendingWorkloadIds'] = checkpoint['pendingWorkloadIds'][1:]
+            ddb_save_reconciliation_checkpoint(checkpoint)
+
+        if checkpoint['pendingWorkloadIds']:
+            logger.info(f'{len(checkpoint["pendingWorkloadIds"])} workloads left, the sweep resumes in the next scheduled invocation')
+        else:
+            checkpoint['lastSweepCompletedAt'] = int(time.time())
+            logger.info(f'Sweep completed in {checkpoint["lastSweepCompletedAt"] - int(checkpoint["sweepStartedAt"])} seconds')
+    finally:
+        ddb_save_reconciliation_checkpoint(checkpoint, released = True)
+        log_invocation_metrics()
+
+# Function to read the workload, lens and question updated by a WA Tool UpdateAnswer event
+def get_update_answer_target(event):
+    request_parameters = event['detail']['requestParameters']
+    return request_parameters['WorkloadId'], request_parameters['LensAlias'], event['detail']['responseElements']['LensArn'], request_parameters['QuestionId']
+
+# Function to coalesce the UpdateAnswer events of an invocation by workload: {workloadId: {'lenses': {(lensAlias, lensArn): {questionId}},
+# 'messageIds': [SQS message id]}}. The message id is None when the function is invoked by EventBridge directly.
+# Messages that cannot be read are returned as failed message ids.
+def get_workload_updates(event):
+    workload_updates = {}
+    failed_message_ids = set()
+
+    if 'Records' not in event:
+        messages = [(None, event)]
+    else:
+        messages = []
+        for record in event['Records']:
+            try:
+                messages.append((record['messageId'], json.loads(record['body'])))
+            except ValueError as e:
+                logger.error(f'Unable to read SQS message {record["messageId"]}. Exception: {e}')
+                failed_message_ids.add(record['messageId'])
+
+    for message_id, message in messages:
+        try:
+            workloadId, lensAlias, lensArn, questionId = get_update_answer_target(message)
+        except KeyError as e:
+            if message_id == None:
+                raise
+            logger.error(f'SQS message {message_id} is not a WA Tool UpdateAnswer event. Missing {e}')
+            failed_message_ids.add(message_id)
+            continue
+        workload_update = workload_updates.setdefault(workloadId, {'lenses': {}, 'messageIds': []})
+        workload_update['lenses'].setdefault((lensAlias, lensArn), set()).add(questionId)
+        workload_update['messageIds'].append(message_id)
+
+    return workload_updates, failed_message_ids
+
+# Function to create or update the tickets of the questions updated in a workload, in one run per lens for the union of the questions
+def track_workload_updates(workloadId, lenses, shared_ta_check_results, context):
+    workload_details = call_api('wellarchitected', get_client('wellarchitected').get_workload,
+        WorkloadId=workloadId
+    )['Workload']
+
+    workload_name = workload_details['WorkloadName']
+
+    if 'AccountIds' not in workload_details:
+        logger.info(f'There are no Account IDs listed for this workload in the Well-Architected Tool. Specify at least one Account ID used by Trusted Advisor in the Well-Architected Tool workload Account IDs field. This field is required to activate Trusted Advisor. Exiting.')
+        return
+    else:
+        account_ids = workload_details['AccountIds']
+
+    for (lensAlias, lensArn), questionIds in lenses.items():
+        if dispatch_workload_shards(workloadId, account_ids, lensAlias, lensArn, sorted(questionIds), context):
+            continue
+
+        answers = []
+        for questionId in sorted(questionIds):
+            # Retrieve WA Question answer details
+            answer = call_api('wellarchitected', get_client('wellarchitected').get_answer,
+                WorkloadId=workloadId,
+                LensAlias=lensAlias,
+                QuestionId=questionId
+            )['Answer']
+
+            if not answer['IsApplicable']:
+                logger.info(f'Question {questionId} for Workload {workloadId} was marked as Not Applicable. Skipping.')
+                continue
+            answers.append(answer)
+
+        if answers:
+            logger.info(f'Processing {len(answers)} updated questions of Lens {lensAlias} for Workload {workloadId}')
+            process_workload_answers(workloadId, workload_name, account_ids, lensAlias, lensArn, answers, shared_ta_check_results)
+
+def lambda_handler(event, context):
+    if not OPS_CENTER_INTEGRATION and not JIRA_INTEGRATION:
+        logger.info('No JIRA/OpsCenter integration enabled')
+        return
+
+    # Shard of a workload with many accounts (see dispatch_workload_shards)
+    if 'shard' in event:
+        return shard_handler(event, context)
+
+    # Scheduled sweep of every workload (see reconciliation_handler)
+    if event.get('detail-type') == 'Scheduled Event':
+        return reconciliation_handler(event, context)
+
+    try:
+        # UpdateAnswer events are buffered by the WorkloadUpdateQueue batching window, so a burst of answer updates on a workload
+        # ends up in a single run covering every question updated
+        workload_updates, failed_message_ids = get_workload_updates(event)
+
+        # TA Check results retrieved for a workload account are reused by the other workloads of the batch
+        shared_ta_check_results = {}
+        for workloadId, workload_update in workload_updates.items():
+            try:
+                track_workload_updates(workloadId, workload_update['lenses'], shared_ta_check_results, context)
+            except Exception as e:
+                logger.error(f"Error encountered. Exception: {e}")
+                if 'Records' not in event:
+                    raise e
+                # Only the messages of the failed workload are delivered again
+                failed_message_ids.update(workload_update['messageIds'])
+
+        if 'Records' in event:
+            return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed_message_ids)]}
+    finally:
+        log_invocation_metrics()
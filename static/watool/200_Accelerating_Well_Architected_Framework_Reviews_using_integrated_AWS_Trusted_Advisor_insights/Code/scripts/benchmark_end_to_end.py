@@ -0,0 +1,214 @@
+# Offline end-to-end benchmark of lambda-wa-tracker and lambda-ticket-listener.
+# Each scenario runs the handlers against the stand-ins of benchmark_fakes (AWS services in memory, local JIRA HTTP server) on a
+# synthetic workload of configurable size, and reports the wall time, the API calls per service and the peak Python memory.
+#
+# Scenarios:
+#   tracker-create     SQS batch of UpdateAnswer events (each question updated twice) on an empty ticket table
+#   tracker-unchanged  the same batch again on a warm container, nothing changed in TA
+#   tracker-changed    the same batch again after a TA refresh that flagged more workload resources
+#   listener-resolve   SQS batch resolving every ticket created (JIRA automation SNS messages and OpsCenter events)
+#   tracker-sharded    tracker-create with the accounts split into shards of --shard-accounts accounts, the shard invocations
+#                      running in parallel threads
+#
+# Usage: python benchmark_end_to_end.py [--accounts 2] [--questions 4] [--choices 5] [--checks-per-choice 2]
+#            [--tagged-resources 500] [--flagged-resources 200] [--hit-ratio 0.2] [--integration opscenter|jira|both]
+#            [--shard-accounts 1] [--repeat 3] [--scenario tracker-create ...] [--keep-rate-limits] [--verbose]
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmark_fakes import FakeAws, FakeJiraServer, Scenario
+from benchmark_utils import load_handler_module
+
+SCENARIOS = ['tracker-create', 'tracker-unchanged', 'tracker-changed', 'listener-resolve', 'tracker-sharded']
+
+# Rate limits of the handlers, lifted unless --keep-rate-limits so that the benchmark measures the code and not the limiters
+RATE_LIMIT_VARIABLES = ['SUPPORT_API_RATE', 'TAGGING_API_RATE', 'WELLARCHITECTED_API_RATE', 'SSM_API_RATE', 'JIRA_API_RATE', 'SNS_API_RATE']
+
+# Fake Lambda context of the invocations
+class FakeContext:
+    function_name = 'benchmark'
+
+    def __init__(self, timeout=300):
+        self.deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.time()) * 1000)
+
+def update_answer_event(scenario, questionId):
+    return {
+        'source': 'aws.wellarchitected',
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {
+            'eventName': 'UpdateAnswer',
+            'requestParameters': {'WorkloadId': scenario.workloadId, 'LensAlias': 'wellarchitected', 'QuestionId': questionId},
+            'responseElements': {'LensArn': scenario.lensArn}
+        }
+    }
+
+# Function to wrap messages in an SQS event, as delivered by the Lambda event source mapping
+def sqs_event(messages):
+    return {'Records': [{'messageId': str(i), 'eventSource': 'aws:sqs', 'body': json.dumps(message)} for i, message in enumerate(messages)]}
+
+def update_answers_event(scenario):
+    return sqs_event([update_answer_event(scenario, questionId) for questionId in scenario.questionIds for _ in range(2)])
+
+# Function to resolve every ticket recorded in the fake DDB table and build its resolution message
+def resolution_event(fake_aws, jira_server):
+    messages = []
+    for item in fake_aws.ddbItems.values():
+        if item.get('ticketType') == 'jira':
+            jira_server.resolve_issue(item['ticketId'])
+            messages.append({'Type': 'Notification', 'Message': json.dumps({'automationData': {'ticketId': item['ticketId']}})})
+        elif item.get('ticketType') == 'opscenter':
+            messages.append({'source': 'aws.ssm', 'detail': {'eventName': 'UpdateOpsItem', 'requestParameters': {'opsItemId': item['ticketId'], 'status': 'Resolved'}}})
+    return sqs_event(messages)
+
+def set_environment(args, jira_url, catalog_file):
+    os.environ['OPS_CENTER_INTEGRATION'] = str(args.integration in ['opscenter', 'both'])
+    os.environ['JIRA_INTEGRATION'] = str(args.integration in ['jira', 'both'])
+    os.environ['JIRA_URL'] = jira_url
+    os.environ['AUTO_BP_MILESTONE_UPDATER'] = 'True'
+    os.environ['FLAGGED_RESOURCES_BUCKET'] = 'benchmark-flagged-resources'
+    os.environ['EMBEDDED_METRICS'] = 'False'
+    os.environ['SHARD_ACCOUNTS'] = '0'
+    if not args.keep_rate_limits:
+        for variable in RATE_LIMIT_VARIABLES:
+            os.environ[variable] = '1000000'
+
+# Function to load a fresh handler module (cold container) backed by the fakes
+def load_handler(fake_aws, function_dir, file_name, catalog_file):
+    module = load_handler_module(function_dir, file_name)
+    fake_aws.install(module)
+    if hasattr(module, 'TA_CHECK_CATALOG_FILE'):
+        module.TA_CHECK_CATALOG_FILE = catalog_file
+    return module
+
+# Logging handler counting the errors logged by the handlers (e.g. a failed JIRA attachment, which does not fail the invocation)
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+# Function to run a tracker invocation and the shard invocations it dispatched, as parallel Lambda invocations would
+def run_sharded(tracker, fake_aws, event):
+    response = tracker.lambda_handler(event, FakeContext())
+    shard_events, fake_aws.lambdaInvocations = fake_aws.lambdaInvocations, []
+    if shard_events:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(shard_events)) as executor:
+            list(executor.map(lambda shard_event: tracker.lambda_handler(shard_event, FakeContext()), shard_events))
+    return response
+
+# Function to run a scenario once. The setup (e.g. creating the tickets to resolve) is not measured.
+# Returns the wall time (seconds), the API calls made by the measured invocation and the peak Python memory (bytes, if traced).
+# A scenario whose handlers logged errors fails, as its measure would not be the one of the normal path.
+def run_scenario(name, args, jira_server, trace_memory):
+    error_counter = ErrorCounter()
+    logging.getLogger().addHandler(error_counter)
+    try:
+        result = run_scenario_logging_errors(name, args, jira_server, trace_memory)
+    finally:
+        logging.getLogger().removeHandler(error_counter)
+    if error_counter.messages:
+        raise SystemExit(f'{name}: the handlers logged {len(error_counter.messages)} errors, the first one: {error_counter.messages[0]}')
+    return result
+
+def run_scenario_logging_errors(name, args, jira_server, trace_memory):
+    scenario = Scenario(args.accounts, args.questions, args.choices, args.checks_per_choice, args.tagged_resources, args.flagged_resources, args.hit_ratio)
+    fake_aws = FakeAws(scenario)
+    # The tracker finds the issues of a previous run by label, each run starts from an empty JIRA project
+    jira_server.issues.clear()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        catalog_file = os.path.join(tmp_dir, 'ta-check-catalog.json')
+        set_environment(args, jira_server.url, catalog_file)
+        tracker = load_handler(fake_aws, 'LambdaWATracker', 'lambda-wa-tracker.py', catalog_file)
+        # A deployment whose ticket entries were migrated by a first scheduled invocation
+        tracker.migrate_ticket_entries(FakeContext())
+
+        if name == 'tracker-create':
+            handler, event = tracker.lambda_handler, update_answers_event(scenario)
+        elif name == 'tracker-sharded':
+            tracker.SHARD_ACCOUNTS = args.shard_accounts
+            handler, event = lambda event, context: run_sharded(tracker, fake_aws, event), update_answers_event(scenario)
+        else:
+            tracker.lambda_handler(update_answers_event(scenario), FakeContext())
+            if name == 'tracker-unchanged':
+                handler, event = tracker.lambda_handler, update_answers_event(scenario)
+            elif name == 'tracker-changed':
+                scenario.taTimestamp = '2024-01-02T00:00:00Z'
+                scenario.flaggedResources = int(scenario.flaggedResources * 1.1) + 1
+                handler, event = tracker.lambda_handler, update_answers_event(scenario)
+            else:
+                listener = load_handler(fake_aws, 'LambdaTicketListener', 'lambda-ticket-listener.py', catalog_file)
+                handler, event = listener.lambda_handler, resolution_event(fake_aws, jira_server)
+
+        calls_before = fake_aws.calls.copy()
+        jira_calls_before = jira_server.calls.copy()
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        response = handler(event, FakeContext())
+        elapsed = time.perf_counter() - start
+        peak_memory = None
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    if response and response.get('batchItemFailures'):
+        raise SystemExit(f'{name}: the handler reported failed messages {response["batchItemFailures"]}')
+
+    calls = fake_aws.calls - calls_before
+    for route, count in (jira_server.calls - jira_calls_before).items():
+        calls['jira.' + route] = count
+    return elapsed, calls, peak_memory, len([item for item in fake_aws.ddbItems.values() if 'ticketType' in item])
+
+def summarize_calls(calls):
+    services = {}
+    for call, count in calls.items():
+        service = call.split('.')[0]
+        services[service] = services.get(service, 0) + count
+    return ', '.join(f'{service} {count}' for service, count in sorted(services.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of the tracker and listener handlers')
+    parser.add_argument('--accounts', type=int, default=2, help='workload accounts')
+    parser.add_argument('--questions', type=int, default=4, help='questions updated')
+    parser.add_argument('--choices', type=int, default=5, help='best practices per question')
+    parser.add_argument('--checks-per-choice', type=int, default=2, help='TA Checks per best practice')
+    parser.add_argument('--tagged-resources', type=int, default=500, help='tagged workload resources per account')
+    parser.add_argument('--flagged-resources', type=int, default=200, help='flagged resources per TA Check and account')
+    parser.add_argument('--hit-ratio', type=float, default=0.2, help='share of the flagged resources that are workload resources')
+    parser.add_argument('--integration', choices=['opscenter', 'jira', 'both'], default='both')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help='scenario to run (repeatable, default: all)')
+    parser.add_argument('--shard-accounts', type=int, default=1, help='accounts per shard of the tracker-sharded scenario')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per scenario, the peak memory is measured in an extra run')
+    parser.add_argument('--keep-rate-limits', action='store_true', help='keep the default client-side rate limits of the handlers')
+    parser.add_argument('--verbose', action='store_true', help='print the API calls per operation')
+    args = parser.parse_args()
+
+    print(f'{args.accounts} accounts, {args.questions} questions x {args.choices} choices x {args.checks_per_choice} TA Checks, '
+        f'{args.tagged_resources} tagged and {args.flagged_resources} flagged resources per account (hit ratio {args.hit_ratio}), integration: {args.integration}')
+    print(f'{"scenario":<20} {"tickets":>8} {"min ms":>10} {"median ms":>10} {"peak MB":>8}   API calls')
+    with FakeJiraServer(os.environ.get('JIRA_PROJECT_KEY', 'WALAB')) as jira_server:
+        for name in args.scenario or SCENARIOS:
+            timings = []
+            for _ in range(args.repeat):
+                elapsed, calls, peak_memory, tickets = run_scenario(name, args, jira_server, False)
+                timings.append(elapsed)
+            elapsed, calls, peak_memory, tickets = run_scenario(name, args, jira_server, True)
+            print(f'{name:<20} {tickets:>8} {min(timings) * 1000:>10.1f} {statistics.median(timings) * 1000:>10.1f} {peak_memory / 2 ** 20:>8.1f}   {summarize_calls(calls)}')
+            if args.verbose:
+                for call, count in sorted(calls.items()):
+                    print(f'{"":<22}{call}: {count}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+# Offline stand-ins of the AWS services and of JIRA used by the Lambda handlers, for the end-to-end benchmark.
+# FakeAws serves synthetic WA Tool, Trusted Advisor and tagging data, and keeps the DDB table, OpsItems, SNS messages and WA Tool
+# updates, as well as the asynchronous Lambda invocations, in memory. It replaces the boto3 module of a handler module (see FakeAws.install). FakeJiraServer is a local HTTP server
+# answering the JIRA REST calls made by the jira client. Every call is counted per service and operation.
+import collections
+import json
+import re
+import threading
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+CALLER_ACCOUNT_ID = '111111111111'
+
+# Entries per page of the DDB scans
+SCAN_PAGE_SIZE = 100
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+def serialize(item):
+    return {key: serializer.serialize(value) for key, value in item.items()}
+
+def deserialize(item):
+    return {key: deserializer.deserialize(value) for key, value in item.items()}
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+class OpsItemAlreadyExistsException(Exception):
+    pass
+
+class FakeExceptions:
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    OpsItemAlreadyExistsException = OpsItemAlreadyExistsException
+
+class FakeEvents:
+    def register(self, event_name, handler):
+        pass
+
+class FakeMeta:
+    events = FakeEvents()
+
+# Synthetic workload: WA Tool questions and choices, TA Checks of each choice, tagged and flagged resources of each account
+class Scenario:
+    def __init__(self, accounts, questions, choices, checks_per_choice, tagged_resources, flagged_resources, hit_ratio):
+        self.accountIds = [str(int(CALLER_ACCOUNT_ID) + i) for i in range(accounts)]
+        self.questionIds = ['question' + str(i) for i in range(questions)]
+        self.choices = choices
+        self.checksPerChoice = checks_per_choice
+        self.taggedResources = tagged_resources
+        self.flaggedResources = flagged_resources
+        self.hitRatio = hit_ratio
+        self.workloadId = format(1, '032x')
+        self.lensArn = 'arn:aws:wellarchitected::aws:lens/wellarchitected'
+        # Refresh time of every TA Check, changed to simulate a TA refresh
+        self.taTimestamp = '2024-01-01T00:00:00Z'
+
+    def choice_id(self, questionId, index):
+        return questionId + '_choice' + str(index)
+
+    # TA Checks of a choice: consecutive choices share half of their TA Checks, as in the WA Tool
+    def check_ids(self, questionId, choiceId):
+        first = (self.questionIds.index(questionId) * self.choices + int(choiceId.rsplit('choice', 1)[1])) * max(1, self.checksPerChoice // 2)
+        return ['check' + str(i) for i in range(first, first + self.checksPerChoice)]
+
+    def all_check_ids(self):
+        return sorted(set(check_id for questionId in self.questionIds for i in range(self.choices) for check_id in self.check_ids(questionId, self.choice_id(questionId, i))))
+
+    def resource_arn(self, account_id, index):
+        return 'arn:aws:s3:::walab-' + account_id + '-' + str(index)
+
+    # Flagged resources of a TA Check in an account, hit_ratio of them being tagged workload resources
+    def flagged(self, account_id, check_id):
+        seed = sum(ord(c) for c in account_id + check_id)
+        hits = int(self.flaggedResources * self.hitRatio)
+        resources = []
+        for i in range(self.flaggedResources):
+            if i < hits:
+                resource = self.resource_arn(account_id, (seed + i * 7) % max(1, self.taggedResources))
+            else:
+                resource = 'arn:aws:s3:::not-tagged-' + str(seed) + '-' + str(i)
+            resources.append({'status': 'warning', 'resourceId': format(i, '040x'), 'isSuppressed': False,
+                'metadata': ['us-east-1', resource.split(':')[-1], 'Yellow', resource, datetime(2024, 1, 1).isoformat()]})
+        return resources
+
+class FakeAws:
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+        self.ddbItems = {}
+        self.opsItems = {}
+        self.snsMessages = []
+        self.answerUpdates = []
+        self.milestones = []
+        self.s3Objects = {}
+        self.lambdaInvocations = []
+
+    # Replaces the boto3 module of a handler module
+    def install(self, module):
+        fake_aws = self
+
+        class FakeSession:
+            def __init__(self, aws_access_key_id=None, **kwargs):
+                self.accountId = aws_access_key_id[len('FAKE'):] if aws_access_key_id else CALLER_ACCOUNT_ID
+
+            def client(self, service, **kwargs):
+                return FakeClient(fake_aws, service, self.accountId)
+
+        class FakeBoto3:
+            session = type('session', (), {'Session': FakeSession})
+
+            @staticmethod
+            def client(service, **kwargs):
+                return FakeClient(fake_aws, service, CALLER_ACCOUNT_ID)
+
+        module.boto3 = FakeBoto3
+
+    def count(self, service, operation):
+        with self.lock:
+            self.calls[service + '.' + operation] += 1
+
+    # WA Tool
+    def wellarchitected_get_workload(self, account_id, WorkloadId):
+        return {'Workload': {'WorkloadId': WorkloadId, 'WorkloadName': 'Benchmark workload', 'AccountIds': self.scenario.accountIds, 'Lenses': ['wellarchitected']}}
+
+    def wellarchitected_get_answer(self, account_id, WorkloadId, LensAlias, QuestionId, **kwargs):
+        choices = [{'ChoiceId': self.scenario.choice_id(QuestionId, i), 'Title': 'Best practice ' + str(i) + ' of ' + QuestionId} for i in range(self.scenario.choices)]
+        choices.append({'ChoiceId': QuestionId + '_no', 'Title': 'None of these'})
+        return {'LensArn': self.scenario.lensArn, 'Answer': {
+            'QuestionId': QuestionId, 'PillarId': 'security', 'QuestionTitle': 'Title of ' + QuestionId, 'Risk': 'HIGH', 'IsApplicable': True,
+            'SelectedChoices': [], 'Choices': choices, 'ChoiceAnswers': []
+        }}
+
+    def wellarchitected_get_lens_review(self, account_id, WorkloadId, LensAlias, **kwargs):
+        return {'WorkloadId': WorkloadId, 'LensReview': {'LensAlias': LensAlias, 'LensArn': self.scenario.lensArn, 'LensVersion': '2023-10-03'}}
+
+    def wellarchitected_list_check_details(self, account_id, QuestionId, ChoiceId, **kwargs):
+        return {'CheckDetails': [{'Id': check_id, 'Provider': 'TRUSTED_ADVISOR'} for check_id in self.scenario.check_ids(QuestionId, ChoiceId)]}
+
+    def wellarchitected_update_answer(self, account_id, **kwargs):
+        self.answerUpdates.append(kwargs)
+        return {}
+
+    def wellarchitected_create_milestone(self, account_id, **kwargs):
+        self.milestones.append(kwargs)
+        return {'MilestoneNumber': len(self.milestones)}
+
+    # Trusted Advisor
+    def support_describe_trusted_advisor_checks(self, account_id, language):
+        return {'checks': [{'id': check_id, 'name': 'Check ' + check_id, 'category': 'security', 'description': 'See <a href="https://docs.aws.amazon.com/' + check_id + '" target="_blank">the documentation</a>',
+            'metadata': ['Region', 'Bucket Name', 'Status', 'Bucket ARN', 'Last Updated Time']} for check_id in self.scenario.all_check_ids()]}
+
+    def support_describe_trusted_advisor_check_summaries(self, account_id, checkIds):
+        return {'summaries': [{'checkId': check_id, 'timestamp': self.scenario.taTimestamp, 'status': 'warning'} for check_id in checkIds]}
+
+    def support_describe_trusted_advisor_check_result(self, account_id, checkId, language):
+        return {'result': {'checkId': checkId, 'timestamp': self.scenario.taTimestamp, 'status': 'warning', 'flaggedResources': self.scenario.flagged(account_id, checkId)}}
+
+    # Tagging, 100 resources per page
+    def resourcegroupstaggingapi_get_resources(self, account_id, PaginationToken='', **kwargs):
+        start = int(PaginationToken or 0)
+        end = min(start + 100, self.scenario.taggedResources)
+        return {'ResourceTagMappingList': [{'ResourceARN': self.scenario.resource_arn(account_id, i)} for i in range(start, end)],
+            'PaginationToken': str(end) if end < self.scenario.taggedResources else ''}
+
+    # STS: the access key id of the assumed role credentials carries the account id
+    def sts_get_caller_identity(self, account_id):
+        return {'Account': account_id}
+
+    def sts_assume_role(self, account_id, RoleArn, **kwargs):
+        return {'Credentials': {'AccessKeyId': 'FAKE' + RoleArn.split(':')[4], 'SecretAccessKey': 'fake', 'SessionToken': 'fake',
+            'Expiration': datetime.now(timezone.utc) + timedelta(hours=1)}}
+
+    # SSM
+    def ssm_create_ops_item(self, account_id, **kwargs):
+        with self.lock:
+            ops_item_id = 'oi-' + format(len(self.opsItems) + 1, '012x')
+            self.opsItems[ops_item_id] = kwargs
+        return {'OpsItemId': ops_item_id}
+
+    def ssm_update_ops_item(self, account_id, OpsItemId, **kwargs):
+        self.opsItems[OpsItemId].update(kwargs)
+        return {}
+
+    def ssm_get_parameter(self, account_id, Name, **kwargs):
+        return {'Parameter': {'Name': Name, 'Value': 'benchmark-token'}}
+
+    # S3 and SNS
+    def s3_put_object(self, account_id, Bucket, Key, Body, **kwargs):
+        self.s3Objects[(Bucket, Key)] = kwargs.get('ContentType')
+        return {}
+
+    def sns_publish(self, account_id, **kwargs):
+        self.snsMessages.append(kwargs)
+        return {'MessageId': str(len(self.snsMessages))}
+
+    # Lambda: asynchronous invocations are recorded, the benchmark runs them
+    def lambda_invoke(self, account_id, FunctionName, InvocationType, Payload):
+        with self.lock:
+            self.lambdaInvocations.append(json.loads(Payload))
+        return {'StatusCode': 202}
+
+    # DDB: the ticket state table, with the key conditions and update expressions used by the handlers
+    def ddb_key(self, key):
+        return (key['ticketHeaderKey'], key['creationDate'])
+
+    def dynamodb_query(self, account_id, KeyConditionExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, Select=None, **kwargs):
+        attribute = (ExpressionAttributeNames or {}).get(KeyConditionExpression.split(' = ')[0], KeyConditionExpression.split(' = ')[0])
+        value = deserialize(ExpressionAttributeValues)[':k']
+        with self.lock:
+            items = [item for item in self.ddbItems.values() if item.get(attribute) == value]
+        if Select == 'COUNT':
+            return {'Count': len(items)}
+        return {'Items': [serialize(item) for item in items], 'Count': len(items)}
+
+    # Scan of the entries having an attribute, in pages of SCAN_PAGE_SIZE entries
+    def dynamodb_scan(self, account_id, FilterExpression, ProjectionExpression, ExclusiveStartKey=None, **kwargs):
+        attribute = re.fullmatch(r'attribute_exists\((\w+)\)', FilterExpression).group(1)
+        start_key = self.ddb_key(deserialize(ExclusiveStartKey)) if ExclusiveStartKey else None
+        with self.lock:
+            keys = sorted(key for key, item in self.ddbItems.items() if attribute in item and (start_key == None or key > start_key))
+            items = [{name: self.ddbItems[key][name] for name in ProjectionExpression.split(', ') if name in self.ddbItems[key]} for key in keys[:SCAN_PAGE_SIZE]]
+        response = {'Items': [serialize(item) for item in items]}
+        if len(keys) > SCAN_PAGE_SIZE:
+            response['LastEvaluatedKey'] = serialize(dict(zip(['ticketHeaderKey', 'creationDate'], keys[SCAN_PAGE_SIZE - 1])))
+        return response
+
+    def dynamodb_get_item(self, account_id, Key, **kwargs):
+        with self.lock:
+            item = self.ddbItems.get(self.ddb_key(deserialize(Key)))
+        return {'Item': serialize(item)} if item else {}
+
+    def dynamodb_batch_get_item(self, account_id, RequestItems):
+        table, request = list(RequestItems.items())[0]
+        with self.lock:
+            items = [self.ddbItems[self.ddb_key(deserialize(key))] for key in request['Keys'] if self.ddb_key(deserialize(key)) in self.ddbItems]
+        return {'Responses': {table: [serialize(item) for item in items]}, 'UnprocessedKeys': {}}
+
+    def dynamodb_batch_write_item(self, account_id, RequestItems):
+        with self.lock:
+            for request in list(RequestItems.values())[0]:
+                if 'PutRequest' in request:
+                    item = deserialize(request['PutRequest']['Item'])
+                    self.ddbItems[self.ddb_key(item)] = item
+                else:
+                    self.ddbItems.pop(self.ddb_key(deserialize(request['DeleteRequest']['Key'])), None)
+        return {'UnprocessedItems': {}}
+
+    def dynamodb_put_item(self, account_id, Item, **kwargs):
+        item = deserialize(Item)
+        with self.lock:
+            self.ddbItems[self.ddb_key(item)] = item
+        return {}
+
+    def dynamodb_delete_item(self, account_id, Key, ConditionExpression=None, ExpressionAttributeValues=None, **kwargs):
+        with self.lock:
+            key = self.ddb_key(deserialize(Key))
+            if ConditionExpression and key not in self.ddbItems:
+                raise ConditionalCheckFailedException()
+            if ConditionExpression == 'ticketCreationDate = :c' and self.ddbItems[key].get('ticketCreationDate') != deserialize(ExpressionAttributeValues)[':c']:
+                raise ConditionalCheckFailedException()
+            return {'Attributes': serialize(self.ddbItems.pop(key, {}))}
+
+    def dynamodb_update_item(self, account_id, Key, UpdateExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, ConditionExpression=None, **kwargs):
+        values = deserialize(ExpressionAttributeValues)
+        with self.lock:
+            key = self.ddb_key(deserialize(Key))
+            item = self.ddbItems.get(key)
+            if UpdateExpression == 'SET #l = :l':
+                if item and item.get('leaseExpiresAt', 0) >= values[':now']:
+                    raise ConditionalCheckFailedException()
+                item = item or dict(zip(['ticketHeaderKey', 'creationDate'], key))
+                item['leaseExpiresAt'] = values[':l']
+            elif UpdateExpression == 'SET openTickets = if_not_exists(openTickets, :seed) + :n':
+                item = item or dict(zip(['ticketHeaderKey', 'creationDate'], key))
+                item['openTickets'] = item.get('openTickets', values[':seed']) + values[':n']
+            elif UpdateExpression == 'SET openTickets = :o':
+                # attribute_not_exists(openTickets), OR openTickets < :n when :n is given
+                if item != None and 'openTickets' in item and (':n' not in values or item['openTickets'] >= values[':n']):
+                    raise ConditionalCheckFailedException()
+                item = item or dict(zip(['ticketHeaderKey', 'creationDate'], key))
+                item['openTickets'] = values[':o']
+            elif UpdateExpression == 'ADD openTickets :d':
+                if ConditionExpression and (item == None or item.get('openTickets', 0) < values[':n']):
+                    raise ConditionalCheckFailedException()
+                item = item or dict(zip(['ticketHeaderKey', 'creationDate'], key))
+                item['openTickets'] = item.get('openTickets', 0) + values[':d']
+            elif UpdateExpression == 'ADD completedShards :s':
+                item = item or dict(zip(['ticketHeaderKey', 'creationDate'], key))
+                item['completedShards'] = item.get('completedShards', set()) | values[':s']
+            elif UpdateExpression in ('ADD runIds :r', 'DELETE runIds :r'):
+                item = item or dict(zip(['ticketHeaderKey', 'creationDate'], key))
+                runIds = item.get('runIds', set())
+                item['runIds'] = runIds | values[':r'] if UpdateExpression.startswith('ADD') else runIds - values[':r']
+                # DDB removes a set attribute left empty
+                if not item['runIds']:
+                    del item['runIds']
+            elif UpdateExpression == 'SET dispatchedAt = :now ADD dispatches :one':
+                item['dispatchedAt'] = values[':now']
+                item['dispatches'] = item['dispatches'] + values[':one']
+            elif UpdateExpression == 'SET completedAt = :now':
+                if item == None or 'completedAt' in item:
+                    raise ConditionalCheckFailedException()
+                item['completedAt'] = values[':now']
+            else:
+                raise NotImplementedError('Update expression not supported by the fake DDB table: ' + UpdateExpression)
+            self.ddbItems[key] = item
+            return {'Attributes': serialize(item)}
+
+    def dynamodb_transact_write_items(self, account_id, TransactItems):
+        for transact_item in TransactItems:
+            if 'Put' in transact_item:
+                self.dynamodb_put_item(account_id, transact_item['Put']['Item'])
+            else:
+                self.dynamodb_update_item(account_id, **{key: value for key, value in transact_item['Update'].items() if key != 'TableName'})
+        return {}
+
+class FakeClient:
+    exceptions = FakeExceptions
+    meta = FakeMeta()
+
+    def __init__(self, fake_aws, service, account_id):
+        self.fakeAws = fake_aws
+        self.service = service
+        self.accountId = account_id
+
+    def __getattr__(self, operation):
+        implementation = getattr(self.fakeAws, self.service + '_' + operation, None)
+        if implementation == None:
+            raise AttributeError(f'{self.service}.{operation} is not supported by the benchmark fakes')
+
+        def call(*args, **kwargs):
+            self.fakeAws.count(self.service, operation)
+            return implementation(self.accountId, *args, **kwargs)
+        return call
+
+# Local JIRA server answering the REST calls of the jira client: server info, project, issue types, issue creation (single and
+# bulk), retrieval and search by label and status category, comments, and attachments (added, listed in the issue and deleted).
+# Issues are kept in memory.
+# resolve_issue moves an issue to the Done status category, as the JIRA automation does before notifying the ticket listener.
+class FakeJiraServer:
+    def __init__(self, project_key):
+        self.projectKey = project_key
+        self.issues = {}
+        self.comments = collections.Counter()
+        # Attachments of each issue, as returned by the attachments route
+        self.attachments = collections.defaultdict(list)
+        self.attachmentIds = 0
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.request_handler())
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def issue_json(self, key):
+        fields = dict(self.issues[key], attachment=list(self.attachments[key]))
+        return {'id': key.split('-')[1], 'key': key, 'self': self.url + '/rest/api/2/issue/' + key, 'fields': fields}
+
+    def create_issue(self, fields):
+        with self.lock:
+            key = self.projectKey + '-' + str(len(self.issues) + 1)
+            self.issues[key] = fields
+        return {'id': key.split('-')[1], 'key': key, 'self': self.url + '/rest/api/2/issue/' + key}
+
+    def resolve_issue(self, key):
+        with self.lock:
+            self.issues[key]['status'] = {'name': 'Done', 'statusCategory': {'key': 'done', 'name': 'Done'}}
+
+    def handle(self, method, path, body):
+        route = re.sub(r'/[A-Z]+-\d+', '/{key}', path.split('?')[0])
+        with self.lock:
+            self.calls[method + ' ' + route] += 1
+        if route == '/rest/api/2/serverInfo':
+            return 200, {'baseUrl': self.url, 'version': '9.0.0', 'versionNumbers': [9, 0, 0], 'deploymentType': 'Server', 'serverTitle': 'Benchmark'}
+        if route.startswith('/rest/api/2/project/'):
+            return 200, {'id': '10000', 'key': self.projectKey, 'name': 'Benchmark', 'self': self.url + '/rest/api/2/project/10000'}
+        if route.startswith('/rest/api/2/issuetype') or route.startswith('/rest/api/2/issue/createmeta'):
+            return 200, [{'id': '10001', 'name': 'Task', 'self': self.url + '/rest/api/2/issuetype/10001'}]
+        if route == '/rest/api/2/field':
+            return 200, []
+        if route == '/rest/api/2/issue' and method == 'POST':
+            return 201, self.create_issue(json.loads(body)['fields'])
+        if route == '/rest/api/2/issue/bulk' and method == 'POST':
+            return 201, {'issues': [self.create_issue(issue['fields']) for issue in json.loads(body)['issueUpdates']], 'errors': []}
+        if route == '/rest/api/2/search':
+            jql = urllib.parse.parse_qs(urllib.parse.urlparse(path).query)['jql'][0]
+            labels = set(re.findall(r'"([^"]+)"', jql.split(' labels in ', 1)[1])) if ' labels in ' in jql else set()
+            unresolved_only = 'statusCategory != Done' in jql
+            with self.lock:
+                issues = [self.issue_json(key) for key, fields in self.issues.items() if labels & set(fields.get('labels', []))
+                          and not (unresolved_only and 'status' in fields)]
+            return 200, {'startAt': 0, 'maxResults': max(len(issues), 1), 'total': len(issues), 'issues': issues}
+        if route.startswith('/rest/api/2/attachment/') and method == 'DELETE':
+            attachment_id = route.split('/')[-1]
+            with self.lock:
+                for attachments in self.attachments.values():
+                    attachments[:] = [attachment for attachment in attachments if attachment['id'] != attachment_id]
+            return 204, None
+        key = next((part for part in path.split('?')[0].split('/') if re.fullmatch(r'[A-Z]+-\d+', part)), None)
+        if key not in self.issues:
+            return 404, {'errorMessages': ['Not supported by the benchmark JIRA server: ' + method + ' ' + path]}
+        if route == '/rest/api/2/issue/{key}' and method == 'GET':
+            return 200, self.issue_json(key)
+        if route == '/rest/api/2/issue/{key}/comment':
+            with self.lock:
+                self.comments[key] += 1
+            return 201, {'id': str(self.comments[key]), 'body': json.loads(body)['body'], 'self': self.url + path}
+        if route == '/rest/api/2/issue/{key}/attachments':
+            filename = re.search(rb'filename="([^"]+)"', body).group(1).decode()
+            with self.lock:
+                self.attachmentIds += 1
+                attachment_id = str(self.attachmentIds)
+                attachment = {'id': attachment_id, 'filename': filename, 'size': len(body), 'mimeType': 'application/gzip',
+                    'self': self.url + '/rest/api/2/attachment/' + attachment_id, 'content': self.url + '/secure/attachment/' + attachment_id + '/' + filename}
+                self.attachments[key].append(attachment)
+            return 200, [attachment]
+        return 404, {'errorMessages': ['Not supported by the benchmark JIRA server: ' + method + ' ' + path]}
+
+    def request_handler(self):
+        fake_jira = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, which Nagle's algorithm would delay on keep-alive connections
+            disable_nagle_algorithm = True
+
+            def respond(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, payload = fake_jira.handle(self.command, self.path, body)
+                response = json.dumps(payload).encode() if payload != None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_GET = respond
+            do_POST = respond
+            do_PUT = respond
+            do_DELETE = respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
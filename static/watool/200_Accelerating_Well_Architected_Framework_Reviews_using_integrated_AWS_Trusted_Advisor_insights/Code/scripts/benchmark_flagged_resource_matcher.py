@@ -0,0 +1,88 @@
+# Micro-benchmark of the flagged resource matcher used by lambda-wa-tracker add_flagged_resources.
+# Compares the set-intersection matcher (match_flagged_resource) with the previous list scan on synthetic inventories, and
+# with the region-partitioned lookup of multi-region inventories (resources spread over --regions regions).
+#
+# Usage: python benchmark_flagged_resource_matcher.py [--resources 20000] [--flagged 5000] [--hit-ratio 0.1] [--regions 4]
+import argparse
+import random
+import time
+
+from benchmark_utils import load_handler_module
+
+# Previous matcher, kept here as the baseline
+def legacy_match_flagged_resource(flagged_resource, check_id, workload_resources, non_resource_specific_ta_checks):
+    if any(x in flagged_resource['metadata'] for x in workload_resources["resource_arns"]):
+        return 'arn'
+    elif any(x in flagged_resource['metadata'] for x in workload_resources["resource_names"]):
+        return 'name'
+    elif check_id in non_resource_specific_ta_checks:
+        return 'check'
+    return None
+
+# Function to build the synthetic inventory: resource ARNs and their region
+def build_inventory(resource_count, regions):
+    resource_arns = {'arn:aws:s3:::walab-bucket-' + str(i): regions[i % len(regions)] for i in range(resource_count // 2)}
+    for i in range(resource_count - len(resource_arns)):
+        region = regions[i % len(regions)]
+        resource_arns['arn:aws:ec2:' + region + ':111111111111:instance/i-' + format(i, '017x')] = region
+    return resource_arns
+
+def build_flagged_resources(resource_arns, flagged_count, hit_ratio, regions):
+    arns = list(resource_arns)
+    flagged_resources = []
+    for i in range(flagged_count):
+        if random.random() < hit_ratio:
+            arn = random.choice(arns)
+            region = resource_arns[arn]
+            # TA metadata carries either the ARN or the short resource name
+            resource = arn if random.random() < 0.5 else arn.split(':')[-1]
+        else:
+            region = random.choice(regions)
+            resource = 'not-a-workload-resource-' + str(i)
+        flagged_resources.append({'status': 'warning', 'metadata': [region, resource, 'Yellow', None, str(i)]})
+    return flagged_resources
+
+def get_resource_sets(resource_arns):
+    return {'resource_arns': set(resource_arns), 'resource_names': set(arn.split(':')[-1] for arn in resource_arns)}
+
+def run(label, matcher, flagged_resources, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matches = [matcher(flagged_resource) for flagged_resource in flagged_resources]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<12} {best * 1000:>12.2f} ms   ({len(flagged_resources) / best:,.0f} flagged resources/s)')
+    return matches, best
+
+def main():
+    parser = argparse.ArgumentParser(description='Flagged resource matcher micro-benchmark')
+    parser.add_argument('--resources', type=int, default=20000, help='number of tagged workload resources')
+    parser.add_argument('--flagged', type=int, default=5000, help='number of TA flagged resources')
+    parser.add_argument('--hit-ratio', type=float, default=0.1, help='share of flagged resources belonging to the workload')
+    parser.add_argument('--regions', type=int, default=4, help='number of regions of the workload resources')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    tracker = load_handler_module('LambdaWATracker', 'lambda-wa-tracker.py')
+
+    regions = ['us-east-1', 'eu-west-1', 'ap-southeast-2', 'us-west-2', 'eu-central-1', 'sa-east-1'][:max(1, min(args.regions, 6))]
+    resource_arns = build_inventory(args.resources, regions)
+    workload_resources = get_resource_sets(resource_arns)
+    workload_resources['regions'] = {region: get_resource_sets([arn for arn, arn_region in resource_arns.items() if arn_region == region]) for region in regions}
+    legacy_workload_resources = {key: list(value) for key, value in workload_resources.items() if key != 'regions'}
+    flagged_resources = build_flagged_resources(resource_arns, args.flagged, args.hit_ratio, regions)
+
+    print(f'{args.resources} workload resources in {len(regions)} regions, {args.flagged} flagged resources, hit ratio {args.hit_ratio}')
+    legacy_matches, legacy_time = run('list scan', lambda r: legacy_match_flagged_resource(r, 'checkId', legacy_workload_resources, tracker.NON_RESOURCE_SPECIFIC_TA_CHECKS), flagged_resources, args.repeat)
+    set_matches, set_time = run('set match', lambda r: tracker.match_flagged_resource(r, 'checkId', workload_resources), flagged_resources, args.repeat)
+    region_matches, region_time = run('region match', lambda r: tracker.match_flagged_resource(r, 'checkId', workload_resources, 0), flagged_resources, args.repeat)
+
+    if legacy_matches != set_matches or set_matches != region_matches:
+        raise SystemExit('Matchers disagree on the synthetic inventory')
+    print(f'speed-up     {legacy_time / set_time:>12.1f}x (set), {legacy_time / region_time:.1f}x (region)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Startup benchmark of the Lambda handler modules.
+# Each handler module is imported in a fresh Python process (as on a Lambda cold start) with placeholder AWS credentials,
+# and the import time is reported together with the heavy modules that got loaded.
+#
+# Usage: python benchmark_startup.py [--runs 10] [--jira-integration]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmark_utils import BENCHMARK_ENVIRONMENT
+
+HANDLERS = [
+    ('LambdaWATracker', 'lambda-wa-tracker.py'),
+    ('LambdaTicketListener', 'lambda-ticket-listener.py'),
+    ('LambdaStatusAggregator', 'lambda-status-aggregator.py')
+]
+
+# Modules whose import is worth reporting when a handler module loads them
+WATCHED_MODULES = ['jira', 'requests', 'boto3.dynamodb.table', 'concurrent.futures']
+
+IMPORT_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {scripts_dir!r})
+start = time.perf_counter()
+from benchmark_utils import load_handler_module
+load_handler_module({function_dir!r}, {file_name!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': [m for m in {watched!r} if m in sys.modules]}}))
+'''
+
+def measure(function_dir, file_name, environment):
+    probe = IMPORT_PROBE.format(scripts_dir=os.path.dirname(os.path.abspath(__file__)), function_dir=function_dir, file_name=file_name, watched=WATCHED_MODULES)
+    output = subprocess.run([sys.executable, '-c', probe], env=environment, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Lambda handler startup benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes per handler')
+    parser.add_argument('--jira-integration', action='store_true', help='set JIRA_INTEGRATION=True')
+    args = parser.parse_args()
+
+    environment = dict(os.environ)
+    environment.update(BENCHMARK_ENVIRONMENT)
+    environment['JIRA_INTEGRATION'] = str(args.jira_integration)
+    # Placeholder credentials only, no AWS call is made while importing
+    environment.pop('AWS_PROFILE', None)
+
+    print(f'{"handler":<28} {"min ms":>8} {"median ms":>10}   loaded modules')
+    for function_dir, file_name in HANDLERS:
+        samples = [measure(function_dir, file_name, environment) for _ in range(args.runs)]
+        timings = [sample['seconds'] * 1000 for sample in samples]
+        print(f'{file_name:<28} {min(timings):>8.1f} {statistics.median(timings):>10.1f}   {", ".join(samples[-1]["modules"]) or "-"}')
+
+if __name__ == '__main__':
+    main()
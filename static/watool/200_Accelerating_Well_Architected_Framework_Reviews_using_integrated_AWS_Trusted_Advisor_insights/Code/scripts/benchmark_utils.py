@@ -0,0 +1,41 @@
+# Helpers shared by the offline benchmark scripts.
+# The Lambda handler modules read their configuration from environment variables at import time and their
+# file names are not valid Python module names, so they are loaded from their path with placeholder settings.
+import importlib.util
+import os
+
+SAM_SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SAM', 'src')
+
+# Placeholder Lambda environment. No AWS call is made with these values.
+BENCHMARK_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'OPS_CENTER_INTEGRATION': 'True',
+    'JIRA_INTEGRATION': 'False',
+    'AUTO_BP_MILESTONE_UPDATER': 'True',
+    'TAG_KEY': 'ApplicationID',
+    'TAG_VALUE': 'MySampleWorkload',
+    'SCAN_ALL': 'False',
+    'JIRA_URL': 'http://127.0.0.1:8080',
+    'JIRA_USERNAME': 'benchmark@example.com',
+    'JIRA_SECRET_SSM_PARAM': 'walabjirasecret',
+    'JIRA_PROJECT_KEY': 'WALAB',
+    'DDB_TABLE': 'TicketStateTable',
+    'STATUS_TABLE': 'WorkloadStatusTable',
+    'WORKLOAD_ACCOUNT_ROLE_NAME': 'WAToolTrustedRole',
+    'TOPIC_WORKLOAD_BP_UPDATE': 'arn:aws:sns:us-east-1:111111111111:WorkloadBPUpdateTopic'
+}
+
+def set_benchmark_environment():
+    for key, value in BENCHMARK_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+
+# Function to import a Lambda handler module (e.g. 'LambdaWATracker', 'lambda-wa-tracker.py')
+def load_handler_module(function_dir, file_name):
+    set_benchmark_environment()
+    module_name = file_name[:-len('.py')].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SAM_SRC_DIR, function_dir, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
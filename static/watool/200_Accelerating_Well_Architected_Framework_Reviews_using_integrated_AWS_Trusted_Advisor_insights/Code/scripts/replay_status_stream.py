@@ -0,0 +1,185 @@
+# Offline replay harness of lambda-status-aggregator.
+# Synthetic TicketStateTable stream records (ticket creations, updates and resolutions, plus state entries that must be ignored)
+# are replayed in batches against an in-memory status table, some batches being delivered twice as after a failed invocation.
+# The summaries built by the handler are then checked against the open tickets left at the end of the replay.
+#
+# Usage: python replay_status_stream.py [--workloads 3] [--tickets 200] [--batch-size 100] [--redelivery-ratio 0.2]
+import argparse
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+from benchmark_utils import load_handler_module
+
+PILLARS = ['operationalExcellence', 'security', 'reliability', 'performance', 'costOptimization', 'sustainability']
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+def serialize(item):
+    return {key: serializer.serialize(value) for key, value in item.items()}
+
+def deserialize(item):
+    return {key: deserializer.deserialize(value) for key, value in item.items()}
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+class FakeExceptions:
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+
+# In-memory DDB low-level client of the status table, limited to the expressions used by the aggregator
+class FakeStatusTable:
+    exceptions = FakeExceptions
+
+    def __init__(self):
+        self.items = {}
+        self.calls = {}
+
+    def count_call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def batch_write_item(self, RequestItems):
+        self.count_call('batch_write_item')
+        for request in list(RequestItems.values())[0]:
+            if 'PutRequest' in request:
+                item = deserialize(request['PutRequest']['Item'])
+                self.items[(item['workloadId'], item['summaryKey'])] = item
+            else:
+                key = deserialize(request['DeleteRequest']['Key'])
+                self.items.pop((key['workloadId'], key['summaryKey']), None)
+        return {'UnprocessedItems': {}}
+
+    def query(self, ExpressionAttributeValues, Limit=None, Select=None, **kwargs):
+        self.count_call('query')
+        values = deserialize(ExpressionAttributeValues)
+        items = sorted((item for (workloadId, summaryKey), item in self.items.items() if workloadId == values[':w'] and summaryKey.startswith(values[':p'])), key=lambda item: item['summaryKey'])
+        if Limit != None:
+            items = items[:Limit]
+        if Select == 'COUNT':
+            return {'Count': len(items)}
+        return {'Items': [serialize(item) for item in items]}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None, **kwargs):
+        self.count_call('update_item')
+        key = deserialize(Key)
+        values = deserialize(ExpressionAttributeValues)
+        item = self.items.setdefault((key['workloadId'], key['summaryKey']), dict(key))
+        if ConditionExpression and 'lastUpdateDate' in item and item['lastUpdateDate'] >= values[':d']:
+            raise ConditionalCheckFailedException()
+        set_clause, _, remove_clause = UpdateExpression.partition(' REMOVE ')
+        for attribute, value in re.findall(r'(\w+) = (:\w+)', set_clause):
+            item[attribute] = values[value]
+        for attribute in filter(None, remove_clause.split(', ')):
+            item.pop(attribute, None)
+        return {}
+
+# Function to build the stream records of the synthetic ticket history, in the order of the changes
+def build_stream_records(workload_count, ticket_count, resolution_ratio):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    changes = []
+    for i in range(ticket_count):
+        created = start + timedelta(minutes=random.randint(0, 100000))
+        ticket = {
+            'ticketHeaderKey': format(i, '032x'),
+            'creationDate': created.isoformat(),
+            'updateDate': '',
+            'ticketId': 'oi-' + format(i, '012x'),
+            'ticketType': random.choice(['opscenter', 'jira']),
+            'workloadId': 'workload' + str(random.randrange(workload_count)),
+            'workloadName': 'Workload',
+            'pillarId': random.choice(PILLARS),
+            'bestPracticeId': 'bp' + str(random.randrange(20))
+        }
+        changes.append((created, 'INSERT', None, ticket))
+        if random.random() < 0.5:
+            updated = dict(ticket, updateDate=(created + timedelta(minutes=random.randint(1, 5000))).isoformat())
+            changes.append((datetime.fromisoformat(updated['updateDate']), 'MODIFY', ticket, updated))
+            ticket = updated
+        if random.random() < resolution_ratio:
+            resolved = max(created, datetime.fromisoformat(ticket['updateDate'] or ticket['creationDate'])) + timedelta(minutes=random.randint(1, 5000))
+            changes.append((resolved, 'REMOVE', ticket, None))
+        # State entries written next to the tickets
+        counter = {'ticketHeaderKey': 'opentickets#' + ticket['workloadId'] + '#wellarchitected#q#' + ticket['bestPracticeId'], 'creationDate': 'state', 'openTickets': 1}
+        changes.append((created, 'MODIFY', counter, counter))
+
+    records = []
+    for sequence_number, (changed, event_name, old_image, new_image) in enumerate(sorted(changes, key=lambda change: change[0])):
+        stream_record = {'ApproximateCreationDateTime': changed.timestamp(), 'SequenceNumber': str(100000000 + sequence_number)}
+        if old_image:
+            stream_record['OldImage'] = serialize(old_image)
+        if new_image:
+            stream_record['NewImage'] = serialize(new_image)
+        records.append({'eventName': event_name, 'dynamodb': stream_record})
+    return records
+
+# Function to return the expected summaries (open tickets, oldest creationDate) from the tickets left open
+def build_expected_summaries(records):
+    open_tickets = {}
+    for record in records:
+        image = record['dynamodb'].get('NewImage') or record['dynamodb']['OldImage']
+        ticket = deserialize(image)
+        if 'ticketType' not in ticket:
+            continue
+        if record['eventName'] == 'REMOVE':
+            open_tickets.pop(ticket['ticketHeaderKey'], None)
+        else:
+            open_tickets[ticket['ticketHeaderKey']] = ticket
+
+    expected = {}
+    for ticket in open_tickets.values():
+        for summaryKey in ['summary', 'summary#' + ticket['pillarId']]:
+            summary = expected.setdefault((ticket['workloadId'], summaryKey), {'openTickets': 0, 'oldestCreationDate': ticket['creationDate']})
+            summary['openTickets'] += 1
+            summary['oldestCreationDate'] = min(summary['oldestCreationDate'], ticket['creationDate'])
+    return expected
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay of synthetic TicketStateTable stream records through lambda-status-aggregator')
+    parser.add_argument('--workloads', type=int, default=3)
+    parser.add_argument('--tickets', type=int, default=200)
+    parser.add_argument('--resolution-ratio', type=float, default=0.6, help='share of the tickets resolved during the replay')
+    parser.add_argument('--batch-size', type=int, default=100, help='stream records per invocation')
+    parser.add_argument('--redelivery-ratio', type=float, default=0.2, help='share of the batches delivered twice')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    aggregator = load_handler_module('LambdaStatusAggregator', 'lambda-status-aggregator.py')
+    table = FakeStatusTable()
+    aggregator.aws_clients['dynamodb'] = table
+
+    records = build_stream_records(args.workloads, args.tickets, args.resolution_ratio)
+    batches = [records[i:i + args.batch_size] for i in range(0, len(records), args.batch_size)]
+    start = time.perf_counter()
+    invocations = 0
+    for batch in batches:
+        for _ in range(2 if random.random() < args.redelivery_ratio else 1):
+            response = aggregator.lambda_handler({'Records': batch}, None)
+            invocations += 1
+            if response['batchItemFailures']:
+                raise SystemExit(f'Batch reported failures: {response["batchItemFailures"]}')
+    elapsed = time.perf_counter() - start
+    print(f'{len(records)} stream records replayed in {invocations} invocations in {elapsed * 1000:.1f} ms, status table calls: {table.calls}')
+
+    expected = build_expected_summaries(records)
+    summaries = {key: item for key, item in table.items.items() if key[1].startswith('summary')}
+    mismatches = 0
+    for key in sorted(set(expected) | set(summaries)):
+        summary = summaries.get(key, {})
+        wanted = expected.get(key, {'openTickets': 0, 'oldestCreationDate': None})
+        if summary.get('openTickets', 0) != wanted['openTickets'] or summary.get('oldestCreationDate') != wanted['oldestCreationDate']:
+            mismatches += 1
+            print(f'MISMATCH {key}: expected {wanted}, got {summary}')
+    for workloadId, summaryKey in sorted(key for key in summaries if key[1] == 'summary'):
+        summary = summaries[(workloadId, summaryKey)]
+        print(f'{workloadId}: {summary["openTickets"]} open tickets, oldest created {summary.get("oldestCreationDate")}, last update {summary.get("lastUpdateDate")}')
+    if mismatches:
+        raise SystemExit(f'{mismatches} summaries do not match the replayed tickets')
+    print(f'{len(summaries)} summaries match the replayed tickets')
+
+if __name__ == '__main__':
+    main()